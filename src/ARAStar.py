@@ -0,0 +1,266 @@
+import heapq
+import threading
+import time
+import numpy as np
+from PathFinderBase import PathFinderBase
+from compact_path import Path
+from heuristics import TerrainHeuristic
+from sensors import Sensor
+
+
+class ARAStar(PathFinderBase):
+    '''
+    Anytime Repairing A* (ARA*) with a wall-clock budget.
+
+    A first path is found quickly with the heuristic inflated by epsilon,
+    then epsilon is lowered step by step and the path repaired, reusing
+    the search effort of the previous pass, until epsilon reaches 1 (the
+    path is optimal), the time budget runs out or cancel() is called.
+    find_path always returns the best path found so far. The budget only
+    cuts the improvement passes short: the first pass runs until it has a
+    path (or cancel() is called), so None still means there is no path.
+
+    The current solution can be read at any time, also from another
+    thread while find_path runs, with solution().
+
+    Inflating the straight-line distance hardly focuses the search, since
+    it ignores the elevation terms of the cost, so the elevation-aware
+    TerrainHeuristic is the default here.
+
+    The search runs on cost planes over a window around start and goal.
+    Moves leaving the window are included in the suboptimality bound, and
+    the window is doubled when a path outside it could still be cheaper.
+
+    Fields:
+    - initial_epsilon (float): Inflation of the first pass
+    - epsilon_step (float): Amount epsilon is lowered by after each pass
+    - time_budget (float): Seconds find_path may take, None for no limit
+    - epsilon (float): Inflation of the pass currently running
+    - best_path (Path): Cheapest path found so far, None before the first one
+    - best_cost (float): Cost of best_path
+    - bound (float): best_cost is at most bound times the optimal cost
+    '''
+
+    EPSILON = 3.0
+    EPSILON_STEP = 0.5
+    TIME_BUDGET = 5.0
+    # Expansions between two looks at the clock
+    CHECK_INTERVAL = 256
+
+    def __init__(self, test_mode, test_map=None, storage="memmap",
+                 epsilon=EPSILON, epsilon_step=EPSILON_STEP, time_budget=TIME_BUDGET):
+        super().__init__(test_mode, test_map=test_map, storage=storage)
+        if epsilon < 1.0:
+            raise ValueError(f"epsilon must be at least 1.0, got {epsilon}")
+        self.initial_epsilon = epsilon
+        self.epsilon_step = epsilon_step
+        self.time_budget = time_budget
+        self.set_heuristic(TerrainHeuristic())
+
+        self.epsilon = epsilon
+        self.best_path = None
+        self.best_cost = float('inf')
+        self.bound = float('inf')
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._exit_bound = float('inf')
+
+    def cancel(self):
+        """Stop the running find_path, which then returns the best path so far"""
+        self._cancelled.set()
+
+    def solution(self):
+        """(best path so far, its suboptimality bound), safe to call while find_path runs"""
+        with self._lock:
+            return self.best_path, self.bound
+
+    def _publish(self, path, cost, bound):
+        with self._lock:
+            if path is not None:
+                self.best_path = path
+                self.best_cost = cost
+            self.bound = bound
+
+    def _stopped(self, deadline):
+        if self._cancelled.is_set():
+            return True
+        if self.best_path is None:
+            return False  # the budget only limits improving a path
+        return deadline is not None and time.monotonic() >= deadline
+
+    def find_path(self, start, goal, max_iterations=None, time_budget=None):
+        """
+        Find a path between start and goal, improving it until the budget runs out
+
+        Args:
+        start (tuple): Starting coordinates (row, col)
+        goal (tuple): Goal coordinates (row, col)
+        max_iterations (int, optional): Maximum number of node expansions
+        time_budget (float, optional): Seconds to spend, defaults to self.time_budget
+
+        Returns:
+        Path: Best path from start to goal found in time, or None if none was found
+        """
+        start, goal = tuple(start), tuple(goal)
+        self._cancelled.clear()
+        budget = self.time_budget if time_budget is None else time_budget
+        deadline = None if budget is None else time.monotonic() + budget
+        with self._lock:
+            self.epsilon = self.initial_epsilon
+            self.best_path = None
+            self.best_cost = float('inf')
+            self.bound = float('inf')
+        self.expanded = 0
+
+        self._prepare_query(start, goal)
+        if not self.is_reachable(start, goal):
+            return None
+        if start == goal:
+            self._publish(Path(start), 0.0, 1.0)
+            return self.best_path
+
+        rows, cols = self.elevation_map.shape
+        span = max(abs(start[0] - goal[0]), abs(start[1] - goal[1]))
+        margin = max(PathFinderBase.WINDOW_MARGIN, span // 2)
+        epsilon = self.initial_epsilon
+        while True:
+            window = self._search_window(start, goal, margin)
+            finished, epsilon = self._search_in_window(start, goal, window, epsilon, deadline, max_iterations)
+            if not finished:
+                break
+            if self._exit_bound >= self.best_cost or window == (0, rows, 0, cols):
+                break
+            # a path leaving the window could still be cheaper
+            margin *= 2
+        return self.best_path
+
+    def _search_in_window(self, start, goal, window, epsilon, deadline, max_iterations):
+        """
+        Run ARA* passes inside one window.
+
+        Returns:
+        (bool, float): Whether the passes ran to completion (epsilon 1, or no
+        path inside the window) rather than being stopped, and the epsilon reached
+        """
+        row0, row1, col0, col1 = window
+        height, width = row1 - row0, col1 - col0
+        size = height * width
+        inf = float('inf')
+
+        costs = memoryview(self.sensor.cost_planes(*window).reshape(-1))
+        g_score = memoryview(np.full(size, inf, dtype=np.float64))
+        parent = memoryview(np.full(size, -1, dtype=np.int8))
+        closed_array = np.zeros(size, dtype=bool)
+        closed = memoryview(closed_array)
+        in_open_array = np.zeros(size, dtype=bool)
+        in_open = memoryview(in_open_array)
+        # heuristic values are computed once per cell, -1 marks not computed yet
+        h_values = memoryview(np.full(size, -1.0, dtype=np.float64))
+        moves = [
+            (k * size, d_row, d_col, d_row * width + d_col, k)
+            for k, (d_row, d_col) in enumerate(Sensor.NEIGHBOR_OFFSETS)
+        ]
+
+        def h(index):
+            value = h_values[index]
+            if value < 0.0:
+                row, col = divmod(index, width)
+                value = h_values[index] = self.lower_bound((row + row0, col + col0), goal)
+            return value
+
+        start_idx = (start[0] - row0) * width + (start[1] - col0)
+        goal_idx = (goal[0] - row0) * width + (goal[1] - col0)
+        g_score[start_idx] = 0.0
+        in_open[start_idx] = True
+        open_set = [(epsilon * h(start_idx), start_idx)]
+        inconsistent = set()
+        self._exit_bound = inf
+
+        while True:
+            self.epsilon = epsilon
+            # ImprovePath: expand while some open node could still improve the goal
+            while open_set:
+                key, curr = open_set[0]
+                if not in_open[curr] or key != g_score[curr] + epsilon * h(curr):
+                    heapq.heappop(open_set)  # stale entry
+                    continue
+                if g_score[goal_idx] <= key:
+                    break
+                heapq.heappop(open_set)
+                in_open[curr] = False
+                closed[curr] = True
+
+                self.expanded += 1
+                if max_iterations is not None and self.expanded > max_iterations:
+                    return False, epsilon
+                if self.expanded % ARAStar.CHECK_INTERVAL == 0 and self._stopped(deadline):
+                    return False, epsilon
+
+                local_row, local_col = divmod(curr, width)
+                g_curr = g_score[curr]
+                for plane, d_row, d_col, step, code in moves:
+                    cost = costs[plane + curr]
+                    if cost == inf:
+                        continue
+                    n_row = local_row + d_row
+                    n_col = local_col + d_col
+                    if not (0 <= n_row < height and 0 <= n_col < width):
+                        bound = g_curr + cost + self.lower_bound((n_row + row0, n_col + col0), goal)
+                        if bound < self._exit_bound:
+                            self._exit_bound = bound
+                        continue
+
+                    neighbor = curr + step
+                    tentative_g_score = g_curr + cost
+                    if tentative_g_score < g_score[neighbor]:
+                        g_score[neighbor] = tentative_g_score
+                        parent[neighbor] = code
+                        if closed[neighbor]:
+                            inconsistent.add(neighbor)
+                        else:
+                            in_open[neighbor] = True
+                            heapq.heappush(open_set, (tentative_g_score + epsilon * h(neighbor), neighbor))
+
+            goal_cost = g_score[goal_idx]
+            if goal_cost == inf:
+                # nothing inside this window, let the caller grow it
+                return True, epsilon
+
+            # any cheaper path runs through an open or inconsistent node, or leaves the window
+            lowest = self._exit_bound
+            for index in np.flatnonzero(in_open_array).tolist() + list(inconsistent):
+                lowest = min(lowest, g_score[index] + h(index))
+            bound = 1.0 if lowest >= goal_cost else min(epsilon, goal_cost / lowest)
+
+            path = None
+            if goal_cost < self.best_cost:
+                path = self._reconstruct_window(parent, start_idx, goal_idx, width, row0, col0)
+            self._publish(path, goal_cost, bound)
+
+            if epsilon <= 1.0:
+                return True, epsilon
+            if self._stopped(deadline):
+                return False, epsilon
+
+            # lower epsilon and move the inconsistent nodes back to OPEN
+            epsilon = max(1.0, epsilon - self.epsilon_step)
+            for index in inconsistent:
+                in_open[index] = True
+            inconsistent.clear()
+            closed_array.fill(False)
+            open_set = [
+                (g_score[index] + epsilon * h(index), index)
+                for index in np.flatnonzero(in_open_array).tolist()
+            ]
+            heapq.heapify(open_set)
+
+    def _reconstruct_window(self, parent, start_idx, index, width, row0, col0):
+        # parents are direction codes of the move into each cell, see compact_path
+        steps = [d_row * width + d_col for d_row, d_col in Sensor.NEIGHBOR_OFFSETS]
+        codes = []
+        while index != start_idx:
+            code = parent[index]
+            codes.append(code)
+            index -= steps[code]
+        row, col = divmod(start_idx, width)
+        return Path((row + row0, col + col0), codes[::-1])
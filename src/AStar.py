@@ -4,8 +4,8 @@ import transformations
 from PathFinderBase import PathFinderBase
 
 class AStar(PathFinderBase):
-    def __init__(self, test_mode, test_map=None):
-        super().__init__(test_mode,test_map=test_map)
+    def __init__(self, test_mode, test_map=None, engine="dict", storage="memmap"):
+        super().__init__(test_mode,test_map=test_map, engine=engine, storage=storage)
         
     def find_path(self, start, goal, max_iterations=None):
         """
@@ -17,13 +17,23 @@ class AStar(PathFinderBase):
         max_iterations (int, optional): Maximum number of iterations to prevent infinite loops
         
         Returns:
-        list: Path from start to goal, or None if no path found
+        Path: Path from start to goal, or None if no path found
         """
         start_row, start_col = start
         end_row, end_col = goal
         #print("start row,col= ",(start_row,start_col))
+        self._prepare_query(start, goal)
+        if not self.is_reachable(start, goal):
+            return None
         def heuristic(x1, y1, x2, y2):
-            return ((x1-x2)**2 + (y1-y2)**2)**0.5
+            return self.estimate((x1, y1), (x2, y2))
+
+        if self.engine == "array":
+            return self._array_search(
+                (start_row, start_col), (end_row, end_col),
+                lambda r, c: heuristic(r, c, end_row, end_col),
+                max_iterations=max_iterations
+            )
 
         open_set = []
         heapq.heappush(open_set, (0, (start_row, start_col)))
@@ -35,6 +45,7 @@ class AStar(PathFinderBase):
         
         # Track iterations
         iterations = 0
+        self.expanded = 0
         
         while open_set:
             # Check iteration limit if specified
@@ -46,18 +57,18 @@ class AStar(PathFinderBase):
             _, curr = heapq.heappop(open_set)
             
             if curr == (end_row, end_col):
-                return self._reconstruct_path(path_history, curr)
+                return self._reconstruct_coded(path_history, curr)
+            self.expanded += 1
             
             cur_x, cur_y = curr
-            neighbors = self.get_neighbors(cur_y, cur_x)
             
-            for neighbor in neighbors:
+            for neighbor, cost in self.expand(cur_x, cur_y):
                 neighbor_x, neighbor_y = neighbor
                 
-                tentative_g_score = g_score[curr] + self.get_cost(cur_y, cur_x, neighbor[1], neighbor[0])
+                tentative_g_score = g_score[curr] + cost
                 
                 if neighbor not in g_score or tentative_g_score < g_score[neighbor]:
-                    path_history[neighbor] = curr
+                    path_history[neighbor] = self._direction_code(curr, neighbor)
                     g_score[neighbor] = tentative_g_score  
                     f_score[neighbor] = tentative_g_score + heuristic(neighbor_x, neighbor_y, end_row, end_col)
                     heapq.heappush(open_set, (f_score[neighbor], neighbor))
@@ -0,0 +1,217 @@
+import heapq
+import numpy as np
+from compact_path import Path
+from sensors import Sensor
+
+
+class ArrayEngine:
+    """
+    Best-first search over a rectangular window of the elevation map.
+
+    Cells are addressed by a flat integer id local to the window
+    (row-major), and g-scores, parents and the closed set live in
+    preallocated NumPy arrays sized to the window instead of dicts
+    keyed by (row, col) tuples. A parent is the direction code of the
+    move into the cell (compact_path), one byte per cell. Movement costs
+    are read from the sensor's precomputed cost planes rather than
+    recomputed per move. The planes are float64, like get_cost, so paths
+    are optimal for exactly the costs the dict-based engines use.
+
+    Fields:
+    - sensor (Sensor): Source of movement costs
+    - costs (ndarray): Cost planes of the window, shape (8, rows, cols)
+    - window (tuple): Global (row_start, row_stop, col_start, col_stop), stop exclusive
+    - expanded (int): Number of nodes expanded by the last search
+    - exit_bound (float): Lowest f-value of any move that left the window
+    - cost (float): Cost of the last path found
+    - truncated (bool): Whether the last search stopped at max_iterations
+    """
+
+    def __init__(self, sensor, window):
+        self.sensor = sensor
+        self.window = window
+        self.row0, self.row1, self.col0, self.col1 = window
+        self.height = self.row1 - self.row0
+        self.width = self.col1 - self.col0
+
+        self.costs = sensor.cost_planes(*window, dtype=np.float64)
+
+        size = self.height * self.width
+        self.g_score = np.full(size, np.inf, dtype=np.float64)
+        self.parent = np.full(size, -1, dtype=np.int8)
+        self.closed = np.zeros(size, dtype=bool)
+
+        self.expanded = 0
+        self.exit_bound = float('inf')
+        self.cost = float('inf')
+        self.truncated = False
+
+    def reset(self):
+        """Clear the search state so the buffers can be reused for a new query"""
+        self.g_score.fill(np.inf)
+        self.parent.fill(-1)
+        self.closed.fill(False)
+        self.expanded = 0
+        self.exit_bound = float('inf')
+        self.cost = float('inf')
+        self.truncated = False
+
+    def restrict(self, mask):
+        """
+        Forbid every move into a cell outside mask.
+
+        Args:
+        mask (ndarray): Boolean array with the window's shape, True where the search may go
+
+        Moves leaving the window are forbidden as well, so a restricted
+        search never reports an exit.
+        """
+        padded = np.zeros((self.height + 2, self.width + 2), dtype=bool)
+        padded[1:-1, 1:-1] = mask
+        for k, (d_row, d_col) in enumerate(Sensor.NEIGHBOR_OFFSETS):
+            target = padded[1 + d_row:self.height + 1 + d_row, 1 + d_col:self.width + 1 + d_col]
+            self.costs[k][~target] = np.inf
+
+    def contains(self, row, col):
+        return self.row0 <= row < self.row1 and self.col0 <= col < self.col1
+
+    def to_index(self, row, col):
+        return (row - self.row0) * self.width + (col - self.col0)
+
+    def to_cell(self, index):
+        row, col = divmod(index, self.width)
+        return (row + self.row0, col + self.col0)
+
+    def search(self, start, goal, heuristic, max_iterations=None, queue=None):
+        """
+        Run A* from start to goal inside the window
+
+        Args:
+        start (tuple): Starting cell (row, col) in global coordinates
+        goal (tuple): Goal cell (row, col) in global coordinates
+        heuristic (callable): heuristic(row, col) -> lower bound of the cost to goal
+        max_iterations (int, optional): Maximum number of node expansions
+        queue (BucketQueue, optional): Open set to use instead of a heapq list, cleared first
+
+        Returns:
+        Path: Path from start to goal, or None if no path found
+        """
+        if not (self.contains(*start) and self.contains(*goal)):
+            raise ValueError("start and goal must lie inside the search window")
+
+        # memoryviews give plain Python scalars on access, which is much
+        # cheaper than going through NumPy scalar indexing in the hot loop
+        g_score = memoryview(self.g_score)
+        parent = memoryview(self.parent)
+        closed = memoryview(self.closed)
+        costs = memoryview(self.costs.reshape(-1))
+
+        row0, col0 = self.row0, self.col0
+        height, width = self.height, self.width
+        size = height * width
+        # (plane offset, row step, col step, flat index step, direction code) per direction
+        moves = [
+            (k * size, d_row, d_col, d_row * width + d_col, k)
+            for k, (d_row, d_col) in enumerate(Sensor.NEIGHBOR_OFFSETS)
+        ]
+        inf = float('inf')
+
+        start_idx = self.to_index(*start)
+        goal_idx = self.to_index(*goal)
+        g_score[start_idx] = 0.0
+        start_h = heuristic(*start)
+        if start_h == inf:
+            return None  # the bound is admissible, so no path leaves start
+
+        # The open set is either a heapq list of (f, index) pairs or, with a
+        # BucketQueue, its ring of bucket lists of bare indices, manipulated
+        # inline here since a method call per push would eat the gain
+        bucketed = queue is not None
+        if bucketed:
+            queue.clear()
+            buckets, mask, scale = queue.buckets, queue.mask, queue.scale
+            current = int(start_h * scale)
+            buckets[current & mask].append(start_idx)
+            queued = 1
+        else:
+            open_set = [(start_h, start_idx)]
+            queued = 1
+        iterations = 0
+
+        while queued:
+            if bucketed:
+                bucket = buckets[current & mask]
+                while not bucket:
+                    current += 1
+                    bucket = buckets[current & mask]
+                curr = bucket.pop()
+                queued -= 1
+            else:
+                _, curr = heapq.heappop(open_set)
+                queued = len(open_set)
+            if closed[curr]:
+                continue  # stale entry, a cheaper copy was already expanded
+
+            if max_iterations is not None:
+                iterations += 1
+                if iterations > max_iterations:
+                    self.truncated = True
+                    return None
+
+            if curr == goal_idx:
+                self.cost = g_score[curr]
+                return self._reconstruct(start_idx, goal_idx)
+
+            closed[curr] = True
+            self.expanded += 1
+
+            local_row, local_col = divmod(curr, width)
+            g_curr = g_score[curr]
+
+            for plane, d_row, d_col, step, code in moves:
+                cost = costs[plane + curr]
+                if cost == inf:
+                    continue
+
+                n_row = local_row + d_row
+                n_col = local_col + d_col
+                if not (0 <= n_row < height and 0 <= n_col < width):
+                    # Remember the cheapest way out so the caller can tell
+                    # whether a larger window could hold a better path
+                    bound = g_curr + cost + heuristic(n_row + row0, n_col + col0)
+                    if bound < self.exit_bound:
+                        self.exit_bound = bound
+                    continue
+
+                neighbor = curr + step
+                tentative_g_score = g_curr + cost
+                if tentative_g_score < g_score[neighbor]:
+                    g_score[neighbor] = tentative_g_score
+                    parent[neighbor] = code
+                    closed[neighbor] = False
+                    f_score = tentative_g_score + heuristic(n_row + row0, n_col + col0)
+                    if not bucketed:
+                        heapq.heappush(open_set, (f_score, neighbor))
+                        queued += 1
+                    elif f_score < inf:
+                        key = int(f_score * scale)
+                        if key < current:
+                            key = current  # monotone queue, see bucket_queue
+                        elif key - current > mask:
+                            queue.current, queue.size = current, queued
+                            queue.grow(key)
+                            buckets, mask = queue.buckets, queue.mask
+                        buckets[key & mask].append(neighbor)
+                        queued += 1
+
+        return None  # No path found
+
+    def _reconstruct(self, start_idx, index):
+        parent = memoryview(self.parent)
+        steps = [d_row * self.width + d_col for d_row, d_col in Sensor.NEIGHBOR_OFFSETS]
+        codes = []
+        while index != start_idx:
+            code = parent[index]
+            codes.append(code)
+            index -= steps[code]
+        return Path(self.to_cell(start_idx), codes[::-1])
@@ -1,9 +1,19 @@
 import heapq
+import numpy as np
 from PathFinderBase import PathFinderBase
+from compact_path import Path
 
 class BidirectionalAStar(PathFinderBase):
-    def __init__(self, test_mode, test_map=None):
-        super().__init__(test_mode, test_map=test_map)
+    '''
+    Bidirectional A* in the NBA* (New Bidirectional A*) formulation.
+
+    Fields:
+    - best_path_cost (float): Cost of the best path found by the last query
+    - meeting_point (tuple): Cell where the two searches met on that path
+    '''
+
+    def __init__(self, test_mode, test_map=None, storage="memmap"):
+        super().__init__(test_mode, test_map=test_map, storage=storage)
 
     def _init_search(self):
         # Initialize data structures for both forward and backward searches
@@ -11,121 +21,119 @@ class BidirectionalAStar(PathFinderBase):
             'open_set': [],
             'g_score': {},
             'f_score': {},
-            'path_history': {}
+            'path_history': {},
+            'closed': set()
         }
 
     def heuristic(self, x1, y1, x2, y2):
-        return ((x1-x2)**2 + (y1-y2)**2)**0.5
+        return self.estimate((x1, y1), (x2, y2))
 
     def find_path(self, start, goal,max_iterations=None,call_from_gaussian=False):
-        if not call_from_gaussian:
-            start_row, start_col = start
-            end_row, end_col = goal
-        else:
-            #already in row col form
-            start_row, start_col=start
-            end_row, end_col=goal
-        #print("start row,col= ",(start_row,start_col))
-        # Initialize forward and backward searches
+        """
+        Find a path between start and goal with NBA* (New Bidirectional A*)
+
+        Both searches share the best path cost found so far. A popped node is
+        rejected without expansion when its own f-value, or its g-value plus
+        the opposite search's lowest f-value minus its heuristic towards the
+        opposite end, already reaches that cost: no path through it can be
+        cheaper. The search stops when either open set runs empty, and the
+        best meeting point then gives an optimal path for any consistent
+        heuristic.
+
+        Args:
+        start (tuple): Starting coordinates (row, col)
+        goal (tuple): Goal coordinates (row, col)
+        max_iterations (int, optional): Maximum number of node expansions
+        call_from_gaussian (bool): Kept for MultiResolutionPathFinder, coordinates are (row, col) either way
+
+        Returns:
+        Path: Path from start to goal, or None if no path found
+        """
+        start = (start[0], start[1])
+        goal = (goal[0], goal[1])
+        self._prepare_query(start, goal)
+        if not self.is_reachable(start, goal):
+            return None
+        self.expanded = 0
+        if start == goal:
+            return Path(start)
+
         forward = self._init_search()
         backward = self._init_search()
-        
-        # Initialize start node (forward search)
-        heapq.heappush(forward['open_set'], (0, (start_row, start_col)))
-        forward['g_score'][(start_row, start_col)] = 0
-        forward['f_score'][(start_row, start_col)] = self.heuristic(start_row, start_col, end_row, end_col)
-        
-        # Initialize goal node (backward search)
-        heapq.heappush(backward['open_set'], (0, (end_row, end_col)))
-        backward['g_score'][(end_row, end_col)] = 0
-        backward['f_score'][(end_row, end_col)] = self.heuristic(end_row, end_col, start_row, start_col)
-        
-        # Best path cost found so far
-        best_path_cost = float('inf')
-        meeting_point = None
-        
-        while forward['open_set'] and backward['open_set']:
-            # Process forward search
-            if forward['open_set']:
-                meeting_node = self._process_node(
-                    forward, backward,
-                    (end_row, end_col),
-                    'forward',
-                    best_path_cost
-                )
-                if meeting_node:
-                    new_path_cost = forward['g_score'][meeting_node] + backward['g_score'][meeting_node]
-                    if new_path_cost < best_path_cost:
-                        best_path_cost = new_path_cost
-                        meeting_point = meeting_node
-            
-            # Process backward search
-            if backward['open_set']:
-                meeting_node = self._process_node(
-                    backward, forward,
-                    (start_row, start_col),
-                    'backward',
-                    best_path_cost
-                )
-                if meeting_node:
-                    new_path_cost = forward['g_score'][meeting_node] + backward['g_score'][meeting_node]
-                    if new_path_cost < best_path_cost:
-                        best_path_cost = new_path_cost
-                        meeting_point = meeting_node
-            
-            # If we've found a valid path and all remaining paths would be longer
-            min_forward = forward['open_set'][0][0] if forward['open_set'] else float('inf')
-            min_backward = backward['open_set'][0][0] if backward['open_set'] else float('inf')
-            if min_forward + min_backward >= best_path_cost:
-                break
-        
-        if meeting_point is not None:
-            # Reconstruct the complete path
-            forward_path = self._reconstruct_path(forward['path_history'], meeting_point)
-            backward_path = self._reconstruct_path(backward['path_history'], meeting_point)
-            backward_path.pop()  # Remove duplicate meeting point
-            complete_path = forward_path + backward_path[::-1]
-            return complete_path
-            
-        return None
-
-    def _process_node(self, primary_search, opposite_search, target, direction, best_path_cost):
-        if not primary_search['open_set']:
+        for search, origin, target in ((forward, start, goal), (backward, goal, start)):
+            search['g_score'][origin] = 0
+            search['f_score'][origin] = self.heuristic(origin[0], origin[1], target[0], target[1])
+            heapq.heappush(search['open_set'], (search['f_score'][origin], origin))
+
+        self.best_path_cost = float('inf')
+        self.meeting_point = None
+        iterations = 0
+
+        while self._lowest_f(forward) < float('inf') and self._lowest_f(backward) < float('inf'):
+            # alternate between the directions, expanding one node of each per round
+            for primary, opposite, target, origin in (
+                (forward, backward, goal, start),
+                (backward, forward, start, goal),
+            ):
+                if max_iterations is not None:
+                    iterations += 1
+                    if iterations > max_iterations:
+                        return None
+                self._process_node(primary, opposite, target, origin)
+
+        if self.meeting_point is None:
             return None
-            
-        _, current = heapq.heappop(primary_search['open_set'])
-        
-        # Check if we've found a meeting point
-        if current in opposite_search['g_score']:
-            return current
-            
+
+        # Reconstruct the complete path
+        forward_path = self._reconstruct_coded(forward['path_history'], self.meeting_point)
+        backward_path = self._reconstruct_coded(backward['path_history'], self.meeting_point)
+        # the backward half runs from goal to the meeting point, walk it the other way
+        return Path(start, np.concatenate([forward_path.codes(), backward_path.reverse().codes()]))
+
+    def _lowest_f(self, search):
+        """Lowest f-value in the open set, dropping closed and outdated entries on the way"""
+        open_set = search['open_set']
+        while open_set:
+            f_score, node = open_set[0]
+            if node not in search['closed'] and f_score == search['f_score'][node]:
+                return f_score
+            heapq.heappop(open_set)
+        return float('inf')
+
+    def _process_node(self, primary_search, opposite_search, target, origin):
+        if self._lowest_f(primary_search) == float('inf'):
+            return
+
+        f_current, current = heapq.heappop(primary_search['open_set'])
+        primary_search['closed'].add(current)
+        g_current = primary_search['g_score'][current]
+
+        # NBA* rejection: no path through current can beat the best one found
+        if f_current >= self.best_path_cost or \
+                g_current + self._lowest_f(opposite_search) - self.heuristic(current[0], current[1], origin[0], origin[1]) \
+                >= self.best_path_cost:
+            return
+
+        self.expanded += 1
         cur_x, cur_y = current
-        neighbors = self.get_neighbors(cur_y, cur_x)
-        
-        for neighbor in neighbors:
+        # movement costs are symmetric, so the backward search, which walks
+        # moves in reverse, can use the same costs as the forward one
+        for neighbor, cost in self.expand(cur_x, cur_y):
+            if neighbor in primary_search['closed']:
+                continue
             neighbor_x, neighbor_y = neighbor
-            
-            tentative_g_score = primary_search['g_score'][current] + \
-                                self.get_cost(cur_y, cur_x, neighbor[1], neighbor[0])
-            
-            if neighbor not in primary_search['g_score'] or \
-                tentative_g_score < primary_search['g_score'][neighbor]:
-                
-                # Update the path
-                primary_search['path_history'][neighbor] = current
+            tentative_g_score = g_current + cost
+
+            if tentative_g_score < primary_search['g_score'].get(neighbor, float('inf')):
+                primary_search['path_history'][neighbor] = self._direction_code(current, neighbor)
                 primary_search['g_score'][neighbor] = tentative_g_score
-                
-                # Calculate f_score based on direction
-                if direction == 'forward':
-                    h_score = self.heuristic(neighbor_x, neighbor_y, target[0], target[1])
-                else:
-                    h_score = self.heuristic(neighbor_x, neighbor_y, target[0], target[1])
-                
-                f_score = tentative_g_score + h_score
+                f_score = tentative_g_score + self.heuristic(neighbor_x, neighbor_y, target[0], target[1])
                 primary_search['f_score'][neighbor] = f_score
-                
-                # Only add to open set if the path could potentially be better than best found
-                if f_score < best_path_cost:
-                    heapq.heappush(primary_search['open_set'], (f_score, neighbor))
-        
-        return None
\ No newline at end of file
+                heapq.heappush(primary_search['open_set'], (f_score, neighbor))
+
+                # Check if we've found a better meeting point
+                if neighbor in opposite_search['g_score']:
+                    path_cost = tentative_g_score + opposite_search['g_score'][neighbor]
+                    if path_cost < self.best_path_cost:
+                        self.best_path_cost = path_cost
+                        self.meeting_point = neighbor
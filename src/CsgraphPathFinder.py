@@ -0,0 +1,204 @@
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
+from PathFinderBase import PathFinderBase
+from compact_path import Path
+from sensors import Sensor
+
+
+class CsgraphPathFinder(PathFinderBase):
+    '''
+    Shortest paths with scipy.sparse.csgraph.dijkstra on DEM windows.
+
+    The 8-neighbour cost planes of a window around the query are turned
+    into a CSR adjacency matrix (Sensor.cost_graph) and searched in
+    compiled code. One Dijkstra run answers a single source and any
+    number of targets, and its predecessor array is exposed as well.
+
+    Windows are picked automatically: they start at the bounding box of
+    the query plus a margin and are doubled while a path leaving them could
+    still be cheaper, but never beyond max_cells cells, which bounds the
+    memory of the graph. A query whose bounding box alone exceeds the cap
+    falls back to the ArrayEngine search, which needs a fraction of the
+    memory per cell and is capped at max_array_cells the same way. Queries
+    too large for that as well are not searched and get None; planners
+    built on the cost pyramid, like MultiResolutionPathFinder, answer them.
+
+    Fields:
+    - max_cells (int): Largest window, in cells, turned into a graph
+    - max_array_cells (int): Largest window, in cells, of the ArrayEngine fallback
+    - last_window (tuple): Window (row_start, row_stop, col_start, col_stop) of the last query
+    '''
+
+    # About 8 edges of 12 bytes per cell, so ~400 MB of graph at most
+    MAX_CELLS = 4_000_000
+    # ArrayEngine holds ~74 bytes per cell (cost planes, g-scores, parents), so ~740 MB at most
+    MAX_ARRAY_CELLS = 10_000_000
+
+    def __init__(self, test_mode, test_map=None, storage="memmap", max_cells=MAX_CELLS,
+                 max_array_cells=MAX_ARRAY_CELLS):
+        super().__init__(test_mode, test_map=test_map, storage=storage)
+        self.max_cells = max_cells
+        self.max_array_cells = max_array_cells
+        self.last_window = None
+
+    def _bounding_window(self, cells, margin):
+        rows = [cell[0] for cell in cells]
+        cols = [cell[1] for cell in cells]
+        return self._search_window((min(rows), min(cols)), (max(rows), max(cols)), margin)
+
+    def shortest_path_tree(self, source, window):
+        """
+        Run Dijkstra from source over one window.
+
+        Args:
+        source (tuple): Source cell (row, col), inside window
+        window (tuple): Global (row_start, row_stop, col_start, col_stop)
+
+        Returns:
+        (ndarray, ndarray, ndarray): Costs from source and predecessor flat indices
+        (-9999 for none), both of the window's shape, and the window's cost planes
+        """
+        row_start, row_stop, col_start, col_stop = window
+        width = col_stop - col_start
+        planes = self.sensor.cost_planes(*window, dtype=np.float64)
+        graph = self.sensor.cost_graph(*window, planes=planes)
+        source_idx = (source[0] - row_start) * width + (source[1] - col_start)
+        distances, predecessors = dijkstra(graph, directed=True, indices=source_idx, return_predecessors=True)
+        shape = planes.shape[1:]
+        return distances.reshape(shape), predecessors.reshape(shape), planes
+
+    def _exit_bound(self, distances, planes, window, goal):
+        """Lowest cost estimate of a path to goal through a move leaving window"""
+        row_start, row_stop, col_start, col_stop = window
+        height, width = distances.shape
+        bound = float('inf')
+        for k, (d_row, d_col) in enumerate(Sensor.NEIGHBOR_OFFSETS):
+            # cells whose move along this direction leaves the window
+            leaving = np.zeros((height, width), dtype=bool)
+            if d_row:
+                leaving[0 if d_row < 0 else -1, :] = True
+            if d_col:
+                leaving[:, 0 if d_col < 0 else -1] = True
+            costs = distances + planes[k]
+            rows, cols = np.nonzero(leaving & np.isfinite(costs))
+            for row, col in zip(rows.tolist(), cols.tolist()):
+                cell = (row + row_start + d_row, col + col_start + d_col)
+                bound = min(bound, costs[row, col] + self.lower_bound(cell, goal))
+        return bound
+
+    def _path_from(self, predecessors, window, target):
+        row_start, _, col_start, col_stop = window
+        width = col_stop - col_start
+        flat = predecessors.reshape(-1)
+        index = (target[0] - row_start) * width + (target[1] - col_start)
+        path = []
+        while index >= 0:
+            row, col = divmod(int(index), width)
+            path.append((row + row_start, col + col_start))
+            index = flat[index]
+        return Path.from_cells(path[::-1])
+
+    def find_paths(self, start, goals):
+        """
+        Shortest paths from start to each of goals with one Dijkstra run per window
+
+        Goals in another component than start get None without a search.
+        When the bounding box of the other goals exceeds max_cells, they are
+        searched one at a time, as find_path does.
+
+        Args:
+        start (tuple): Starting coordinates (row, col)
+        goals (list): Goal coordinates (row, col)
+
+        Returns:
+        dict: goal -> path from start, or None for goals that cannot be reached
+        """
+        start = tuple(start)
+        goals = [tuple(goal) for goal in goals]
+        paths = {goal: None for goal in goals}
+        if len(goals) == 1:
+            self._prepare_query(start, goals[0])
+        elif goals:
+            cells = [start] + goals
+            self._prepare_query(
+                (min(r for r, _ in cells), min(c for _, c in cells)),
+                (max(r for r, _ in cells), max(c for _, c in cells)),
+            )
+            self.cost_to_go = None  # there is no single goal to run a field from
+        goals = [goal for goal in goals if self.is_reachable(start, goal)]
+        if not goals:
+            return paths
+
+        if self._window_cells(self._bounding_window([start] + goals, 0)) <= self.max_cells:
+            paths.update(self._dijkstra_paths(start, goals))
+        else:
+            for goal in goals:
+                if len(goals) > 1:
+                    self._prepare_query(start, goal)
+                paths[goal] = self._find_one(start, goal)
+        return paths
+
+    def _dijkstra_paths(self, start, goals):
+        """Paths from start to goals in a window of at most max_cells cells holding all of them"""
+        cells = [start] + goals
+        rows, cols = self.elevation_map.shape
+        span = max(max(abs(start[0] - goal[0]), abs(start[1] - goal[1])) for goal in goals)
+        margin = max(PathFinderBase.WINDOW_MARGIN, span // 2)
+        while margin > 0 and self._window_cells(self._bounding_window(cells, margin)) > self.max_cells:
+            margin //= 2
+        window = self._bounding_window(cells, margin)
+
+        while True:
+            distances, predecessors, planes = self.shortest_path_tree(start, window)
+            row_start, _, col_start, _ = window
+            pending = [
+                goal for goal in goals
+                if self._exit_bound(distances, planes, window, goal)
+                < distances[goal[0] - row_start, goal[1] - col_start]
+            ]
+            if not pending or window == (0, rows, 0, cols):
+                break
+            # a path leaving the window could still be cheaper for some goal
+            margin = max(1, 2 * margin)
+            grown = self._bounding_window(cells, margin)
+            if self._window_cells(grown) > self.max_cells:
+                break  # keep memory bounded, the paths are the best within the cap
+            window = grown
+
+        self.last_window = window
+        return {
+            goal: (self._path_from(predecessors, window, goal)
+                   if np.isfinite(distances[goal[0] - row_start, goal[1] - col_start]) else None)
+            for goal in goals
+        }
+
+    def _find_one(self, start, goal, max_iterations=None):
+        """Path from start to goal on a graph, the ArrayEngine fallback or, past both caps, None"""
+        cells = self._window_cells(self._search_window(start, goal, 0))
+        if cells <= self.max_cells:
+            return self._dijkstra_paths(start, [goal])[goal]
+        if cells > self.max_array_cells:
+            return None  # too large to search at full resolution within the memory caps
+        return self._array_search(
+            start, goal, lambda r, c: self.estimate((r, c), goal),
+            max_iterations=max_iterations, max_cells=self.max_array_cells,
+        )
+
+    def find_path(self, start, goal, max_iterations=None):
+        """
+        Find a path between start and goal
+
+        Args:
+        start (tuple): Starting coordinates (row, col)
+        goal (tuple): Goal coordinates (row, col)
+        max_iterations (int, optional): Only used by the ArrayEngine fallback
+
+        Returns:
+        Path: Path from start to goal, or None if no path found or the
+        bounding box of start and goal exceeds max_array_cells
+        """
+        start, goal = tuple(start), tuple(goal)
+        self._prepare_query(start, goal)
+        if not self.is_reachable(start, goal):
+            return None
+        return self._find_one(start, goal, max_iterations)
@@ -0,0 +1,224 @@
+import heapq
+from PathFinderBase import PathFinderBase
+from compact_path import Path
+from sensors import Sensor
+
+
+class DStarLite(PathFinderBase):
+    '''
+    D* Lite incremental planner.
+
+    The search runs backwards from the goal and keeps its g/rhs values and
+    priority queue between calls to find_path. When the rover moves along
+    the path, only the key modifier km changes; when edge costs change
+    (update_edge_costs, block_cells, refresh_cells), only the vertices
+    whose cost-to-goal is affected are repaired. Replanning work is thus
+    proportional to the change, not to the map.
+
+    A call with a different goal starts a new search.
+
+    Fields:
+    - goal (tuple): Goal of the current search state, None before the first call
+    - last_start (tuple): Start at the time km was last updated
+    - km (float): Key modifier accumulated from the start's moves
+    - g_score, rhs (dict): Cost-to-goal estimates and their one-step lookaheads
+    - cost_overrides (dict): (cell, neighbor) -> cost replacing the one from Sensor.expand
+    '''
+
+    def __init__(self, test_mode, test_map=None, storage="memmap"):
+        super().__init__(test_mode, test_map=test_map, storage=storage)
+        self.goal = None
+        self.last_start = None
+        self.km = 0.0
+        self.g_score = {}
+        self.rhs = {}
+        self.cost_overrides = {}
+        # Moves out of each cell seen so far, neighbor -> cost with the overrides
+        # applied, since D* Lite asks for the same moves repeatedly
+        self._costs = {}
+        self._open_set = []
+        self._open_keys = {}
+        self._changed = []
+
+    def _moves(self, cell):
+        moves = self._costs.get(cell)
+        if moves is None:
+            moves = self._costs[cell] = dict(self.expand(*cell))
+            for d_row, d_col in Sensor.NEIGHBOR_OFFSETS:
+                neighbor = (cell[0] + d_row, cell[1] + d_col)
+                cost = self.cost_overrides.get((cell, neighbor))
+                if cost is not None:
+                    moves[neighbor] = cost
+        return moves
+
+    def _neighbors(self, cell):
+        return self._moves(cell).keys()
+
+    def _cost(self, cell, neighbor):
+        return self._moves(cell).get(neighbor, float('inf'))
+
+    def _calculate_key(self, cell):
+        best = min(self.g_score.get(cell, float('inf')), self.rhs.get(cell, float('inf')))
+        return (best + self.lower_bound(self.last_start, cell) + self.km, best)
+
+    def _push(self, cell):
+        key = self._calculate_key(cell)
+        self._open_keys[cell] = key
+        heapq.heappush(self._open_set, (key, cell))
+
+    def _top_key(self):
+        # drop entries that were removed or re-keyed since they were pushed
+        while self._open_set:
+            key, cell = self._open_set[0]
+            if self._open_keys.get(cell) == key:
+                return key
+            heapq.heappop(self._open_set)
+        return (float('inf'), float('inf'))
+
+    def _update_vertex(self, cell):
+        if cell != self.goal:
+            self.rhs[cell] = min(
+                (self._cost(cell, neighbor) + self.g_score.get(neighbor, float('inf'))
+                 for neighbor in self._neighbors(cell)),
+                default=float('inf'),
+            )
+        self._open_keys.pop(cell, None)
+        if self.g_score.get(cell, float('inf')) != self.rhs.get(cell, float('inf')):
+            self._push(cell)
+
+    def _reset(self, start, goal):
+        self.goal = goal
+        self.last_start = start
+        self.km = 0.0
+        self.g_score = {}
+        self.rhs = {goal: 0.0}
+        self._open_set = []
+        self._open_keys = {}
+        self._changed = []
+        self._push(goal)
+
+    def _compute_shortest_path(self, start, max_iterations=None):
+        """Repair g-values until the start is locally consistent. False if max_iterations was hit"""
+        inf = float('inf')
+        iterations = 0
+        while (self._top_key() < self._calculate_key(start)
+               or self.rhs.get(start, inf) != self.g_score.get(start, inf)):
+            if not self._open_set:
+                break
+            if max_iterations is not None:
+                iterations += 1
+                if iterations > max_iterations:
+                    return False
+
+            old_key, cell = heapq.heappop(self._open_set)
+            del self._open_keys[cell]
+            new_key = self._calculate_key(cell)
+            if old_key < new_key:
+                self._push(cell)
+                continue
+
+            self.expanded += 1
+            if self.g_score.get(cell, inf) > self.rhs.get(cell, inf):
+                self.g_score[cell] = self.rhs[cell]
+                for neighbor in self._neighbors(cell):
+                    self._update_vertex(neighbor)
+            else:
+                self.g_score[cell] = inf
+                self._update_vertex(cell)
+                for neighbor in self._neighbors(cell):
+                    self._update_vertex(neighbor)
+        return True
+
+    def update_edge_costs(self, changes):
+        """
+        Change the cost of moves, applied on the next find_path.
+
+        Args:
+        changes (iterable): (cell, neighbor, cost) triples with cells as (row, col).
+                            Movement costs are symmetric, so both directions change.
+        """
+        for cell, neighbor, cost in changes:
+            cell, neighbor = tuple(cell), tuple(neighbor)
+            self.cost_overrides[(cell, neighbor)] = cost
+            self.cost_overrides[(neighbor, cell)] = cost
+            self._costs.pop(cell, None)
+            self._costs.pop(neighbor, None)
+            self._changed += [cell, neighbor]
+
+    def block_cells(self, cells):
+        """Make cells impassable, e.g. obstacles seen by the rover"""
+        self.update_edge_costs(
+            (cell, neighbor, float('inf'))
+            for cell in map(tuple, cells)
+            for neighbor in list(self._neighbors(cell))
+        )
+
+    def refresh_cells(self, cells):
+        """Re-read the costs around cells whose elevation was changed in elevation_map"""
+        cells = [tuple(cell) for cell in cells]
+        self.sensor.refresh_elevations(cells)
+        for cell in cells:
+            self._changed.extend(self._neighbors(cell))
+            for d_row, d_col in Sensor.NEIGHBOR_OFFSETS:
+                neighbor = (cell[0] + d_row, cell[1] + d_col)
+                self.cost_overrides.pop((cell, neighbor), None)
+                self.cost_overrides.pop((neighbor, cell), None)
+                self._costs.pop(neighbor, None)
+            self._costs.pop(cell, None)
+            # moves that were impassable before the change may be open now
+            self._changed.extend(self._neighbors(cell))
+            self._changed.append(cell)
+
+    def has_pending_changes(self):
+        """Whether cost changes are waiting to be repaired by the next find_path"""
+        return bool(self._changed)
+
+    def find_path(self, start, goal, max_iterations=None):
+        """
+        Find a path between start and goal, reusing the previous search for the same goal
+
+        Args:
+        start (tuple): Starting coordinates (row, col), typically the rover's current cell
+        goal (tuple): Goal coordinates (row, col)
+        max_iterations (int, optional): Maximum number of node expansions for this call
+
+        Returns:
+        Path: Path from start to goal, or None if no path found
+        """
+        start, goal = tuple(start), tuple(goal)
+        self._prepare_query(start, goal)
+        # no reachability check: blocked and refreshed cells can change connectivity
+        self.expanded = 0
+
+        if goal != self.goal:
+            self._reset(start, goal)
+        elif start != self.last_start:
+            self.km += self.lower_bound(self.last_start, start)
+            self.last_start = start
+
+        changed, self._changed = self._changed, []
+        for cell in dict.fromkeys(changed):
+            self._update_vertex(cell)
+
+        if not self._compute_shortest_path(start, max_iterations):
+            return None
+        return self._extract_path(start)
+
+    def _extract_path(self, start):
+        inf = float('inf')
+        if self.g_score.get(start, inf) == inf and self.rhs.get(start, inf) == inf:
+            return None
+
+        path = [start]
+        visited = {start}
+        curr = start
+        while curr != self.goal:
+            curr = min(
+                self._neighbors(curr),
+                key=lambda neighbor: self._cost(curr, neighbor) + self.g_score.get(neighbor, inf),
+            )
+            if curr in visited or self.g_score.get(curr, inf) == inf:
+                return None
+            visited.add(curr)
+            path.append(curr)
+        return Path.from_cells(path)
@@ -0,0 +1,334 @@
+import heapq
+import threading
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
+import dem_store
+from ArrayEngine import ArrayEngine
+from PathFinderBase import PathFinderBase
+from compact_path import Path
+from cost_pyramid import STRIP_CELLS
+from sensors import Sensor
+
+
+class HPAStar(PathFinderBase):
+    '''
+    Hierarchical path-finding A* (HPA*).
+
+    The map is split into square clusters. Entrances are found on the
+    borders between neighbouring clusters, and the costs between the
+    entrances of each cluster are precomputed into an abstract graph.
+    A query inserts start and goal into that graph, searches it, and
+    refines every abstract hop with a search inside one cluster.
+
+    Every move between two clusters, diagonal ones included, is matched
+    by a transition (see _transitions), so the abstract graph connects
+    every pair of cells a path connects, and a failed abstract search
+    means there is no path.
+
+    Outside test mode the abstract graph is stored next to the DEM,
+    keyed by cluster size and Sensor.COST_MODEL_VERSION, and loaded
+    instead of rebuilt by later instances. Loading or building it runs on
+    a background thread started by the constructor, so creating the
+    planner, e.g. from the UI, returns at once; the first query waits for it.
+    close() does not wait: it stops a build still running, and the thread
+    releases the DEM when it exits.
+
+    Fields:
+    - cluster_size (int): Edge length of a cluster in cells
+    - abstract_graph (dict): node -> {neighbor: cost}, nodes are (row, col) cells
+    - cluster_nodes (dict): (cluster_row, cluster_col) -> list of entrance cells in that cluster
+    '''
+
+    CLUSTER_SIZE = 32
+    # Entrances at least this wide get a transition at each end instead of one in the middle
+    WIDE_ENTRANCE = 6
+    # Bumped whenever build_abstract_graph changes, so stored graphs are rebuilt
+    GRAPH_VERSION = 2
+
+    def __init__(self, test_mode, test_map=None, cluster_size=CLUSTER_SIZE):
+        super().__init__(test_mode, test_map=test_map)
+        self.cluster_size = cluster_size
+        self._graph = None
+        self._graph_error = None
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._building = True
+        self._release_on_exit = False
+        self._graph_thread = threading.Thread(target=self._load_abstract_graph, daemon=True)
+        self._graph_thread.start()
+
+    def _store_kind(self):
+        return f"hpa{self.cluster_size}"
+
+    def _store_meta(self):
+        return {
+            "cluster_size": self.cluster_size, "graph_version": HPAStar.GRAPH_VERSION,
+            "cost_model_version": Sensor.COST_MODEL_VERSION,
+        }
+
+    def _load_abstract_graph(self):
+        """Load the stored abstract graph, or build and store it; runs on the background thread"""
+        try:
+            graph = None
+            if self.dem is not None:
+                graph = dem_store.load_object(self.dem.path, self._store_kind(), **self._store_meta())
+            if graph is None:
+                graph = self.build_abstract_graph()
+                if graph is None:
+                    raise RuntimeError("HPA* was closed before its abstract graph was built")
+                if self.dem is not None:
+                    dem_store.save_object(self.dem.path, self._store_kind(), graph, **self._store_meta())
+            self._graph = graph
+        except BaseException as error:
+            self._graph_error = error  # raised again by the thread waiting for the graph
+        finally:
+            with self._lock:
+                self._building = False
+                release = self._release_on_exit
+            if release:
+                super().close()
+
+    def _wait_for_graph(self):
+        self._graph_thread.join()
+        if self._graph_error is not None:
+            raise self._graph_error
+        return self._graph
+
+    @property
+    def abstract_graph(self):
+        return self._wait_for_graph()[0]
+
+    @property
+    def cluster_nodes(self):
+        return self._wait_for_graph()[1]
+
+    def close(self):
+        """Stop building the abstract graph and release the shared DEM, once the build has stopped"""
+        self._cancelled.set()
+        with self._lock:
+            if self._building:
+                self._release_on_exit = True
+                return
+        super().close()
+
+    def cluster_of(self, cell):
+        return (cell[0] // self.cluster_size, cell[1] // self.cluster_size)
+
+    def cluster_window(self, cluster):
+        rows, cols = self.elevation_map.shape
+        row_start = cluster[0] * self.cluster_size
+        col_start = cluster[1] * self.cluster_size
+        return (
+            row_start, min(rows, row_start + self.cluster_size),
+            col_start, min(cols, col_start + self.cluster_size),
+        )
+
+    def _transitions(self, along_near, along_far, crossings):
+        """
+        Crossings of one border that become transitions, as (index, shift, cost).
+
+        Cells on one side of the border joined by moves along it form a
+        chain, and any crossing between the same two chains can stand in for
+        another, so one transition per pair of chains keeps the abstract
+        graph complete. Pairs with at least WIDE_ENTRANCE crossings get a
+        transition at each end.
+
+        Args:
+        along_near, along_far (ndarray): Cost of the move from cell k to cell k + 1 along
+        the border, on the near and the far side
+        crossings (dict): shift -> costs of the moves from near cell k to far cell k + shift
+        """
+        near_chain = np.concatenate([[0], np.cumsum(~np.isfinite(along_near))])
+        far_chain = np.concatenate([[0], np.cumsum(~np.isfinite(along_far))])
+        length = len(near_chain)
+        index, shifts, costs = [], [], []
+        for shift, shift_costs in crossings.items():
+            k = np.flatnonzero(np.isfinite(shift_costs))
+            k = k[(k + shift >= 0) & (k + shift < length)]
+            index.append(k)
+            shifts.append(np.full(len(k), shift))
+            costs.append(shift_costs[k])
+        index, shifts, costs = np.concatenate(index), np.concatenate(shifts), np.concatenate(costs)
+        if not len(index):
+            return []
+        # moves grouped by pair of chains, in (index, shift) order within a pair
+        order = np.lexsort((shifts, index, far_chain[index + shifts], near_chain[index]))
+        pairs = near_chain[index[order]] * length + far_chain[(index + shifts)[order]]
+        first = np.flatnonzero(np.concatenate([[True], pairs[1:] != pairs[:-1]]))
+        counts = np.diff(np.append(first, len(order)))
+        wide = counts >= HPAStar.WIDE_ENTRANCE
+        chosen = np.concatenate([
+            first[wide], first[wide] + counts[wide] - 1, first[~wide] + counts[~wide] // 2
+        ])
+        chosen = order[chosen]
+        return list(zip(index[chosen].tolist(), shifts[chosen].tolist(), costs[chosen].astype(float).tolist()))
+
+    def build_abstract_graph(self):
+        """
+        Find the entrances of all clusters and precompute the costs between them.
+
+        Works one row of clusters at a time, on cost planes of strips of
+        about STRIP_CELLS cells. Returns None when close() stops it.
+        """
+        rows, cols = self.elevation_map.shape
+        size = self.cluster_size
+        cluster_rows = -(-rows // size)
+        cluster_cols = -(-cols // size)
+        graph = {}
+        cluster_nodes = {(i, j): set() for i in range(cluster_rows) for j in range(cluster_cols)}
+
+        def connect(a, b, cost):
+            graph.setdefault(a, {})[b] = cost
+            graph.setdefault(b, {})[a] = cost
+            cluster_nodes[self.cluster_of(a)].add(a)
+            cluster_nodes[self.cluster_of(b)].add(b)
+
+        offsets = Sensor.NEIGHBOR_OFFSETS
+        right, down = offsets.index((0, 1)), offsets.index((1, 0))
+        down_right, down_left, up_right = offsets.index((1, 1)), offsets.index((1, -1)), offsets.index((-1, 1))
+
+        for i in range(cluster_rows):
+            if self._cancelled.is_set():
+                return None
+            row_start, row_stop = i * size, min(rows, (i + 1) * size)
+
+            # bottom border and corners, from the last row of this cluster row and the first of the next
+            if row_stop < rows:
+                band = self.sensor.cost_planes(row_stop - 1, row_stop + 1, 0, cols, dtype=np.float64)
+                near, far = band[:, 0], band[:, 1]
+                for col_start in range(0, cols, size):
+                    col_stop = min(cols, col_start + size)
+                    crossings = {
+                        0: near[down, col_start:col_stop],
+                        1: near[down_right, col_start:col_stop], -1: near[down_left, col_start:col_stop],
+                    }
+                    along_near = near[right, col_start:col_stop - 1]
+                    along_far = far[right, col_start:col_stop - 1]
+                    for k, shift, cost in self._transitions(along_near, along_far, crossings):
+                        connect((row_stop - 1, col_start + k), (row_stop, col_start + k + shift), cost)
+                    if col_stop < cols and np.isfinite(near[down_right, col_stop - 1]):
+                        connect((row_stop - 1, col_stop - 1), (row_stop, col_stop), float(near[down_right, col_stop - 1]))
+                    if col_start > 0 and np.isfinite(near[down_left, col_start]):
+                        connect((row_stop - 1, col_start), (row_stop, col_start - 1), float(near[down_left, col_start]))
+
+            # right borders and intra-cluster edges, over strips of whole clusters
+            chunk = max(1, STRIP_CELLS // ((row_stop - row_start) * size)) * size
+            for chunk_start in range(0, cols, chunk):
+                chunk_stop = min(cols, chunk_start + chunk)
+                # one column more, the far side of the last right border
+                planes = self.sensor.cost_planes(row_start, row_stop, chunk_start, min(cols, chunk_stop + 1),
+                                                 dtype=np.float64)
+                for col_start in range(chunk_start, chunk_stop, size):
+                    col_stop = min(cols, col_start + size)
+                    if col_stop < cols:
+                        near, far = planes[:, :, col_stop - 1 - chunk_start], planes[:, :, col_stop - chunk_start]
+                        crossings = {0: near[right], 1: near[down_right], -1: near[up_right]}
+                        for k, shift, cost in self._transitions(near[down][:-1], far[down][:-1], crossings):
+                            connect((row_start + k, col_stop - 1), (row_start + k + shift, col_stop), cost)
+
+                # the borders of these clusters are all known now, link their entrances
+                for col_start in range(chunk_start, chunk_stop, size):
+                    cluster = (i, col_start // size)
+                    nodes = sorted(cluster_nodes[cluster])
+                    if len(nodes) < 2:
+                        continue
+                    cluster_planes = planes[:, :, col_start - chunk_start:min(cols, col_start + size) - chunk_start]
+                    distances = self._cluster_distances(cluster, nodes, planes=cluster_planes)
+                    for a, line in zip(nodes, distances):
+                        for b, cost in zip(nodes, line):
+                            if a != b and np.isfinite(cost):
+                                graph[a][b] = float(cost)
+
+        return graph, {cluster: sorted(nodes) for cluster, nodes in cluster_nodes.items()}
+
+    def _cluster_distances(self, cluster, sources, targets=None, planes=None):
+        """Costs of the cheapest paths inside cluster from each source to each target"""
+        row_start, row_stop, col_start, col_stop = window = self.cluster_window(cluster)
+        graph = self.sensor.cost_graph(*window, planes=planes)
+        width = col_stop - col_start
+        targets = sources if targets is None else targets
+        source_ids = [(r - row_start) * width + (c - col_start) for r, c in sources]
+        target_ids = [(r - row_start) * width + (c - col_start) for r, c in targets]
+        return dijkstra(graph, directed=True, indices=source_ids)[:, target_ids]
+
+    def _abstract_search(self, start, goal, extra):
+        """A* over the abstract graph plus the temporary edges in extra"""
+        def heuristic(node):
+            return ((node[0] - goal[0])**2 + (node[1] - goal[1])**2)**0.5
+
+        open_set = [(heuristic(start), start)]
+        g_score = {start: 0.0}
+        path_history = {}
+        closed = set()
+        while open_set:
+            _, curr = heapq.heappop(open_set)
+            if curr in closed:
+                continue
+            if curr == goal:
+                return self._reconstruct_path(path_history, curr)
+            closed.add(curr)
+
+            edges = list(self.abstract_graph.get(curr, {}).items()) + list(extra.get(curr, {}).items())
+            for neighbor, cost in edges:
+                tentative_g_score = g_score[curr] + cost
+                if tentative_g_score < g_score.get(neighbor, float('inf')):
+                    g_score[neighbor] = tentative_g_score
+                    path_history[neighbor] = curr
+                    heapq.heappush(open_set, (tentative_g_score + heuristic(neighbor), neighbor))
+        return None
+
+    def _refine_hop(self, a, b):
+        """Concrete path for one abstract hop: a border crossing or a path inside one cluster"""
+        if self.cluster_of(a) != self.cluster_of(b):
+            return Path.from_cells([a, b])
+        window = self.cluster_window(self.cluster_of(a))
+        engine = ArrayEngine(self.sensor, window)
+        engine.restrict(np.ones((engine.height, engine.width), dtype=bool))
+        return engine.search(a, b, lambda r, c: self.estimate((r, c), b))
+
+    def find_path(self, start, goal, max_iterations=None):
+        """
+        Find a path between start and goal through the abstract graph
+
+        Args:
+        start (tuple): Starting coordinates (row, col)
+        goal (tuple): Goal coordinates (row, col)
+        max_iterations (int, optional): Unused, the abstract search is bounded by the graph
+
+        Returns:
+        Path: Path from start to goal, or None if no path found
+        """
+        start, goal = tuple(start), tuple(goal)
+        self._prepare_query(start, goal)
+        if not self.is_reachable(start, goal):
+            return None
+        if start == goal:
+            return Path(start)
+
+        # temporary edges linking start and goal to the entrances of their clusters
+        extra = {}
+        for endpoint in (start, goal):
+            cluster = self.cluster_of(endpoint)
+            nodes = self.cluster_nodes.get(cluster, [])
+            if nodes:
+                costs = self._cluster_distances(cluster, [endpoint], nodes)[0]
+                for node, cost in zip(nodes, costs):
+                    if np.isfinite(cost):
+                        extra.setdefault(endpoint, {})[node] = float(cost)
+                        extra.setdefault(node, {})[endpoint] = float(cost)
+        if self.cluster_of(start) == self.cluster_of(goal):
+            cost = self._cluster_distances(self.cluster_of(start), [start], [goal])[0][0]
+            if np.isfinite(cost):
+                extra.setdefault(start, {})[goal] = float(cost)
+
+        abstract_path = self._abstract_search(start, goal, extra)
+        if abstract_path is None:
+            return None  # the abstract graph is complete, so there is no path
+
+        codes = []
+        for a, b in zip(abstract_path[:-1], abstract_path[1:]):
+            hop = self._refine_hop(a, b)
+            if hop is None:
+                return None
+            codes.append(hop.codes())
+        return Path(start, np.concatenate(codes))
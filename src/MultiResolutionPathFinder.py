@@ -1,42 +1,258 @@
-import cv2
+import os
+import multiprocessing
 import numpy as np
 import copy
 import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
 from PathFinderBase import PathFinderBase
 from BidirectionalAStar import BidirectionalAStar
+from compact_path import Path
+from cost_pyramid import CostToGo, cost_to_go_level, search_level
+import segment_refinement
 
 class MultiResolutionPathFinder(PathFinderBase):
-    
-    def __init__(self, test_mode, test_map=None):
+
+    # Factor the corridor half-width grows by each time a corridor search fails
+    CORRIDOR_GROWTH = 2
+    # Guide path cells per segment refined by a worker, see use_process_pool
+    SEGMENT_LENGTH = 256
+    # Times a segment's corridor may grow before the level is refined as a whole
+    SEGMENT_RETRIES = 3
+    # Coarsest pyramid level a query may start from
+    MAX_LEVELS = 5
+    # Cells the search at a query's starting level should roughly cover, see start_level
+    TARGET_COARSE_NODES = 4096
+    # Cells added around the corridor for the window of the cost-to-go field, see refine_in_corridor
+    COST_TO_GO_MARGIN = 64
+    # Largest corridor window, in cells; ArrayEngine holds ~75 bytes per cell, so ~750 MB at most
+    MAX_CORRIDOR_CELLS = 10_000_000
+
+    def __init__(self, test_mode, test_map=None, corridor_width=4, levels=MAX_LEVELS):
         super().__init__(test_mode, test_map=test_map)
+        self.levels = levels
+        self.target_coarse_nodes = MultiResolutionPathFinder.TARGET_COARSE_NODES
+        # Half-width, in cells of the level being refined, of the band searched around the coarse path
+        self.corridor_width = corridor_width
+        # Segment refinement in worker processes, see use_process_pool
+        self.workers = 0
+        self.segment_length = MultiResolutionPathFinder.SEGMENT_LENGTH
+        # Largest window of a corridor search, see refine_level
+        self.max_corridor_cells = MultiResolutionPathFinder.MAX_CORRIDOR_CELLS
+        self._pool = None
+        self._shared_blocks = []
         
-        # Check if we should use the Gaussian Pyramid
+        # Check if we should use the cost pyramid
         self.use_pyramid = self.elevation_map.shape[0] > 100 or self.elevation_map.shape[1] > 100
         self.bidirectional_astar = BidirectionalAStar(test_mode, test_map=test_map)
+        # one pyramid for both, built when a query first needs a level
+        self.bidirectional_astar.cost_pyramid = self.cost_pyramid
+
+    def _set_reachability(self, index):
+        """Share the connected-component index with the full-resolution searcher"""
+        super()._set_reachability(index)
+        self.bidirectional_astar.reachability = index
+
+    def use_process_pool(self, workers=None, segment_length=SEGMENT_LENGTH):
+        """Refine long paths segment by segment in a pool of worker processes.
+
+        At every level the guide path is cut into segments of segment_length
+        cells, whose corridors are searched in parallel and stitched back in
+        order. The workers attach to the level grids through the DEM's
+        memmap or shared memory, so no elevations are pickled. A segment
+        that cannot be refined makes that level fall back to one corridor
+        search over the whole path. Pass workers=0 to refine in-process again.
+        Workers are spawned, so scripts using this need the usual
+        `if __name__ == "__main__":` guard.
+
+        Args:
+        workers (int, optional): Number of processes, defaults to the CPU count
+        segment_length (int): Guide path cells per segment
+        """
+        self._shutdown_pool()
+        self.workers = os.cpu_count() if workers is None else workers
+        self.segment_length = segment_length
+        if not self.workers or not self.use_pyramid:
+            return None
+
+        self.ensure_level(self.levels)
+        descriptions = []
+        for level, sensor in enumerate(self.cost_pyramid):
+            dem_path = self.dem.path if self.dem is not None else None
+            description, blocks = segment_refinement.share_sensor(sensor, dem_path=dem_path)
+            descriptions.append(description)
+            self._shared_blocks += blocks
+        # spawned workers start clean instead of inheriting this process' state
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=segment_refinement.init_worker,
+            initargs=(descriptions,),
+        )
+        return self._pool
+
+    def _shutdown_pool(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        for block in self._shared_blocks:
+            block.close()
+            block.unlink()
+        self._shared_blocks = []
+
+    def close(self):
+        """Release the shared DEM held by this pathfinder and its full-resolution searcher"""
+        self._shutdown_pool()
+        self.bidirectional_astar.close()
+        super().close()
+
+    def build_pyramid(self, levels=MAX_LEVELS):
+        """Build every level of the cost pyramid down to levels at once."""
+        self.ensure_level(levels)
+        return self.cost_pyramid[:levels + 1]
+
+    def start_level(self, start, goal):
+        """
+        Pyramid level a query from start to goal starts at.
+
+        A search between points span cells apart covers about span^2 cells,
+        and each level divides that by 4, so the finest level bringing it
+        down to target_coarse_nodes is chosen, at most self.levels. Level 0
+        means the full-resolution map is searched directly.
+        """
+        span = max(abs(start[0] - goal[0]), abs(start[1] - goal[1]), 1)
+        level = 0
+        while level < self.levels and span ** 2 / 4 ** level > self.target_coarse_nodes:
+            level += 1
+        return level
+
+    def scale_to_level(self, point, level):
+        """Map a full-resolution (row, col) onto the grid of a pyramid level."""
+        level_rows, level_cols = self.cost_pyramid[level].elevation_map.shape
+        # Row 0 is never passable at full resolution, coarse row 0 also covers row 1
+        row = min(max(point[0] // (2 ** level), 1 if level == 0 else 0), level_rows - 1)
+        col = min(point[1] // (2 ** level), level_cols - 1)
+        return (row, col)
+
+    def connect_points_at_level(self, start_point, end_point, level):
+        """Find a path between two points on the grid of a pyramid level."""
+        return search_level(self.cost_pyramid[level], start_point, end_point)
 
-        if self.use_pyramid:
-            self.elevation_pyramid = self.gaussian_pyramid()
-            
-    def gaussian_pyramid(self, levels=5):
-        """Create a Gaussian Pyramid if the map is large."""
-        elevation_map = self.elevation_map.astype(np.float32)  # Convert to float32
-        pyramid = [elevation_map]
+    def covers(self, cell):
+        """Whether the cost pyramid holds the moves of cell's component, see CostLevel.component"""
+        self.ensure_level(1)
+        return self.cost_pyramid[1].covers(self.reachability.labels[cell[0], cell[1]])
 
-        for _ in range(levels):
-            elevation_map = cv2.pyrDown(elevation_map)  # Downsample
-            pyramid.append(elevation_map)
+    def use_cost_to_go(self, level=PathFinderBase.COST_TO_GO_LEVEL):
+        """Guide full-resolution searches with a coarse cost-to-go field, see PathFinderBase.use_cost_to_go.
 
-        return pyramid
+        It guides the full-resolution corridor search of every query and the
+        Bidirectional A* answering short ones.
+        """
+        cost_level = super().use_cost_to_go(level)  # shares the reachability index first
+        self.bidirectional_astar.use_cost_to_go(level)
+        return cost_level
 
-    def connect_points_at_level(self, start_point, end_point, call_from_gaussian=True):
-        """Find a path between two points at the current resolution level."""
-        return self.bidirectional_astar.find_path(start_point, end_point, call_from_gaussian=True)
+    def refine_in_corridor(self, guide_path, start_point, end_point, level):
+        """
+        Find a path at a level, restricted to a band around guide_path.
+
+        The band is widened by CORRIDOR_GROWTH every time the search inside
+        it fails, until it covers the whole level or its window would exceed
+        max_corridor_cells cells. At full resolution the
+        search is guided by a cost-to-go field around the corridor once
+        use_cost_to_go has been called, on the finest level whose window
+        fits cost_pyramid.COST_TO_GO_BLOCKS blocks.
+
+        Returns:
+        Path: Path from start_point to end_point at that level, or None if there is none within the cap
+        """
+        heuristic = None
+        if level == 0 and self.cost_to_go_level is not None and self.covers(end_point):
+            margin = MultiResolutionPathFinder.COST_TO_GO_MARGIN
+            rows = [r for r, _ in guide_path] + [start_point[0], end_point[0]]
+            cols = [c for _, c in guide_path] + [start_point[1], end_point[1]]
+            window = (min(rows) - margin, max(rows) + margin + 1, min(cols) - margin, max(cols) + margin + 1)
+            field_level = cost_to_go_level(window, min_level=self.cost_to_go_level)
+            self.cost_to_go = CostToGo(self.ensure_level(field_level), end_point, window)
+
+            def heuristic(r, c):
+                return self.lower_bound((r, c), end_point)
+        return segment_refinement.search_corridor(
+            self.cost_pyramid[level], guide_path, start_point, end_point,
+            self.corridor_width, MultiResolutionPathFinder.CORRIDOR_GROWTH, heuristic=heuristic,
+            max_cells=self.max_corridor_cells,
+        )
+
+    def refine_level(self, guide_path, start_point, end_point, level):
+        """
+        Refine guide_path at a level, in segments on the process pool when there is one.
+
+        Without a pool, a guide path whose corridor window would exceed
+        max_corridor_cells is refined in segments in this process instead.
+
+        Returns:
+        Path: Path from start_point to end_point at that level, or None if there is none
+        """
+        length = self.segment_length
+        if len(guide_path) < 2 * length:
+            return self.refine_in_corridor(guide_path, start_point, end_point, level)
+        if self._pool is None:
+            row_start, row_stop, col_start, col_stop = segment_refinement.corridor_window(
+                self.cost_pyramid[level].elevation_map.shape,
+                [start_point] + list(guide_path) + [end_point], self.corridor_width,
+            )
+            if (row_stop - row_start) * (col_stop - col_start) <= self.max_corridor_cells:
+                return self.refine_in_corridor(guide_path, start_point, end_point, level)
+
+        # waypoints on the guide path split it into independent segments
+        level_rows, level_cols = self.cost_pyramid[level].elevation_map.shape
+        cuts = list(range(length, len(guide_path) - length // 2, length))
+        waypoints = [start_point] + [
+            (min(max(guide_path[i][0], 1 if level == 0 else 0), level_rows - 1), min(guide_path[i][1], level_cols - 1))
+            for i in cuts
+        ] + [end_point]
+        bounds = [0] + cuts + [len(guide_path)]
+        segments = [
+            (guide_path[bounds[i]:bounds[i + 1] + 1], waypoints[i], waypoints[i + 1])
+            for i in range(len(waypoints) - 1)
+        ]
+
+        max_width = self.corridor_width * MultiResolutionPathFinder.CORRIDOR_GROWTH ** MultiResolutionPathFinder.SEGMENT_RETRIES
+        if self._pool is None:
+            codes = []
+            for segment_path, segment_start, segment_end in segments:
+                path = segment_refinement.search_corridor(
+                    self.cost_pyramid[level], segment_path, segment_start, segment_end, self.corridor_width,
+                    MultiResolutionPathFinder.CORRIDOR_GROWTH, max_width, max_cells=self.max_corridor_cells,
+                )
+                codes.append(None if path is None else path.codes())
+        else:
+            # contiguous batches, one task per worker
+            batch_size = -(-len(segments) // self.workers)
+            futures = [
+                self._pool.submit(
+                    segment_refinement.refine_segments, level, segments[i:i + batch_size],
+                    self.corridor_width, MultiResolutionPathFinder.CORRIDOR_GROWTH, max_width,
+                    self.max_corridor_cells,
+                )
+                for i in range(0, len(segments), batch_size)
+            ]
+            codes = [segment for future in futures for segment in future.result()]
+        if any(segment is None for segment in codes):
+            return self.refine_in_corridor(guide_path, start_point, end_point, level)
+        return Path(start_point, np.concatenate(codes))
 
     def find_path(self, start, goal):
-        """Select pathfinding method based on map size."""
-        # For small maps, directly use Bidirectional A*
-        if not self.use_pyramid:
+        """Select pathfinding method based on map size and query length."""
+        if not self.is_reachable(start, goal):
+            return None
+
+        # For small maps and short queries, directly use Bidirectional A*,
+        # as well as in components the cost pyramid does not hold
+        level = self.start_level(start, goal) if self.use_pyramid else 0
+        if level == 0 or not self.covers(start):
             return self.bidirectional_astar.find_path(start, goal)
+        self.ensure_level(level)
 
         # Convert coordinates to row/col in full-resolution map
         start_row, start_col = start
@@ -44,72 +260,33 @@ class MultiResolutionPathFinder(PathFinderBase):
         #print("Before shrink",goal)
         #print("start row,col= ", (start_row, start_col))
         #print("end row,col= ", (goal_row, goal_col))
-        # Start at the lowest resolution (coarsest level)
-        level = len(self.elevation_pyramid) - 1
-        
-        # Find initial path at coarsest level
-        scaled_start = (start_row // (2 ** level), start_col // (2 ** level))
-        scaled_goal = (goal_row // (2 ** level), goal_col // (2 ** level))
-        coarse_path = self.bidirectional_astar.find_path(scaled_start, scaled_goal, call_from_gaussian=True)
+        # Find initial path at the starting level, on the coarse grid itself
+        scaled_start = self.scale_to_level((start_row, start_col), level)
+        scaled_goal = self.scale_to_level((goal_row, goal_col), level)
+        coarse_path = self.connect_points_at_level(scaled_start, scaled_goal, level)
 
         if coarse_path is None:
             print("Warning: Could not find path at coarsest level!")
             return None
 
-        # Refine path through each level
+        # Refine path through each level, one corridor search per level
         while level > 0:
             # Scale up the coarse path points to next finer level
             scaled_path = [(r * 2, c * 2) for r, c in coarse_path]
-            #print("In loop",scaled_path[-1])
             # Move to next finer level
             level -= 1
-            
-            # Connect segments at current level
-            fine_path = []
-            for i in range(len(scaled_path) - 1):
-                start_point = scaled_path[i]
-                end_point = scaled_path[i + 1]
-                
-                # Find path between consecutive points
-                segment = self.connect_points_at_level(start_point, end_point)
-                
-                if segment is None:
-                    print(f"Warning: Failed to connect points at level {level}")
-                    # If connection fails, use direct line between points
-                    segment = [start_point, end_point]
-                
-                # Add segment to fine path (avoid duplicating points)
-                if i == 0:
-                    fine_path.extend(segment)
-                else:
-                    fine_path.extend(segment[1:])  # Skip first point as it's same as last point of previous segment
-            
+
+            level_start = self.scale_to_level((start_row, start_col), level)
+            level_goal = self.scale_to_level((goal_row, goal_col), level)
+            fine_path = self.refine_level(scaled_path, level_start, level_goal, level)
+
+            if fine_path is None:
+                if level == 0:
+                    return None  # no path within the corridor cap, or the goal is unreachable
+                print(f"Warning: Failed to refine path at level {level}")
+                # Keep the upsampled path as the guide for the next level
+                fine_path = scaled_path
+
             coarse_path = fine_path
 
-        # If the refined path's final node doesn't match the specified goal,
-        # refine the last segment using full-resolution A*
-        if coarse_path[-1] != goal:
-            if len(coarse_path) >= 1:
-                # Compute a final segment from the second to last point to the actual goal
-                final_segment = self.bidirectional_astar.find_path(coarse_path[-1], goal,call_from_gaussian=True)
-                if final_segment is not None:
-                    # Append the final segment, skipping the duplicate node
-                    coarse_path = coarse_path[:-1] + final_segment
-                else:
-                    # Can't reach goal
-                    coarse_path=None
-            else:
-                coarse_path=None
-
-        if coarse_path[0] != start:
-            final_segment = self.bidirectional_astar.find_path(start, coarse_path[0], call_from_gaussian=True)
-            if final_segment is not None:
-                # Avoid duplicating the first node of coarse_path if it's already the last node of final_segment.
-                if final_segment[-1] == coarse_path[0]:
-                    coarse_path = final_segment[:-1] + coarse_path
-                else:
-                    coarse_path = final_segment + coarse_path
-            else:
-                coarse_path = None
-
-        return coarse_path
\ No newline at end of file
+        return coarse_path
@@ -1,23 +1,71 @@
 import zope.interface
 import os
-import rasterio
+import threading
 import transformations
+import dem_registry
 from PathFinder import PathFinder
+from ArrayEngine import ArrayEngine
+from bucket_queue import BucketQueue
+from compact_path import Path, DIRECTION_CODES
+from reachability import ReachabilityIndex
+from landmarks import LandmarkIndex, LANDMARK_COUNT
+from cost_pyramid import CostToGo, cost_to_go_level, open_level
+from heuristics import Heuristic
 from sensors import Sensor
 from motors import Motors
 
 @zope.interface.implementer(PathFinder)
 class PathFinderBase:
     """A base class providing default implementations for pathfinding algorithms"""
-    def __init__(self, test_mode, test_map=None):
+
+    # "dict" keeps search state in tuple-keyed dicts, "array" uses ArrayEngine
+    ENGINES = ("dict", "array")
+    # Minimum number of cells added around start/goal for array engine windows
+    WINDOW_MARGIN = 64
+    # Default margin of the window read per query with storage="window"
+    QUERY_MARGIN = 128
+    # Finest cost-pyramid level of the cost-to-go fields, see use_cost_to_go
+    COST_TO_GO_LEVEL = 1
+    # Elevation dataset used outside test mode
+    DEM_PATH = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        'data/MarsMGSMOLA_MAP2_EQUI.tif'
+    )
+
+    def __init__(self, test_mode, test_map=None, engine="dict", storage="memmap"):
+        if engine not in PathFinderBase.ENGINES:
+            raise ValueError(f"Unknown search engine '{engine}', expected one of {PathFinderBase.ENGINES}")
+        self.engine = engine
+        # How the DEM is backed outside test mode, see dem_registry.STORAGES
+        self.storage = storage
+        # Cells read around start and goal when storage is "window"
+        self.query_margin = PathFinderBase.QUERY_MARGIN
+
         # Load the map once during initialization
+        self.dem = None
+        # Connected-component index, see use_reachability
+        self.reachability = None
+        # Thread building the index with use_reachability(background=True)
+        self._reachability_thread = None
+        # ALT distance tables, see use_landmarks
+        self.landmarks = None
+        # Finest cost-pyramid level the cost-to-go fields run on, see use_cost_to_go
+        self.cost_to_go_level = None
+        # Cost-to-go field towards the goal of the current query
+        self.cost_to_go = None
+        # Cost estimate guiding the searches, see set_heuristic
+        self.heuristic_model = Heuristic()
+        # Nodes expanded by the last query
+        self.expanded = 0
+        # Open set of the array engine, see use_bucket_queue; None means heapq
+        self.bucket_queue = None
         
         if not test_mode:
             self.test_mode = test_mode
             elevation_map, transformer, affine_transform = self._load_map()
             self.elevation_map = elevation_map
             self.reverse_transformer = transformer
-            self.sensor = Sensor(elevation_map, affine_transform)
+            self.sensor = Sensor(elevation_map, affine_transform, filled_map=self.dem.filled_map)
             
         else:
             self.test_mode = test_mode
@@ -25,36 +73,260 @@ class PathFinderBase:
             self.reverse_transformer = None
             self.sensor = Sensor(test_map, None)
             self.affine_transform = None
+        # The full-resolution Sensor, then the cost-pyramid levels built so far, see ensure_level
+        self.cost_pyramid = [self.sensor]
             
             
     
     def _load_map(self):
-        """Load the elevation map from a predefined file path."""
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        parent_dir = os.path.dirname(base_dir)
-        dem_path = os.path.join(parent_dir, 'data/MarsMGSMOLA_MAP2_EQUI.tif')
-        
-        with rasterio.open(dem_path) as data:
-            elevation_map = data.read(1)
-            crs = data.crs
-            affine_transform = data.transform
-            self.affine_transform = affine_transform
-            self.transform=transformations.setup_transformer(crs)
-        reverse_transformer = transformations.setup_reverse_transformer(crs)
-        return elevation_map, reverse_transformer, affine_transform
+        """Load the elevation map from a predefined file path.
+
+        The dataset comes from the process-wide DEM registry, so every
+        pathfinder shares one read-only copy of it. With storage="tiled"
+        the elevations are streamed tile by tile through an LRU cache, and
+        with storage="window" only the area around each query is read.
+        """
+        if self.dem is None:
+            self.dem = dem_registry.acquire(self.DEM_PATH, storage=self.storage)
+        self.affine_transform = self.dem.affine_transform
+        self.transform = self.dem.transformer
+        elevation_map = self.dem.elevation_map
+        if self.storage == "window":
+            # the window follows this pathfinder's queries, so it gets a view of its own
+            elevation_map = elevation_map.view()
+        return elevation_map, self.dem.reverse_transformer, self.dem.affine_transform
+
+    def close(self):
+        """Release the shared DEM held by this pathfinder"""
+        if self.dem is not None:
+            if self.storage == "window":
+                self.elevation_map.close()
+            dem_registry.release(self.dem)
+            self.dem = None
     
+    def _prepare_query(self, start, goal):
+        """Load what a query from start to goal needs before searching.
+
+        With storage="window" this reads the window around start and goal
+        (plus query_margin); it grows by itself if the search leaves it.
+        """
+        if self.storage == "window" and self.dem is not None:
+            self.elevation_map.focus(start, goal, margin=self.query_margin)
+        self.cost_to_go = None
+        rows, cols = self.elevation_map.shape
+        if self.cost_to_go_level is not None and 0 <= goal[0] < rows and 0 <= goal[1] < cols \
+                and self.ensure_level(1).covers(self.reachability.labels[goal[0], goal[1]]):
+            span = max(abs(start[0] - goal[0]), abs(start[1] - goal[1]))
+            window = self._search_window(start, goal, max(PathFinderBase.WINDOW_MARGIN, span))
+            level = cost_to_go_level(window, min_level=self.cost_to_go_level)
+            self.cost_to_go = CostToGo(self.ensure_level(level), goal, window)
+
+    def use_reachability(self, background=False):
+        """Build (or load) the connected-component index used to reject impossible queries.
+
+        Outside test mode the labels are stored next to the DEM, so they are
+        computed only once per dataset. With background=True the index is
+        built on a daemon thread and None is returned at once; is_reachable
+        accepts every query until it is ready. A later call without
+        background waits for that thread.
+        """
+        thread = self._reachability_thread
+        if background:
+            if thread is None and self.reachability is None:
+                self._reachability_thread = threading.Thread(target=self._build_reachability, daemon=True)
+                self._reachability_thread.start()
+            return self.reachability
+        if thread is not None:
+            thread.join()
+            if self.reachability is not None:
+                return self.reachability
+        self._set_reachability(self._load_reachability())
+        return self.reachability
+
+    def _load_reachability(self):
+        dem_path = self.dem.path if self.dem is not None and self.storage == "memmap" else None
+        return ReachabilityIndex.build(self.sensor, dem_path=dem_path)
+
+    def _build_reachability(self):
+        try:
+            index = self._load_reachability()
+        except Exception as error:
+            # queries stay unfiltered; use_reachability() without background builds it again
+            print(f"Warning: Could not build the reachability index: {error}")
+            return
+        self._set_reachability(index)
+
+    def _set_reachability(self, index):
+        self.reachability = index
+
+    def is_reachable(self, start, goal):
+        """False only when start and goal are known to lie in different components"""
+        if self.reachability is None:
+            return True
+        return self.reachability.reachable(start, goal)
+
+    def use_landmarks(self, count=LANDMARK_COUNT):
+        """Build (or load) the ALT landmark tables, making the heuristic terrain-aware.
+
+        Outside test mode the tables are stored next to the DEM, so the
+        Dijkstra runs happen only once per dataset. Maps larger than
+        landmarks.LANDMARK_CELLS get one distance per block of a cost-pyramid
+        level instead of one per cell.
+        """
+        dem_path = self.dem.path if self.dem is not None and self.storage == "memmap" else None
+        labels = None if self.reachability is None else self.reachability.labels
+        self.landmarks = LandmarkIndex.build(self.sensor, count, dem_path=dem_path, labels=labels)
+        return self.landmarks
+
+    def ensure_level(self, level):
+        """
+        Build the cost pyramid down to level, if not done yet, and return that level.
+
+        Level 1 is derived from the full-resolution costs and every further
+        level from the one before, see cost_pyramid. Unlike averaged
+        elevations, the levels keep every cliff the rover cannot cross.
+        Levels of a dataset are stored next to it on first use and
+        memory-mapped by later pathfinders.
+        """
+        dem_path = self.dem.path if self.dem is not None and self.storage == "memmap" else None
+        if level > 0 and self.reachability is None:
+            self.use_reachability()  # level 1 only holds the moves of the largest component
+        while len(self.cost_pyramid) <= level:
+            below = self.cost_pyramid[-1] if len(self.cost_pyramid) > 1 else None
+            self.cost_pyramid.append(open_level(
+                self.sensor, len(self.cost_pyramid), below=below,
+                labels=self.reachability.labels, dem_path=dem_path,
+            ))
+        return self.cost_pyramid[level]
+
+    def use_cost_to_go(self, level=COST_TO_GO_LEVEL):
+        """Raise the heuristic with a cost-to-go field run from each query's goal.
+
+        Every query runs a reverse Dijkstra from its goal over a window of
+        the cost pyramid (see cost_pyramid.CostToGo), which sees the walls
+        a straight-line bound ignores and stays admissible. The field runs
+        on the finest level from the given one on whose window fits
+        cost_pyramid.COST_TO_GO_BLOCKS blocks, so its cost does not grow
+        with the span of the query.
+        """
+        self.cost_to_go_level = level
+        return self.ensure_level(level)
+
+    def use_bucket_queue(self, resolution=1.0):
+        """Run array-engine searches on a Dial bucket queue instead of heapq.
+
+        Priorities are quantized to resolution, so paths may cost up to
+        resolution more than the optimum. The queue is reused by every query.
+        Pass None to go back to heapq.
+        """
+        self.bucket_queue = None if resolution is None else BucketQueue(resolution)
+        return self.bucket_queue
+
+    def set_heuristic(self, heuristic):
+        """Replace the cost estimate used by find_path, e.g. with heuristics.TerrainHeuristic"""
+        self.heuristic_model = heuristic
+
+    def lower_bound(self, cell, target):
+        """Admissible estimate of the cost between cell and target.
+
+        The bound of the heuristic model, raised to the landmark bound when
+        use_landmarks has been called and to the cost-to-go bound when
+        use_cost_to_go has been called and target is the query's goal.
+        """
+        bound = self.heuristic_model.lower_bound(self.sensor, cell, target)
+        if self.landmarks is not None:
+            bound = max(bound, self.landmarks.lower_bound(cell, target))
+        if self.cost_to_go is not None and target == self.cost_to_go.goal:
+            bound = max(bound, self.cost_to_go.lower_bound(cell))
+        return bound
+
+    def estimate(self, cell, target):
+        """Heuristic value used by the searches: lower_bound scaled by the model's weight"""
+        return self.heuristic_model.weight * self.lower_bound(cell, target)
+
     def _reconstruct_path(self, hist, curr):
         path = [curr]
         while curr in hist:
             curr = hist[curr]
             path.append(curr)
         return path[::-1]  # More efficient than reverse()
+
+    def _direction_code(self, cell, neighbor):
+        """Code of the move from cell to neighbor, what the grid searches store in path_history"""
+        return DIRECTION_CODES[(neighbor[0] - cell[0], neighbor[1] - cell[1])]
+
+    def _reconstruct_coded(self, hist, curr):
+        """Path ending at curr from a history of direction codes, see _direction_code"""
+        codes = []
+        while curr in hist:
+            code = hist[curr]
+            codes.append(code)
+            d_row, d_col = Sensor.NEIGHBOR_OFFSETS[code]
+            curr = (curr[0] - d_row, curr[1] - d_col)
+        return Path(curr, codes[::-1])
     
+    def _search_window(self, start, goal, margin):
+        """Bounding box of start and goal grown by margin and clipped to the map"""
+        rows, cols = self.elevation_map.shape
+        row_start = max(0, min(start[0], goal[0]) - margin)
+        row_stop = min(rows, max(start[0], goal[0]) + margin + 1)
+        col_start = max(0, min(start[1], goal[1]) - margin)
+        col_stop = min(cols, max(start[1], goal[1]) + margin + 1)
+        return row_start, row_stop, col_start, col_stop
+
+    def _window_cells(self, window):
+        return (window[1] - window[0]) * (window[3] - window[2])
+
+    def _array_search(self, start, goal, heuristic, max_iterations=None, max_cells=None):
+        """
+        Search with ArrayEngine on a window around start and goal.
+
+        The window starts at the query bounding box plus a margin and is
+        doubled whenever a move leaving it could still lead to a cheaper
+        path than the one found inside, so the result stays optimal.
+        With max_cells the window never exceeds that many cells: the margin
+        shrinks to fit, and once the window cannot grow any further the best
+        path inside it is returned (None if there is none).
+
+        Raises:
+        ValueError: If the bounding box of start and goal alone exceeds max_cells
+        """
+        rows, cols = self.elevation_map.shape
+        span = max(abs(start[0] - goal[0]), abs(start[1] - goal[1]))
+        margin = max(PathFinderBase.WINDOW_MARGIN, span // 2)
+        if max_cells is not None:
+            while margin > 0 and self._window_cells(self._search_window(start, goal, margin)) > max_cells:
+                margin //= 2
+            if self._window_cells(self._search_window(start, goal, margin)) > max_cells:
+                raise ValueError(f"Query area exceeds the limit of {max_cells} cells")
+        self.expanded = 0
+
+        while True:
+            window = self._search_window(start, goal, margin)
+            engine = ArrayEngine(self.sensor, window)
+            path = engine.search(start, goal, heuristic, max_iterations=max_iterations, queue=self.bucket_queue)
+            self.last_engine = engine
+            self.expanded += engine.expanded
+
+            if engine.truncated:
+                return None
+            if engine.exit_bound >= engine.cost:
+                return path
+            if window == (0, rows, 0, cols):
+                return path
+            margin = max(1, 2 * margin)
+            if max_cells is not None and self._window_cells(self._search_window(start, goal, margin)) > max_cells:
+                return path  # keep memory bounded, the path is the best within the cap
+
     def get_neighbors(self,r,c):
         return self.sensor.get_neighbors(r,c)
     
     def get_cost(self,x1,y1,x2,y2):
         return self.sensor.get_cost(x1,y1,x2,y2)
+
+    def expand(self, row, col):
+        """Passable moves out of (row, col) as ((row, col), cost) pairs, see Sensor.expand"""
+        return self.sensor.expand(row, col)
     
     def RowCol2GeoCoord(self,start,goal):
         start_row,start_col=start
@@ -0,0 +1,102 @@
+"""
+Monotone bucket priority queue (Dial's algorithm) for the search engines.
+
+Priorities are quantized to multiples of a resolution and each quantized
+key owns one bucket. Buckets live in a ring array indexed by
+key & (capacity - 1), so a push is a list append and a pop scans forward
+from the current key, instead of the O(log n) tuple comparisons and the
+tuple allocation of heapq.
+
+The queue is monotone: A* with a consistent heuristic never pushes a key
+below the one last popped. Smaller keys, e.g. from an inconsistent
+heuristic, are filed under the current key.
+
+Quantization loses at most one resolution step: when the goal is popped,
+every open node shares or follows its bucket, so the path found costs
+less than the optimum plus the resolution.
+
+ArrayEngine works on buckets, mask, scale and current directly, since a
+method call per push would cost more than the queue saves.
+"""
+
+INF = float('inf')
+# Ring size a new queue starts with, it doubles whenever a key would wrap around
+INITIAL_BUCKETS = 1024
+
+
+class BucketQueue:
+    '''
+    Dial bucket queue of items with float priorities.
+
+    The ring and its bucket lists are kept across clear(), so one queue can
+    serve query after query without reallocating.
+
+    Fields:
+    - resolution (float): Width of the priority range sharing one bucket
+    - scale (float): 1 / resolution, priorities are multiplied by it to get keys
+    - buckets (list): Ring of bucket lists, the bucket of key k is buckets[k & mask]
+    - mask (int): Ring capacity minus one, capacity is a power of two
+    - current (int): Key of the last pop, no item is queued below it
+    - size (int): Number of items queued
+    '''
+
+    def __init__(self, resolution=1.0, buckets=INITIAL_BUCKETS):
+        if resolution <= 0:
+            raise ValueError(f"Bucket resolution must be positive, got {resolution}")
+        self.resolution = resolution
+        self.scale = 1.0 / resolution
+        capacity = 1
+        while capacity < buckets:
+            capacity *= 2
+        self.buckets = [[] for _ in range(capacity)]
+        self.mask = capacity - 1
+        self.current = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def clear(self):
+        """Empty the queue, keeping its buckets for the next query"""
+        for bucket in self.buckets:
+            bucket.clear()
+        self.current = 0
+        self.size = 0
+
+    def grow(self, key):
+        """Enlarge the ring until key fits without wrapping around current"""
+        capacity = len(self.buckets)
+        while key - self.current > capacity - 1:
+            capacity *= 2
+        old = self.buckets
+        self.buckets = [[] for _ in range(capacity)]
+        self.mask = capacity - 1
+        for offset in range(len(old)):
+            # old slots hold the keys current .. current + len(old) - 1 in turn
+            bucket = old[(self.current + offset) & (len(old) - 1)]
+            if bucket:
+                self.buckets[(self.current + offset) & self.mask] = bucket
+
+    def push(self, priority, item):
+        if priority == INF:
+            return  # cannot lead anywhere, e.g. a landmark bound of an unreachable cell
+        key = int(priority * self.scale)
+        if not self.size:
+            self.current = key
+        elif key < self.current:
+            key = self.current
+        elif key - self.current > self.mask:
+            self.grow(key)
+        self.buckets[key & self.mask].append(item)
+        self.size += 1
+
+    def pop(self):
+        """Remove and return an item with the lowest key, LIFO among equal keys"""
+        if not self.size:
+            raise IndexError("pop from an empty bucket queue")
+        buckets, mask, key = self.buckets, self.mask, self.current
+        while not buckets[key & mask]:
+            key += 1
+        self.current = key
+        self.size -= 1
+        return buckets[key & mask].pop()
@@ -0,0 +1,180 @@
+import numpy as np
+from sensors import Sensor
+
+"""
+Compact grid paths.
+
+Consecutive cells of a path are always 8-neighbours, so a path is fully
+described by its first cell and one direction code per step, the index
+of the move in Sensor.NEIGHBOR_OFFSETS. The 8 codes fit in 3 bits,
+~375 KB for a path of a million cells, and the int64 cell kept every
+Path.CHECKPOINT_INTERVAL steps adds ~250 KB, so the path takes ~0.6 MB
+instead of the ~120 MB of a list of (row, col) tuples.
+
+The searches store parents the same way, one direction code per cell
+(DIRECTION_CODES maps a (d_row, d_col) move to its code), and build a
+Path straight from them.
+"""
+
+# Move (d_row, d_col) -> direction code, the index in Sensor.NEIGHBOR_OFFSETS
+DIRECTION_CODES = {offset: code for code, offset in enumerate(Sensor.NEIGHBOR_OFFSETS)}
+OFFSETS = np.array(Sensor.NEIGHBOR_OFFSETS, dtype=np.int64)
+# Code of the opposite move of each code
+REVERSED_CODES = np.array(
+    [DIRECTION_CODES[(-d_row, -d_col)] for d_row, d_col in Sensor.NEIGHBOR_OFFSETS], dtype=np.uint8
+)
+BITS_PER_CODE = 3
+_BIT_WEIGHTS = np.array([4, 2, 1], dtype=np.uint8)
+# code of the move (d_row, d_col) at [d_row + 1, d_col + 1], -1 for no move
+_CODE_GRID = np.full((3, 3), -1, dtype=np.int8)
+for (_d_row, _d_col), _code in DIRECTION_CODES.items():
+    _CODE_GRID[_d_row + 1, _d_col + 1] = _code
+
+
+class Path:
+    '''
+    Path over the grid stored as a start cell and packed 3-bit direction codes.
+
+    Behaves like the list of (row, col) tuples the pathfinders used to
+    return: len, indexing (also negative), slicing, iteration, and
+    comparison with lists. The absolute cell of every CHECKPOINT_INTERVAL-th
+    step is kept, so any index is decoded from the closest checkpoint in
+    bounded time, and the block of the last index asked for is cached, so
+    walking the path cell by cell costs a lookup per cell.
+
+    Fields:
+    - start (tuple): First cell (row, col)
+    - steps (int): Number of moves, len(path) - 1
+    - packed (ndarray): Direction codes, BITS_PER_CODE bits each, as uint8
+    - checkpoints (ndarray): Cell of step i * CHECKPOINT_INTERVAL, shape (k, 2)
+    '''
+
+    CHECKPOINT_INTERVAL = 64
+
+    def __init__(self, start, codes=()):
+        codes = np.asarray(codes, dtype=np.uint8).reshape(-1)
+        if codes.size and codes.max() >= len(OFFSETS):
+            raise ValueError(f"Direction codes must be below {len(OFFSETS)}")
+        self.start = (int(start[0]), int(start[1]))
+        self.steps = int(codes.size)
+        bits = (codes[:, None] >> np.array([2, 1, 0], dtype=np.uint8)) & 1
+        self.packed = np.packbits(bits.reshape(-1))
+
+        interval = Path.CHECKPOINT_INTERVAL
+        checkpoints = np.zeros(((self.steps - 1) // interval + 2 if self.steps else 1, 2), dtype=np.int64)
+        checkpoints[0] = self.start
+        if self.steps:
+            block_moves = np.add.reduceat(OFFSETS[codes], np.arange(0, self.steps, interval), axis=0)
+            checkpoints[1:] = self.start + np.cumsum(block_moves, axis=0)
+        self.checkpoints = checkpoints
+        self._cached_block = None
+        self._cached_cells = None
+
+    @classmethod
+    def from_cells(cls, cells):
+        """
+        Build a Path from a sequence of (row, col) cells
+
+        Raises:
+        ValueError: If cells is empty or two consecutive cells are not 8-neighbours
+        """
+        if isinstance(cells, Path):
+            return cells
+        cells = np.asarray(cells, dtype=np.int64).reshape(-1, 2)
+        if not len(cells):
+            raise ValueError("A path needs at least one cell")
+        moves = np.diff(cells, axis=0)
+        if moves.size and np.abs(moves).max() > 1:
+            raise ValueError("Consecutive cells of a path must be 8-neighbours")
+        codes = _CODE_GRID[moves[:, 0] + 1, moves[:, 1] + 1]
+        if (codes < 0).any():
+            raise ValueError("A path cannot stay on the same cell")
+        return cls(cells[0], codes)
+
+    def codes(self, first=0, stop=None):
+        """Direction codes of steps first .. stop - 1 as a uint8 array"""
+        stop = self.steps if stop is None else stop
+        if stop <= first:
+            return np.zeros(0, dtype=np.uint8)
+        bit_start, bit_stop = first * BITS_PER_CODE, stop * BITS_PER_CODE
+        chunk = np.unpackbits(self.packed[bit_start // 8:(bit_stop + 7) // 8])
+        bits = chunk[bit_start % 8:bit_start % 8 + bit_stop - bit_start]
+        return bits.reshape(-1, BITS_PER_CODE) @ _BIT_WEIGHTS
+
+    def reverse(self):
+        """The same cells walked from the last one back to the first"""
+        return Path(self[-1], REVERSED_CODES[self.codes()[::-1]])
+
+    def _block(self, block):
+        """Cells of steps block * CHECKPOINT_INTERVAL onwards, up to the next checkpoint"""
+        if block != self._cached_block:
+            interval = Path.CHECKPOINT_INTERVAL
+            first = block * interval
+            stop = min(first + interval, self.steps)
+            cells = np.empty((stop - first + 1, 2), dtype=np.int64)
+            cells[0] = self.checkpoints[block]
+            np.cumsum(OFFSETS[self.codes(first, stop)], axis=0, out=cells[1:])
+            cells[1:] += cells[0]
+            self._cached_cells = list(map(tuple, cells.tolist()))
+            self._cached_block = block
+        return self._cached_cells
+
+    def __len__(self):
+        return self.steps + 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            first, stop, stride = index.indices(len(self))
+            if stride != 1:
+                return [self[i] for i in range(first, stop, stride)]
+            if stop <= first:
+                return []
+            return Path(self[first], self.codes(first, stop - 1))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("path index out of range")
+        block, offset = divmod(index, Path.CHECKPOINT_INTERVAL)
+        if block == len(self.checkpoints) - 1 and block:
+            block, offset = block - 1, Path.CHECKPOINT_INTERVAL  # the last cell closes the previous block
+        return self._block(block)[offset]
+
+    def __iter__(self):
+        yield self.start
+        for block in range(len(self.checkpoints) - 1):
+            yield from self._block(block)[1:]
+
+    def __reversed__(self):
+        return reversed(self.to_list())
+
+    def __eq__(self, other):
+        if isinstance(other, Path):
+            return (self.start == other.start and self.steps == other.steps
+                    and np.array_equal(self.packed, other.packed))
+        if isinstance(other, (list, tuple)):
+            return len(other) == len(self) and all(
+                tuple(cell) == mine for cell, mine in zip(other, self)
+            )
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Path(start={self.start}, end={self[-1]}, cells={len(self)})"
+
+    @property
+    def nbytes(self):
+        """Memory held by the codes and the checkpoints"""
+        return self.packed.nbytes + self.checkpoints.nbytes
+
+    def to_array(self):
+        """Cells as an (n, 2) int64 array of rows and cols"""
+        cells = np.empty((len(self), 2), dtype=np.int64)
+        cells[0] = self.start
+        np.cumsum(OFFSETS[self.codes()], axis=0, out=cells[1:])
+        cells[1:] += cells[0]
+        return cells
+
+    def to_list(self):
+        """Cells as a list of (row, col) tuples"""
+        return list(map(tuple, self.to_array().tolist()))
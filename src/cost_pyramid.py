@@ -0,0 +1,589 @@
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
+import dem_store
+from ArrayEngine import ArrayEngine
+from heuristics import DIAGONAL_COST, MIN_BATTERY_COST
+from sensors import Sensor
+
+"""
+Passability-preserving cost pyramid for MultiResolutionPathFinder.
+
+A cell of level L stands for a block of 2^L x 2^L full-resolution cells.
+Instead of averaging elevations, which smooths away the cliffs that
+Sensor.is_passable forbids, every level keeps layers derived from the
+full-resolution costs:
+
+- min, max and mean elevation of each block;
+- max slope: the largest elevation difference between a cell of the
+  block and any of its neighbours, so internal cliffs stay visible;
+- crossing: per direction, the cheapest full-resolution move from the
+  block into the neighbouring block, inf when no passable move crosses
+  (diagonal neighbours only touch at a corner, so only the corner move).
+
+Crossings are computed exactly, level by level: a move leaving a block
+of level L leaves one of its four children of level L - 1 through a
+move between children. So two cells of a level are connected exactly
+when some full-resolution move connects their blocks, and a coarse path
+never runs through a wall the full-resolution map does not let through.
+
+A CostLevel turns its layers into cost planes, so ArrayEngine searches it
+like a Sensor: a coarse move costs its crossing, plus a lower estimate of
+walking the 2^L - 1 remaining cells (doubled into blocks with internal
+cliffs), plus the difference of the block mean elevations.
+
+Layers are kept compact: the four elevation layers as int16 metres, the
+DEM's own precision (NO_ELEVATION for none), and crossings as uint16 in
+steps of 1 / COST_SCALE, rounded down so they never exceed the real cost
+(NO_CROSSING for none). That is 6 bytes per full-resolution cell for
+level 1 and 8 for all levels together. With a dataset, each level is
+written once as two dem_store arrays, '<dataset>.pyramid<L>.elevations'
+and '<dataset>.pyramid<L>.crossing', and later opened as read-only memmaps.
+
+CostToGo turns the crossings into an admissible heuristic for a goal, see
+its docstring.
+"""
+
+# Cells of the level below processed at a time while building a level (~128 MB of planes for level 1)
+STRIP_CELLS = 1 << 22
+# Factor on the walking estimate of blocks with a slope above Sensor.PASSABLE_ELEVATION
+CLIFF_PENALTY = 2.0
+# Cells added around start and goal for the first window of search_level
+LEVEL_MARGIN = 16
+# Crossing costs are stored in steps of 1 / COST_SCALE, the largest passable move (~104.4) fits a uint16
+COST_SCALE = 512
+# Stored value of a block without elevations and of a direction no move crosses
+NO_ELEVATION = np.iinfo(np.int16).min
+NO_CROSSING = np.iinfo(np.uint16).max
+# Most blocks a cost-to-go field runs Dijkstra over, see CostToGo and cost_to_go_level
+COST_TO_GO_BLOCKS = 1 << 16
+# Bumped whenever the stored layers change meaning, so older pyramid files are rebuilt
+PYRAMID_VERSION = 2
+# Rows of the elevations layer
+MIN, MAX, MEAN, SLOPE = range(4)
+
+
+def encode_elevations(layer, rounding=np.rint):
+    """Float elevations (NaN for none) as int16, rounded with the given function"""
+    encoded = np.full(layer.shape, NO_ELEVATION, dtype=np.int16)
+    valid = ~np.isnan(layer)
+    encoded[valid] = rounding(layer[valid])
+    return encoded
+
+
+def decode_elevations(layer):
+    """int16 elevations as float32, NaN for none"""
+    return np.where(layer == NO_ELEVATION, np.nan, layer).astype(np.float32)
+
+
+def encode_costs(costs):
+    """Move costs (inf for none) as uint16 steps of 1 / COST_SCALE, rounded down"""
+    with np.errstate(invalid='ignore', over='ignore'):
+        steps = np.floor(np.asarray(costs, dtype=np.float64) * COST_SCALE)
+    return np.where(np.isfinite(steps), np.minimum(steps, NO_CROSSING - 1), NO_CROSSING).astype(np.uint16)
+
+
+def decode_costs(encoded):
+    """uint16 crossing steps as float32 costs, inf for none"""
+    return np.where(encoded == NO_CROSSING, np.inf, encoded / np.float32(COST_SCALE)).astype(np.float32)
+
+
+def _children(layer):
+    """The four children of every block, as views of an even-sized layer"""
+    return layer[0::2, 0::2], layer[0::2, 1::2], layer[1::2, 0::2], layer[1::2, 1::2]
+
+
+def _fmin4(children):
+    return np.fmin(np.fmin(children[0], children[1]), np.fmin(children[2], children[3]))
+
+
+def _fmax4(children):
+    return np.fmax(np.fmax(children[0], children[1]), np.fmax(children[2], children[3]))
+
+
+def _pad_even(layer, fill):
+    rows, cols = layer.shape[-2:]
+    if rows % 2 == 0 and cols % 2 == 0:
+        return layer
+    padding = [(0, 0)] * (layer.ndim - 2) + [(0, rows % 2), (0, cols % 2)]
+    return np.pad(layer, padding, constant_values=fill)
+
+
+def coarsen_crossing(planes):
+    """
+    Crossing planes of the next level from the move costs of the current one.
+
+    Args:
+    planes (ndarray): Move costs (8, rows, cols) in Sensor.NEIGHBOR_OFFSETS order, either
+    floats with inf or encoded crossings with NO_CROSSING for none
+
+    Returns:
+    ndarray: Cheapest move out of each 2x2 block per direction, (8, rows / 2, cols / 2) of the same dtype
+    """
+    none = np.inf if np.issubdtype(planes.dtype, np.floating) else NO_CROSSING
+    return _coarsen_moves(planes, np.fmin, none)
+
+
+def _coarsen_moves(planes, reduce, none):
+    """Reduce per block and direction the values of the moves leaving 2x2 blocks, none for no move"""
+    planes = _pad_even(planes, none)
+    _, rows, cols = planes.shape
+    crossing = np.full((8, rows // 2, cols // 2), none, dtype=planes.dtype)
+    directions = {offset: k for k, offset in enumerate(Sensor.NEIGHBOR_OFFSETS)}
+    for k, (d_row, d_col) in enumerate(Sensor.NEIGHBOR_OFFSETS):
+        for i in (0, 1):
+            for j in (0, 1):
+                block_move = ((i + d_row) // 2, (j + d_col) // 2)
+                if block_move == (0, 0):
+                    continue  # stays inside the block
+                target = crossing[directions[block_move]]
+                reduce(target, planes[k, i::2, j::2], out=target)
+    return crossing
+
+
+class CostLevel:
+    '''
+    One level of the cost pyramid, searchable by ArrayEngine like a Sensor.
+
+    Fields:
+    - level (int): Pyramid level, a cell covers 2^level x 2^level cells
+    - elevations (ndarray): int16 (4, rows, cols): min, max and mean elevation and max slope
+      (rows MIN, MAX, MEAN, SLOPE), NO_ELEVATION for blocks without valid cells
+    - crossing (ndarray): uint16 (8, rows, cols), cheapest move into each neighbouring block,
+      see encode_costs
+    - elevation_map (ndarray): Mean elevations, gives the level's shape to the searches
+    - component (int): Label of the only component whose moves the crossings hold, None for all
+    '''
+
+    LAYERS = ("elevations", "crossing")
+
+    def __init__(self, level, elevations, crossing, component=None):
+        self.level = level
+        self.elevations = elevations
+        self.crossing = crossing
+        self.elevation_map = elevations[MEAN]
+        self.component = component
+
+    def covers(self, label):
+        """Whether the crossings hold every move of the cells with this component label"""
+        return self.component is None or label == self.component
+
+    @property
+    def min_elevation(self):
+        return self.elevations[MIN]
+
+    @property
+    def max_elevation(self):
+        return self.elevations[MAX]
+
+    @property
+    def mean_elevation(self):
+        return self.elevations[MEAN]
+
+    @property
+    def max_slope(self):
+        """Largest elevation difference of a block's cells to their neighbours"""
+        return self.elevations[SLOPE]
+
+    def layers(self):
+        """Layer name -> array, e.g. to store or share the level"""
+        return {name: getattr(self, name) for name in CostLevel.LAYERS}
+
+    @staticmethod
+    def _expected():
+        return {
+            "pyramid_version": PYRAMID_VERSION,
+            "cost_model_version": Sensor.COST_MODEL_VERSION,
+            "cost_scale": COST_SCALE,
+        }
+
+    @staticmethod
+    def _allocate(level, shape, dem_path):
+        """Empty layers of a level, as dem_store arrays when there is a dataset"""
+        shapes = {"elevations": (4,) + shape, "crossing": (8,) + shape}
+        dtypes = {"elevations": np.int16, "crossing": np.uint16}
+        if dem_path is None:
+            return {name: np.empty(shapes[name], dtype=dtypes[name]) for name in CostLevel.LAYERS}
+        return {
+            name: dem_store.create_array(dem_path, f"pyramid{level}.{name}", shapes[name], dtypes[name])
+            for name in CostLevel.LAYERS
+        }
+
+    @classmethod
+    def _finish(cls, level, layers, dem_path, component):
+        if dem_path is None:
+            return cls(level, **layers, component=component)
+        for name, array in layers.items():
+            dem_store.finish_array(
+                dem_path, f"pyramid{level}.{name}", array, component=component, **CostLevel._expected()
+            )
+        return cls.open(dem_path, level)
+
+    @classmethod
+    def open(cls, dem_path, level):
+        """
+        A level stored next to dem_path, memory-mapped read-only.
+
+        Returns:
+        CostLevel: The level, or None when it was not stored yet or is stale
+        """
+        layers = {}
+        for name in CostLevel.LAYERS:
+            layers[name], meta = dem_store.open_array(dem_path, f"pyramid{level}.{name}", **CostLevel._expected())
+            if layers[name] is None:
+                return None
+        return cls(level, **layers, component=meta.get("component"))
+
+    @classmethod
+    def from_sensor(cls, sensor, labels=None, dem_path=None):
+        """
+        Level 1, built from the full-resolution costs a strip of about STRIP_CELLS cells at a time.
+
+        Args:
+        sensor (Sensor): Full-resolution sensor
+        labels (ndarray, optional): Component labels of the map, see reachability.label_components.
+        When given, only moves inside the largest component cross blocks, so isolated
+        passable patches, e.g. the crest of a cliff, cannot join blocks they do not join
+        for the rover.
+        dem_path (str, optional): Dataset to store the level next to, see open
+        """
+        rows, cols = sensor.elevation_map.shape
+        strip_rows = max(2, STRIP_CELLS // cols // 2 * 2)
+        mainland = None if labels is None else _largest_label(labels, strip_rows)
+        layers = CostLevel._allocate(1, ((rows + 1) // 2, (cols + 1) // 2), dem_path)
+        elevations, crossing = layers["elevations"], layers["crossing"]
+
+        for row in range(0, rows, strip_rows):
+            stop = min(rows, row + strip_rows)
+            blocks = slice(row // 2, (stop + 1) // 2)
+            planes = sensor.cost_planes(row, stop, 0, cols)
+            if mainland is not None:
+                _keep_component(planes, labels, mainland, row, stop)
+            crossing[:, blocks] = encode_costs(coarsen_crossing(planes))
+
+            around = sensor.elevation_window(row - 1, stop + 1, -1, cols + 1)
+            elevation = around[1:-1, 1:-1]
+            slope = np.full(elevation.shape, np.nan)
+            with np.errstate(invalid='ignore'):
+                for d_row, d_col in Sensor.NEIGHBOR_OFFSETS:
+                    following = around[1 + d_row:stop - row + 1 + d_row, 1 + d_col:cols + 1 + d_col]
+                    np.fmax(slope, np.abs(following - elevation), out=slope)
+
+            children = _children(_pad_even(elevation, np.nan))
+            elevations[MIN, blocks] = encode_elevations(_fmin4(children), np.floor)
+            elevations[MAX, blocks] = encode_elevations(_fmax4(children), np.ceil)
+            elevations[MEAN, blocks] = encode_elevations(_nanmean(children))
+            elevations[SLOPE, blocks] = encode_elevations(_fmax4(_children(_pad_even(slope, np.nan))), np.ceil)
+        return cls._finish(1, layers, dem_path, mainland)
+
+    def coarsen(self, dem_path=None):
+        """The next level, built from this one a strip of about STRIP_CELLS blocks at a time,
+        and stored next to dem_path if given"""
+        level = self.level + 1
+        rows, cols = self.elevation_map.shape
+        strip_rows = max(2, STRIP_CELLS // cols // 2 * 2)
+        layers = CostLevel._allocate(level, ((rows + 1) // 2, (cols + 1) // 2), dem_path)
+        elevations = layers["elevations"]
+
+        for row in range(0, rows, strip_rows):
+            blocks = slice(row // 2, (min(rows, row + strip_rows) + 1) // 2)
+            children = {
+                layer: _children(_pad_even(decode_elevations(self.elevations[layer, row:row + strip_rows]), np.nan))
+                for layer in (MIN, MAX, MEAN, SLOPE)
+            }
+            elevations[MIN, blocks] = encode_elevations(_fmin4(children[MIN]))
+            elevations[MAX, blocks] = encode_elevations(_fmax4(children[MAX]))
+            elevations[MEAN, blocks] = encode_elevations(_nanmean(children[MEAN]))
+            elevations[SLOPE, blocks] = encode_elevations(_fmax4(children[SLOPE]))
+            layers["crossing"][:, blocks] = coarsen_crossing(np.asarray(self.crossing[:, row:row + strip_rows]))
+        return CostLevel._finish(level, layers, dem_path, self.component)
+
+    def crossing_costs(self, row_start, row_stop, col_start, col_stop):
+        """Decoded crossing costs of a window, float32 (8, rows, cols) with inf for none"""
+        return decode_costs(self.crossing[:, row_start:row_stop, col_start:col_stop])
+
+    def cost_planes(self, row_start, row_stop, col_start, col_stop, dtype=np.float32):
+        """
+        Coarse move costs for every cell of a window, in the layout of Sensor.cost_planes.
+
+        Returns:
+        ndarray: Array of shape (8, rows, cols), inf where no full-resolution move crosses
+        """
+        rows, cols = self.elevation_map.shape
+        height = row_stop - row_start
+        width = col_stop - col_start
+        # the window plus one cell all around, NaN outside the level
+        mean = np.full((height + 2, width + 2), np.nan)
+        slope = np.full((height + 2, width + 2), np.nan)
+        r0, r1 = max(row_start - 1, 0), min(row_stop + 1, rows)
+        c0, c1 = max(col_start - 1, 0), min(col_stop + 1, cols)
+        inside = (slice(r0 - row_start + 1, r1 - row_start + 1), slice(c0 - col_start + 1, c1 - col_start + 1))
+        mean[inside] = decode_elevations(self.elevations[MEAN, r0:r1, c0:c1])
+        slope[inside] = decode_elevations(self.elevations[SLOPE, r0:r1, c0:c1])
+        current = mean[1:height + 1, 1:width + 1]
+        crossing = self.crossing_costs(row_start, row_stop, col_start, col_stop)
+
+        steps = 2 ** self.level - 1
+        planes = np.empty((8, height, width), dtype=dtype)
+        with np.errstate(invalid='ignore'):
+            for k, (d_row, d_col) in enumerate(Sensor.NEIGHBOR_OFFSETS):
+                following = (slice(1 + d_row, height + 1 + d_row), slice(1 + d_col, width + 1 + d_col))
+                base_cost = 1.4142 if d_row != 0 and d_col != 0 else 1.0
+                walking = steps * (base_cost + MIN_BATTERY_COST) * np.where(
+                    slope[following] > Sensor.PASSABLE_ELEVATION, CLIFF_PENALTY, 1.0
+                )
+                costs = crossing[k] + walking + np.abs(mean[following] - current)
+                planes[k] = np.where(np.isnan(costs), np.inf, costs)
+        return planes
+
+    def lower_bound(self, cell, target):
+        """Admissible estimate of the coarse cost between two cells: every coarse move costs at least 2 * 2^level"""
+        return 2.0 * 2 ** self.level * max(abs(cell[0] - target[0]), abs(cell[1] - target[1]))
+
+
+def open_level(sensor, level, below=None, labels=None, dem_path=None):
+    """
+    Level of the cost pyramid stored next to dem_path, building and storing it if needed.
+
+    Args:
+    sensor (Sensor): Full-resolution sensor, level 1 is built from it
+    level (int): Level to return, from 1
+    below (CostLevel, optional): Level level - 1, built first (recursively) when not given
+    labels (ndarray, optional): Component labels, see CostLevel.from_sensor
+    dem_path (str, optional): Dataset the levels are stored next to, nothing is stored without it
+    """
+    stored = CostLevel.open(dem_path, level) if dem_path is not None else None
+    if stored is not None:
+        return stored
+    if level == 1:
+        return CostLevel.from_sensor(sensor, labels=labels, dem_path=dem_path)
+    if below is None:
+        below = open_level(sensor, level - 1, labels=labels, dem_path=dem_path)
+    return below.coarsen(dem_path=dem_path)
+
+
+def _largest_label(labels, strip_rows):
+    """Label of the component with the most cells"""
+    counts = np.zeros(0, dtype=np.int64)
+    for row in range(0, labels.shape[0], strip_rows):
+        strip = np.asarray(labels[row:row + strip_rows])
+        strip_counts = np.bincount(strip[strip >= 0])
+        if len(strip_counts) > len(counts):
+            strip_counts[:len(counts)] += counts
+            counts = strip_counts
+        else:
+            counts[:len(strip_counts)] += strip_counts
+    return int(np.argmax(counts)) if counts.size else None
+
+
+def _keep_component(planes, labels, label, row_start, row_stop):
+    """Set the moves of a strip's cost planes from or to cells outside component label to inf"""
+    rows, cols = labels.shape
+    inside = np.zeros((row_stop - row_start + 2, cols + 2), dtype=bool)
+    r0, r1 = max(row_start - 1, 0), min(row_stop + 1, rows)
+    inside[r0 - row_start + 1:r1 - row_start + 1, 1:-1] = labels[r0:r1] == label
+    height = row_stop - row_start
+    for k, (d_row, d_col) in enumerate(Sensor.NEIGHBOR_OFFSETS):
+        following = inside[1 + d_row:height + 1 + d_row, 1 + d_col:cols + 1 + d_col]
+        planes[k][~(inside[1:-1, 1:-1] & following)] = np.inf
+
+
+def _nanmean(children):
+    total = np.zeros(children[0].shape)
+    count = np.zeros(children[0].shape)
+    for child in children:
+        valid = ~np.isnan(child)
+        total += np.where(valid, child, 0.0)
+        count += valid
+    mean = np.full(children[0].shape, np.nan, dtype=np.float32)
+    np.divide(total, count, out=mean, where=count > 0, casting='unsafe')
+    return mean
+
+
+def cost_to_go_level(window, min_level=1, max_blocks=COST_TO_GO_BLOCKS):
+    """Finest level from min_level on whose blocks cover the full-resolution window in at most max_blocks"""
+    rows, cols = window[1] - window[0], window[3] - window[2]
+    level = min_level
+    # a window not aligned to blocks touches one more block per side
+    while (rows // 2 ** level + 2) * (cols // 2 ** level + 2) > max_blocks:
+        level += 1
+    return level
+
+
+def _crop(start, stop, center, size):
+    """Range of at most size values of start .. stop - 1, around center where possible"""
+    if stop - start <= size:
+        return start, stop
+    first = min(max(start, center - size // 2), stop - size)
+    return first, first + size
+
+
+def distance_bound(rows, cols, goal):
+    """
+    Octile distance plus one battery term per step, from each cell to goal.
+
+    The bound heuristics.TerrainHeuristic builds on, without its elevation
+    term; it drops by at most the cost of any move. rows and cols broadcast.
+    """
+    d_row = np.abs(rows - goal[0])
+    d_col = np.abs(cols - goal[1])
+    straight, diagonal = np.maximum(d_row, d_col), np.minimum(d_row, d_col)
+    return (1.0 + MIN_BATTERY_COST) * straight + (DIAGONAL_COST - 1.0) * diagonal
+
+
+class CostToGo:
+    '''
+    Lower bound of the cost from any cell to one goal, from a reverse Dijkstra over a cost level.
+
+    Every move u -> v costs distance_bound(u) - distance_bound(v) plus a
+    non-negative rest, so a path from x costs distance_bound(x) plus the
+    rests of its moves. The moves from block A into block A' have rests of
+    at least their crossing minus the largest drop of the bound among them.
+    Dijkstra from the goal's block over these weights gives, per block, a
+    lower bound D of the rests of the crossings left to make. Moves inside
+    blocks are left out, their rests are only known not to be negative.
+
+    Dijkstra only covers a window of at most max_blocks blocks around the
+    goal. A path leaving it re-enters it for good through a border block,
+    so D is capped by the smallest D on the border and the bound
+    distance_bound(x) + D holds for every path. The work per field is
+    bounded by max_blocks whatever the span of the query; long queries
+    pick a coarser level, see cost_to_go_level.
+
+    Fields:
+    - level (int): Pyramid level the Dijkstra runs on
+    - goal (tuple): Full-resolution goal (row, col)
+    - window (tuple): Block window (row_start, row_stop, col_start, col_stop) of the level
+    - distances (ndarray): D per block of the window, float64, inf where the goal cannot be reached
+    - border (float): Smallest D on the border of the window, inf when it covers the level
+    '''
+
+    def __init__(self, cost_level, goal, window, max_blocks=COST_TO_GO_BLOCKS):
+        """
+        Args:
+        cost_level (CostLevel): Level to run Dijkstra on, its blocks are the cells of distances
+        goal (tuple): Full-resolution goal (row, col), inside window
+        window (tuple): Full-resolution window (row_start, row_stop, col_start, col_stop),
+        widened to whole blocks and cropped around the goal to max_blocks blocks
+        max_blocks (int): Most blocks of the window
+        """
+        size = 2 ** cost_level.level
+        level_rows, level_cols = cost_level.elevation_map.shape
+        row_start, row_stop, col_start, col_stop = window
+        self.level = cost_level.level
+        self.goal = (int(goal[0]), int(goal[1]))
+        block_rows = (max(0, row_start // size), min(level_rows, -(-row_stop // size)))
+        block_cols = (max(0, col_start // size), min(level_cols, -(-col_stop // size)))
+        height = block_rows[1] - block_rows[0]
+        height = min(height, max(int(max_blocks ** 0.5), max_blocks // (block_cols[1] - block_cols[0])))
+        width = min(block_cols[1] - block_cols[0], max_blocks // height)
+        self.window = (
+            _crop(*block_rows, self.goal[0] // size, height) + _crop(*block_cols, self.goal[1] // size, width)
+        )
+        block_row_start, block_row_stop, block_col_start, block_col_stop = self.window
+
+        crossing = cost_level.crossing_costs(*self.window)
+        with np.errstate(invalid='ignore'):
+            rests = np.where(np.isfinite(crossing), np.maximum(crossing - self._drops(size), 0.0), np.inf)
+        graph = Sensor.moves_graph(rests)
+        width = block_col_stop - block_col_start
+        goal_index = (self.goal[0] // size - block_row_start) * width + (self.goal[1] // size - block_col_start)
+        # distances to the goal are distances from it over the reversed moves
+        distances = dijkstra(graph.T, directed=True, indices=goal_index)
+        self.distances = distances.reshape(crossing.shape[1:])
+
+        border = [self.distances[0]] if block_row_start > 0 else []
+        if block_row_stop < level_rows:
+            border.append(self.distances[-1])
+        if block_col_start > 0:
+            border.append(self.distances[:, 0])
+        if block_col_stop < level_cols:
+            border.append(self.distances[:, -1])
+        self.border = float(min(line.min() for line in border)) if border else float('inf')
+        self._flat = memoryview(np.minimum(self.distances, self.border).reshape(-1))
+        self._width = width
+
+    def _drops(self, size):
+        """
+        Upper bound of the drop of distance_bound over the moves between each pair of blocks, (8, rows, cols).
+
+        distance_bound is convex, so a move x -> x + step lowers it by at
+        most -g . step for any subgradient g at x, and the subgradients over
+        a block are spanned by the gradients of the linear pieces of the
+        bound that meet the block.
+        """
+        block_row_start, block_row_stop, block_col_start, block_col_stop = self.window
+        # offsets from the goal of the first and last cell of every block row and column
+        u_first = np.arange(block_row_start, block_row_stop)[:, None] * size - self.goal[0]
+        u_last = u_first + size - 1
+        v_first = np.arange(block_col_start, block_col_stop)[None, :] * size - self.goal[1]
+        v_last = v_first + size - 1
+        u_far, u_near = np.maximum(-u_first, u_last), np.maximum(np.maximum(u_first, -u_last), 0)
+        v_far, v_near = np.maximum(-v_first, v_last), np.maximum(np.maximum(v_first, -v_last), 0)
+
+        straight, diagonal = 1.0 + MIN_BATTERY_COST, DIAGONAL_COST - 1.0
+        # (blocks the piece meets, gradient along rows, gradient along cols)
+        pieces = []
+        for u_sign, u_meets in ((1, u_last >= 0), (-1, u_first <= 0)):
+            for v_sign, v_meets in ((1, v_last >= 0), (-1, v_first <= 0)):
+                meets = u_meets & v_meets
+                pieces.append((meets & (u_far >= v_near), straight * u_sign, diagonal * v_sign))
+                pieces.append((meets & (v_far >= u_near), diagonal * u_sign, straight * v_sign))
+
+        drops = np.full((8, block_row_stop - block_row_start, block_col_stop - block_col_start), -np.inf)
+        for k, (d_row, d_col) in enumerate(Sensor.NEIGHBOR_OFFSETS):
+            # full-resolution moves into the next block follow the block move where it moves
+            steps = [
+                (step_row, step_col)
+                for step_row in ((d_row,) if d_row else (-1, 0, 1))
+                for step_col in ((d_col,) if d_col else (-1, 0, 1))
+                if (step_row, step_col) != (0, 0)
+            ]
+            for meets, gradient_row, gradient_col in pieces:
+                drop = max(-(gradient_row * step_row + gradient_col * step_col) for step_row, step_col in steps)
+                np.fmax(drops[k], np.where(meets, drop, -np.inf), out=drops[k])
+        return drops
+
+    def lower_bound(self, cell):
+        """Admissible estimate of the cost from cell, (row, col), to the goal"""
+        d_row = abs(cell[0] - self.goal[0])
+        d_col = abs(cell[1] - self.goal[1])
+        straight, diagonal = (d_row, d_col) if d_row > d_col else (d_col, d_row)
+        bound = (1.0 + MIN_BATTERY_COST) * straight + (DIAGONAL_COST - 1.0) * diagonal
+
+        block_row = (cell[0] >> self.level) - self.window[0]
+        block_col = (cell[1] >> self.level) - self.window[2]
+        if 0 <= block_row < self.window[1] - self.window[0] and 0 <= block_col < self._width:
+            return bound + self._flat[block_row * self._width + block_col]
+        return bound + self.border
+
+
+def search_level(cost_level, start, goal, max_iterations=None):
+    """
+    Search a cost level between two of its cells.
+
+    The window starts around start and goal and is doubled whenever a
+    move leaving it could still lead to a cheaper path, as in
+    PathFinderBase._array_search.
+
+    Returns:
+    Path: Coarse path from start to goal, or None if their blocks are not connected
+    or max_iterations was exceeded
+    """
+    rows, cols = cost_level.elevation_map.shape
+    margin = max(LEVEL_MARGIN, max(abs(start[0] - goal[0]), abs(start[1] - goal[1])) // 2)
+
+    def heuristic(r, c):
+        return cost_level.lower_bound((r, c), goal)
+
+    while True:
+        window = (
+            max(0, min(start[0], goal[0]) - margin), min(rows, max(start[0], goal[0]) + margin + 1),
+            max(0, min(start[1], goal[1]) - margin), min(cols, max(start[1], goal[1]) + margin + 1),
+        )
+        engine = ArrayEngine(cost_level, window)
+        path = engine.search(start, goal, heuristic, max_iterations=max_iterations)
+        if engine.truncated:
+            return None
+        if engine.exit_bound >= engine.cost or window == (0, rows, 0, cols):
+            return path
+        margin *= 2
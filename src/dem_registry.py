@@ -0,0 +1,117 @@
+import os
+import threading
+import numpy as np
+import dem_store
+import transformations
+from dem_tiles import TiledElevation
+from dem_window import WindowedElevation
+from sensors import Sensor
+
+"""
+Process-wide registry of loaded elevation datasets.
+
+Every pathfinder (and every robot through its pathfinder) asks the
+registry for its DEM instead of reading the raster itself, so a dataset
+is read and held in memory once no matter how many objects use it.
+Entries are reference counted and dropped when the last user releases them.
+Elevations are memory-mapped from the dataset's dem_store backing file,
+so only the pages a search touches are ever read from disk, or, with the
+"tiled" storage, streamed through a TiledElevation cache, or, with the
+"window" storage, read as one WindowedElevation around the current query.
+The memmap storage also maps the clamped, nodata-filled elevations of
+Sensor.fill_elevations, computed once per dataset and stored next to it.
+"""
+
+# How elevations are backed: memory-mapped store, LRU tile cache or query window
+STORAGES = ("memmap", "tiled", "window")
+
+_registry = {}
+_lock = threading.Lock()
+
+
+class DEM:
+    '''
+    A loaded elevation dataset shared between users.
+
+    Fields:
+    - path (str): Absolute path of the dataset
+    - storage (str): How the elevations are backed, one of STORAGES
+    - elevation_map (ndarray): Read-only memory-mapped view of band 1, a TiledElevation or a WindowedElevation
+    - filled_map (ndarray): Read-only memory-mapped Sensor.fill_elevations of band 1, None unless storage is "memmap"
+    - affine_transform (Affine): Pixel to map coordinates transform
+    - crs (CRS): Coordinate reference system of the dataset
+    - nodata (float): Nodata value declared by the dataset, if any
+    - transformer (Transformer): Map coordinates to lat/long
+    - reverse_transformer (Transformer): Lat/long to map coordinates
+    - refcount (int): Number of users currently holding the dataset
+    '''
+
+    def __init__(self, path, elevation_map, affine_transform, crs, nodata=None, storage="memmap", filled_map=None):
+        self.path = path
+        self.storage = storage
+        self.filled_map = filled_map
+        if isinstance(elevation_map, (TiledElevation, WindowedElevation)):
+            self.elevation_map = elevation_map
+        else:
+            self.elevation_map = elevation_map.view()
+            self.elevation_map.flags.writeable = False
+        self.affine_transform = affine_transform
+        self.crs = crs
+        self.nodata = nodata
+        self.transformer = transformations.setup_transformer(crs)
+        self.reverse_transformer = transformations.setup_reverse_transformer(crs)
+        self.refcount = 0
+
+
+def _read(path, storage):
+    if storage in ("tiled", "window"):
+        elevation_map = TiledElevation(path) if storage == "tiled" else WindowedElevation(path)
+        dataset = elevation_map.dataset
+        return DEM(path, elevation_map, dataset.transform, dataset.crs, dataset.nodata, storage=storage)
+
+    elevation_map, affine_transform, crs, nodata = dem_store.open_dem(path)
+    filled_map = _open_filled(path, elevation_map)
+    return DEM(path, elevation_map, affine_transform, crs, nodata, storage=storage, filled_map=filled_map)
+
+
+def _open_filled(path, elevation_map):
+    """Stored Sensor.fill_elevations of the dataset, computed on first use"""
+    expected = {"cost_model_version": Sensor.COST_MODEL_VERSION}
+    filled_map, _ = dem_store.open_array(path, "filled", **expected)
+    if filled_map is None:
+        out = dem_store.create_array(path, "filled", elevation_map.shape, np.float32)
+        Sensor.fill_elevations(elevation_map, out=out)
+        dem_store.finish_array(path, "filled", out, **expected)
+        filled_map, _ = dem_store.open_array(path, "filled", **expected)
+    return filled_map
+
+
+def acquire(path, storage="memmap"):
+    """Return the shared DEM for path and storage, loading it on first use"""
+    if storage not in STORAGES:
+        raise ValueError(f"Unknown DEM storage '{storage}', expected one of {STORAGES}")
+    key = (os.path.abspath(path), storage)
+    with _lock:
+        dem = _registry.get(key)
+        if dem is None:
+            dem = _read(key[0], storage)
+            _registry[key] = dem
+        dem.refcount += 1
+        return dem
+
+
+def release(dem):
+    """Give back a DEM obtained from acquire; the last release drops it"""
+    key = (dem.path, dem.storage)
+    with _lock:
+        dem.refcount -= 1
+        if dem.refcount <= 0 and _registry.get(key) is dem:
+            del _registry[key]
+            if isinstance(dem.elevation_map, (TiledElevation, WindowedElevation)):
+                dem.elevation_map.close()
+
+
+def loaded():
+    """Paths of the datasets currently held by the registry"""
+    with _lock:
+        return [path for path, _ in _registry]
@@ -0,0 +1,143 @@
+import os
+import json
+import pickle
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+"""
+Memory-mappable arrays stored next to an elevation dataset.
+
+Each array is a raw file '<dataset>.<kind>.memmap' plus a small JSON
+sidecar '<dataset>.<kind>.memmap.json' with its shape, dtype and any
+extra metadata. The sidecar also records the size and modification time
+of the source dataset, so arrays derived from an older dataset are
+recognised as stale and rebuilt. The sidecar is written last, so an
+interrupted build is never picked up.
+
+Derived data that is not an array (graphs, tables) is pickled to
+'<dataset>.<kind>.pickle' together with the same kind of metadata.
+"""
+
+# Rows converted per rasterio read when building the elevation store
+BLOCK_ROWS = 1024
+
+
+def store_path(dem_path, kind, extension="memmap"):
+    """Path of the file of the given kind derived from dem_path"""
+    return f"{os.path.splitext(dem_path)[0]}.{kind}.{extension}"
+
+
+def source_stamp(dem_path):
+    stat = os.stat(dem_path)
+    return {"source_size": stat.st_size, "source_mtime": stat.st_mtime}
+
+
+def open_array(dem_path, kind, **expected):
+    """
+    Open a stored array read-only.
+
+    Args:
+    dem_path (str): Dataset the array was derived from
+    kind (str): Name of the derived array
+    expected: Metadata entries that must match, e.g. a cost-model version
+
+    Returns:
+    (memmap, dict): The array and its metadata, or (None, None) when missing or stale
+    """
+    path = store_path(dem_path, kind)
+    try:
+        with open(path + ".json") as sidecar:
+            meta = json.load(sidecar)
+    except (OSError, ValueError):
+        return None, None
+
+    wanted = dict(source_stamp(dem_path), **expected)
+    if any(meta.get(key) != value for key, value in wanted.items()):
+        return None, None
+
+    array = np.memmap(path, dtype=np.dtype(meta["dtype"]), mode="r", shape=tuple(meta["shape"]))
+    return array, meta
+
+
+def create_array(dem_path, kind, shape, dtype):
+    """Create a writable array to be filled and then passed to finish_array"""
+    return np.memmap(store_path(dem_path, kind), dtype=np.dtype(dtype), mode="w+", shape=tuple(shape))
+
+
+def finish_array(dem_path, kind, array, **meta):
+    """Flush an array from create_array and write its sidecar"""
+    array.flush()
+    meta = dict(meta, **source_stamp(dem_path))
+    meta["shape"] = list(array.shape)
+    meta["dtype"] = np.dtype(array.dtype).str
+    path = store_path(dem_path, kind)
+    with open(path + ".json", "w") as sidecar:
+        json.dump(meta, sidecar)
+
+
+def save_array(dem_path, kind, array, **meta):
+    """Store an in-memory array and return it reopened as a read-only memmap"""
+    stored = create_array(dem_path, kind, array.shape, array.dtype)
+    stored[...] = array
+    finish_array(dem_path, kind, stored, **meta)
+    return open_array(dem_path, kind)[0]
+
+
+def save_object(dem_path, kind, obj, **meta):
+    """Pickle obj next to dem_path along with its metadata"""
+    meta = dict(meta, **source_stamp(dem_path))
+    with open(store_path(dem_path, kind, "pickle"), "wb") as stored:
+        pickle.dump({"meta": meta, "data": obj}, stored, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_object(dem_path, kind, **expected):
+    """Object stored by save_object, or None when missing or stale"""
+    try:
+        with open(store_path(dem_path, kind, "pickle"), "rb") as stored:
+            content = pickle.load(stored)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+    wanted = dict(source_stamp(dem_path), **expected)
+    if any(content["meta"].get(key) != value for key, value in wanted.items()):
+        return None
+    return content["data"]
+
+
+def convert_dem(dem_path):
+    """
+    One-time conversion of band 1 of a GeoTIFF into a memory-mappable elevation store.
+
+    The raster is copied in blocks of BLOCK_ROWS rows, so the whole dataset
+    is never decoded into memory at once.
+    """
+    with rasterio.open(dem_path) as data:
+        elevation = create_array(dem_path, "elevation", data.shape, data.dtypes[0])
+        for row in range(0, data.height, BLOCK_ROWS):
+            rows = min(BLOCK_ROWS, data.height - row)
+            elevation[row:row + rows] = data.read(1, window=Window(0, row, data.width, rows))
+
+        finish_array(
+            dem_path, "elevation", elevation,
+            transform=list(data.transform)[:6],
+            crs=data.crs.to_wkt(),
+            nodata=data.nodata,
+        )
+
+
+def open_dem(dem_path):
+    """
+    Memory-map the elevation store of dem_path, converting the dataset first if needed.
+
+    Returns:
+    (memmap, Affine, CRS, nodata): Elevation array and the dataset's georeferencing
+    """
+    elevation, meta = open_array(dem_path, "elevation")
+    if elevation is None:
+        convert_dem(dem_path)
+        elevation, meta = open_array(dem_path, "elevation")
+
+    affine_transform = rasterio.Affine(*meta["transform"])
+    crs = rasterio.crs.CRS.from_wkt(meta["crs"])
+    return elevation, affine_transform, crs, meta["nodata"]
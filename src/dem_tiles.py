@@ -0,0 +1,144 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+"""
+Tile-streamed access to an elevation dataset.
+
+TiledElevation stands in for the elevation array wherever Sensor and the
+pathfinders index it. Fixed-size tiles are read with rasterio windows the
+first time a search touches them and kept in an LRU cache bounded by a
+byte budget, so memory follows the explored area instead of the planet.
+"""
+
+
+class TiledElevation:
+    '''
+    Read-only, array-like view of band 1 of a raster, loaded tile by tile.
+
+    Supports the indexing the pathfinders use: elevation_map[row, col],
+    rectangular slices and integer index arrays.
+
+    Fields:
+    - shape (tuple): (rows, cols) of the whole raster
+    - dtype (dtype): Data type of the raster
+    - tile_size (int): Edge length of a tile in cells
+    - budget (int): Maximum number of bytes of tiles kept in the cache
+    - hits, misses, evictions (int): Cache counters, see stats()
+    '''
+
+    DEFAULT_TILE_SIZE = 512
+    DEFAULT_BUDGET = 256 * 2**20
+
+    def __init__(self, path, tile_size=DEFAULT_TILE_SIZE, budget=DEFAULT_BUDGET):
+        self.dataset = rasterio.open(path)
+        self.shape = self.dataset.shape
+        self.ndim = 2
+        self.dtype = np.dtype(self.dataset.dtypes[0])
+        self.tile_size = tile_size
+        self.budget = budget
+
+        self.tiles = OrderedDict()
+        self.cached_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def close(self):
+        self.dataset.close()
+        self.tiles.clear()
+        self.cached_bytes = 0
+
+    def stats(self):
+        """Cache counters, used to size the budget"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "tiles": len(self.tiles),
+            "cached_bytes": self.cached_bytes,
+        }
+
+    def tile(self, tile_row, tile_col):
+        """Return one tile, reading it from the dataset on a miss"""
+        key = (tile_row, tile_col)
+        with self._lock:
+            tile = self.tiles.get(key)
+            if tile is not None:
+                self.hits += 1
+                self.tiles.move_to_end(key)
+                return tile
+
+            self.misses += 1
+            row, col = tile_row * self.tile_size, tile_col * self.tile_size
+            window = Window(
+                col, row,
+                min(self.tile_size, self.shape[1] - col),
+                min(self.tile_size, self.shape[0] - row),
+            )
+            tile = self.dataset.read(1, window=window)
+            tile.flags.writeable = False
+
+            self.tiles[key] = tile
+            self.cached_bytes += tile.nbytes
+            # always keep the tile just read, even if it alone exceeds the budget
+            while self.cached_bytes > self.budget and len(self.tiles) > 1:
+                _, evicted = self.tiles.popitem(last=False)
+                self.cached_bytes -= evicted.nbytes
+                self.evictions += 1
+            return tile
+
+    def __getitem__(self, key):
+        rows, cols = key
+        if isinstance(rows, slice) or isinstance(cols, slice):
+            return self._read_block(rows, cols)
+        if np.ndim(rows) or np.ndim(cols):
+            return self._read_cells(np.asarray(rows), np.asarray(cols))
+
+        row, col = self._check(int(rows), self.shape[0]), self._check(int(cols), self.shape[1])
+        size = self.tile_size
+        return self.tile(row // size, col // size)[row % size, col % size]
+
+    def __array__(self, dtype=None, copy=None):
+        block = self._read_block(slice(None), slice(None))
+        return block if dtype is None else block.astype(dtype)
+
+    def _check(self, index, length):
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError(f"index {index} is out of bounds for axis with size {length}")
+        return index
+
+    def _read_block(self, rows, cols):
+        rows = rows if isinstance(rows, slice) else slice(rows, rows + 1)
+        cols = cols if isinstance(cols, slice) else slice(cols, cols + 1)
+        row_start, row_stop, _ = rows.indices(self.shape[0])
+        col_start, col_stop, _ = cols.indices(self.shape[1])
+        block = np.empty((max(row_stop - row_start, 0), max(col_stop - col_start, 0)), dtype=self.dtype)
+
+        size = self.tile_size
+        for tile_row in range(row_start // size, (row_stop - 1) // size + 1 if row_stop > row_start else 0):
+            r0 = max(row_start, tile_row * size)
+            r1 = min(row_stop, (tile_row + 1) * size)
+            for tile_col in range(col_start // size, (col_stop - 1) // size + 1 if col_stop > col_start else 0):
+                c0 = max(col_start, tile_col * size)
+                c1 = min(col_stop, (tile_col + 1) * size)
+                tile = self.tile(tile_row, tile_col)
+                block[r0 - row_start:r1 - row_start, c0 - col_start:c1 - col_start] = \
+                    tile[r0 - tile_row * size:r1 - tile_row * size, c0 - tile_col * size:c1 - tile_col * size]
+        return block
+
+    def _read_cells(self, rows, cols):
+        rows, cols = np.broadcast_arrays(rows, cols)
+        values = np.empty(rows.shape, dtype=self.dtype)
+        size = self.tile_size
+        tile_ids = (rows // size) * (self.shape[1] // size + 1) + cols // size
+        for tile_id in np.unique(tile_ids):
+            selected = tile_ids == tile_id
+            tile_row, tile_col = divmod(int(tile_id), self.shape[1] // size + 1)
+            values[selected] = self.tile(tile_row, tile_col)[rows[selected] % size, cols[selected] % size]
+        return values
@@ -0,0 +1,173 @@
+import threading
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+"""
+Bounding-box access to an elevation dataset for single queries.
+
+WindowedElevation stands in for the elevation array and only holds the
+rasterio Window around the current query. It is indexed with global
+(row, col) coordinates and translates them to the window itself; when a
+search reaches past the window, the window grows to cover it. Cold-start
+cost for a query is proportional to the mission size, not the planet.
+
+The dataset is shared through dem_registry, but a window belongs to one
+query, so every pathfinder searches its own view() of it. The window and
+its data are published together as one block, so a lookup never pairs
+the data of one window with the origin of another.
+"""
+
+
+class WindowedElevation:
+    '''
+    Read-only, array-like view of band 1 of a raster, backed by one window.
+
+    Fields:
+    - shape (tuple): (rows, cols) of the whole raster
+    - dtype (dtype): Data type of the raster
+    - window (tuple): Global (row_start, row_stop, col_start, col_stop) currently held
+    - data (ndarray): Elevations of window
+    - margin (int): Cells added around a query and around every growth
+    - reads (int): Number of rasterio window reads so far
+    '''
+
+    DEFAULT_MARGIN = 128
+
+    def __init__(self, path, margin=DEFAULT_MARGIN, parent=None):
+        if parent is None:
+            self.dataset = rasterio.open(path)
+            # rasterio datasets are not thread-safe, so all views read under one lock
+            self._read_lock = threading.Lock()
+        else:
+            self.dataset = parent.dataset
+            self._read_lock = parent._read_lock
+        self._owner = parent is None
+        self.shape = self.dataset.shape
+        self.ndim = 2
+        self.dtype = np.dtype(self.dataset.dtypes[0])
+        self.margin = margin
+
+        # (window, data), replaced as a whole so readers see a consistent pair
+        self._block = ((0, 0, 0, 0), np.empty((0, 0), dtype=self.dtype))
+        self.reads = 0
+        self._lock = threading.Lock()
+
+    @property
+    def window(self):
+        return self._block[0]
+
+    @property
+    def data(self):
+        return self._block[1]
+
+    def view(self):
+        """A WindowedElevation over the same dataset with a window of its own"""
+        return WindowedElevation(self.dataset.name, margin=self.margin, parent=self)
+
+    def close(self):
+        """Drop the window; the view that opened the dataset also closes it"""
+        with self._lock:
+            self._block = ((0, 0, 0, 0), np.empty((0, 0), dtype=self.dtype))
+        if self._owner:
+            with self._read_lock:
+                self.dataset.close()
+
+    def focus(self, start, goal, margin=None):
+        """Replace the window with the bounding box of start and goal plus margin"""
+        if margin is not None:
+            self.margin = margin
+        margin = self.margin
+        rows = (min(start[0], goal[0]) - margin, max(start[0], goal[0]) + margin + 1)
+        cols = (min(start[1], goal[1]) - margin, max(start[1], goal[1]) + margin + 1)
+        with self._lock:
+            self._load(self._clip(rows[0], rows[1], cols[0], cols[1]))
+
+    def to_window(self, row, col):
+        """Global (row, col) to coordinates inside the current window"""
+        window = self.window
+        return row - window[0], col - window[2]
+
+    def to_global(self, row, col):
+        """Coordinates inside the current window to global (row, col)"""
+        window = self.window
+        return row + window[0], col + window[2]
+
+    def _clip(self, row_start, row_stop, col_start, col_stop):
+        return (
+            max(0, row_start), min(self.shape[0], row_stop),
+            max(0, col_start), min(self.shape[1], col_stop),
+        )
+
+    def _load(self, window):
+        """Read window and publish it with its data; called with self._lock held"""
+        row_start, row_stop, col_start, col_stop = window
+        with self._read_lock:
+            data = self.dataset.read(
+                1, window=Window(col_start, row_start, col_stop - col_start, row_stop - row_start)
+            )
+        data.flags.writeable = False
+        self._block = (window, data)
+        self.reads += 1
+
+    def _cover(self, row_start, row_stop, col_start, col_stop):
+        """Grow the window so it holds the given global block; returns the (window, data) holding it"""
+        block = self._block
+        w_row_start, w_row_stop, w_col_start, w_col_stop = block[0]
+        if (w_row_start <= row_start and row_stop <= w_row_stop
+                and w_col_start <= col_start and col_stop <= w_col_stop):
+            return block
+
+        with self._lock:
+            block = self._block
+            w_row_start, w_row_stop, w_col_start, w_col_stop = block[0]
+            if (w_row_start <= row_start and row_stop <= w_row_stop
+                    and w_col_start <= col_start and col_stop <= w_col_stop):
+                return block  # another thread grew it meanwhile
+            if w_row_stop > w_row_start:
+                # grow by at least half the current size so a search walking
+                # out of the window triggers only a few reads
+                grow = max(self.margin, (w_row_stop - w_row_start) // 2, (w_col_stop - w_col_start) // 2)
+                row_start = min(row_start - grow, w_row_start) if row_start < w_row_start else w_row_start
+                row_stop = max(row_stop + grow, w_row_stop) if row_stop > w_row_stop else w_row_stop
+                col_start = min(col_start - grow, w_col_start) if col_start < w_col_start else w_col_start
+                col_stop = max(col_stop + grow, w_col_stop) if col_stop > w_col_stop else w_col_stop
+            else:
+                row_start, row_stop = row_start - self.margin, row_stop + self.margin
+                col_start, col_stop = col_start - self.margin, col_stop + self.margin
+            self._load(self._clip(row_start, row_stop, col_start, col_stop))
+            return self._block
+
+    def __getitem__(self, key):
+        rows, cols = key
+        if isinstance(rows, slice) or isinstance(cols, slice):
+            rows = rows if isinstance(rows, slice) else slice(rows, rows + 1)
+            cols = cols if isinstance(cols, slice) else slice(cols, cols + 1)
+            row_start, row_stop, _ = rows.indices(self.shape[0])
+            col_start, col_stop, _ = cols.indices(self.shape[1])
+            if row_stop <= row_start or col_stop <= col_start:
+                return np.empty((max(row_stop - row_start, 0), max(col_stop - col_start, 0)), dtype=self.dtype)
+            window, data = self._cover(row_start, row_stop, col_start, col_stop)
+            r0, c0 = row_start - window[0], col_start - window[2]
+            return data[r0:r0 + row_stop - row_start, c0:c0 + col_stop - col_start]
+
+        if np.ndim(rows) or np.ndim(cols):
+            rows, cols = np.broadcast_arrays(np.asarray(rows), np.asarray(cols))
+            if rows.size == 0:
+                return np.empty(rows.shape, dtype=self.dtype)
+            window, data = self._cover(int(rows.min()), int(rows.max()) + 1, int(cols.min()), int(cols.max()) + 1)
+            return data[rows - window[0], cols - window[2]]
+
+        row, col = int(rows), int(cols)
+        if row < 0:
+            row += self.shape[0]
+        if col < 0:
+            col += self.shape[1]
+        if not (0 <= row < self.shape[0] and 0 <= col < self.shape[1]):
+            raise IndexError(f"index ({row}, {col}) is out of bounds for shape {self.shape}")
+        window, data = self._cover(row, row + 1, col, col + 1)
+        return data[row - window[0], col - window[2]]
+
+    def __array__(self, dtype=None, copy=None):
+        block = self[:, :]
+        return block if dtype is None else block.astype(dtype)
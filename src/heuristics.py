@@ -0,0 +1,72 @@
+"""
+Heuristics for the pathfinders, set with PathFinderBase.set_heuristic.
+
+Every move charged by Sensor.get_cost costs its base distance (1 or
+1.4142), plus the absolute elevation difference, plus a battery term of
+at least 1.0 for any passable move. Summed along a path, the elevation
+terms are at least |elevation(goal) - elevation(n)|, the base terms are
+at least the octile distance and the battery terms are at least the
+number of steps, i.e. the Chebyshev distance. TerrainHeuristic adds the
+three, so it never overestimates and is consistent.
+
+A weight above 1 turns any heuristic into a bounded-suboptimal one: A*
+then returns paths costing at most weight times the optimum, usually
+after expanding far fewer nodes.
+"""
+
+DIAGONAL_COST = 1.4142
+# Smallest battery term of a passable move in Sensor.get_cost
+MIN_BATTERY_COST = 1.0
+
+
+class Heuristic:
+    '''
+    Straight-line distance, the estimate the pathfinders have always used.
+
+    Fields:
+    - weight (float): Factor applied to the lower bound, 1.0 keeps the search optimal
+    '''
+
+    def __init__(self, weight=1.0):
+        if weight < 1.0:
+            raise ValueError(f"Heuristic weight must be at least 1.0, got {weight}")
+        self.weight = weight
+
+    def lower_bound(self, sensor, cell, target):
+        """Admissible estimate of the cost of a path between cell and target, both (row, col)"""
+        return ((cell[0] - target[0])**2 + (cell[1] - target[1])**2)**0.5
+
+    def __call__(self, sensor, cell, target):
+        return self.weight * self.lower_bound(sensor, cell, target)
+
+
+class TerrainHeuristic(Heuristic):
+    '''
+    Elevation-aware lower bound: |elevation difference| + octile distance + Chebyshev distance.
+
+    Elevations are read through Sensor.get_elevation_at_position, so missing
+    values and clamping match the costs exactly. The elevation of the last
+    target is cached, since a search asks about the same target every time.
+    '''
+
+    def __init__(self, weight=1.0):
+        super().__init__(weight)
+        self._target = None
+        self._target_elevation = None
+
+    def _elevation(self, sensor, cell):
+        return sensor.get_elevation_at_position(cell[1], cell[0])
+
+    def lower_bound(self, sensor, cell, target):
+        d_row = abs(cell[0] - target[0])
+        d_col = abs(cell[1] - target[1])
+        straight, diagonal = max(d_row, d_col), min(d_row, d_col)
+        bound = straight - diagonal + DIAGONAL_COST * diagonal + MIN_BATTERY_COST * straight
+
+        if target != self._target:
+            self._target = target
+            self._target_elevation = self._elevation(sensor, target)
+        elevation = self._elevation(sensor, cell)
+        if elevation is not None and self._target_elevation is not None:
+            bound += abs(self._target_elevation - elevation)
+        return bound
@@ -0,0 +1,177 @@
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
+import dem_store
+from cost_pyramid import open_level
+from reachability import ReachabilityIndex
+from sensors import Sensor
+
+"""
+ALT (A*, Landmarks, Triangle inequality) lower bounds.
+
+A few landmark cells are chosen and the cost of the cheapest path from
+every cell to each landmark is precomputed with Dijkstra under the real
+cost model. Movement costs are symmetric, so for any landmark L the
+triangle inequality gives
+
+    cost(n, goal) >= |d(L, goal) - d(L, n)|
+
+and the largest of these bounds over all landmarks is an admissible and
+consistent heuristic. Unlike the straight-line distance it accounts for
+the elevation and battery terms of Sensor.get_cost.
+
+Landmarks are picked by farthest-point selection: each new landmark is
+the reachable cell farthest from the landmarks chosen so far, which puts
+them on the rim of the map where their bounds are tightest.
+
+Maps of more than LANDMARK_CELLS cells get their tables on the finest
+level of the cost pyramid that fits, one distance per block. Each block
+crossing costs at most the cheapest full-resolution move between the two
+blocks, so block distances are a metric that never exceeds the true
+cost, and the triangle inequality bounds hold for it just the same. The
+level keeps only the moves of the largest component, so its bounds are
+used for goals in that component only.
+"""
+
+# Landmarks chosen when none are requested explicitly
+LANDMARK_COUNT = 8
+# Largest grid, in cells or blocks, whose graph is searched for the tables (~400 MB of graph)
+LANDMARK_CELLS = 1 << 22
+# Distances are stored as float32; bounds are shrunk by this relative
+# amount so rounding can never make them overestimate
+ROUNDING_SLACK = 2.5e-7
+
+
+def landmark_level(shape, max_cells=LANDMARK_CELLS):
+    """Finest pyramid level with at most max_cells blocks for a map of the given shape, 0 for the map itself"""
+    rows, cols = shape
+    level = 0
+    while -(-rows // 2 ** level) * -(-cols // 2 ** level) > max_cells:
+        level += 1
+    return level
+
+
+def select_landmarks(graph, shape, count=LANDMARK_COUNT, out=None):
+    """
+    Choose landmarks on a grid graph and compute the distance of every node to each of them.
+
+    Args:
+    graph (csr_matrix): Moves between the cells of the grid, see Sensor.moves_graph
+    shape (tuple): Grid (rows, cols), node ids are flat row-major indices
+    count (int): Number of landmarks
+    out (ndarray, optional): float32 array of shape (rows, cols, count) to write the distances into
+
+    Returns:
+    (list, ndarray): Landmark nodes (row, col) and the distances, inf where unreachable
+    """
+    rows, cols = shape
+    distances = np.empty((rows, cols, count), dtype=np.float32) if out is None else out
+
+    # seed the farthest-point selection from the node with moves closest to the centre
+    nodes = np.flatnonzero(np.diff(graph.indptr))
+    if not nodes.size:
+        nodes = np.arange(rows * cols)
+    node_rows, node_cols = np.divmod(nodes, cols)
+    seed = int(nodes[np.argmin((node_rows - rows // 2) ** 2 + (node_cols - cols // 2) ** 2)])
+    nearest = dijkstra(graph, directed=True, indices=seed)
+    # cells the seed cannot reach are never picked, their bounds would be useless
+    nearest[~np.isfinite(nearest)] = -1.0
+
+    landmarks = []
+    for i in range(count):
+        cell = int(np.argmax(nearest))
+        landmarks.append(divmod(cell, cols))
+        distance = dijkstra(graph, directed=True, indices=cell)
+        distances[:, :, i] = distance.reshape(rows, cols)
+        nearest = np.minimum(nearest, np.where(np.isfinite(distance), distance, -1.0))
+    return landmarks, distances
+
+
+def _landmark_graph(sensor, level, labels, dem_path):
+    """Graph, grid shape and component of the grid the tables of a level are computed on"""
+    if level == 0:
+        rows, cols = sensor.elevation_map.shape
+        return sensor.cost_graph(0, rows, 0, cols), (rows, cols), None
+    cost_level = open_level(sensor, level, labels=labels, dem_path=dem_path)
+    rows, cols = cost_level.elevation_map.shape
+    return Sensor.moves_graph(cost_level.crossing_costs(0, rows, 0, cols)), (rows, cols), cost_level.component
+
+
+class LandmarkIndex:
+    '''
+    Triangle-inequality lower bounds on path costs.
+
+    Fields:
+    - landmarks (list): Landmark cells (row, col)
+    - distances (ndarray): Cost from each cell (block at level > 0) to each landmark, shape (rows, cols, count)
+    - level (int): Pyramid level of the tables, 0 for one distance per cell
+    - labels (ndarray): Component labels, used to check goals when component is set
+    - component (int): Label of the only component the tables bound paths in, None for all
+    - slack (float): Absolute margin subtracted from every bound to absorb float32 rounding
+    '''
+
+    def __init__(self, landmarks, distances, level=0, labels=None, component=None):
+        self.landmarks = [tuple(landmark) for landmark in landmarks]
+        self.distances = distances
+        self.level = level
+        self.labels = labels
+        self.component = component
+        finite = distances[np.isfinite(distances)]
+        self.slack = 2 * ROUNDING_SLACK * float(finite.max()) if finite.size else 0.0
+        self._target = None
+        self._target_distances = None
+
+    @classmethod
+    def build(cls, sensor, count=LANDMARK_COUNT, dem_path=None, labels=None, max_cells=LANDMARK_CELLS):
+        """
+        Select landmarks on the sensor's map, or load the ones stored next to dem_path.
+
+        When dem_path is given the distance tables are written once as a
+        memory-mapped array alongside the DEM and reused by later calls.
+        Maps of more than max_cells cells get block tables on a level of
+        the cost pyramid, see landmark_level; labels are the component
+        labels of the map, computed when not given.
+        """
+        level = landmark_level(sensor.elevation_map.shape, max_cells)
+        if level > 0 and labels is None:
+            labels = ReachabilityIndex.build(sensor, dem_path=dem_path).labels
+        expected = {"count": count, "level": level, "cost_model_version": Sensor.COST_MODEL_VERSION}
+        if dem_path is not None:
+            distances, meta = dem_store.open_array(dem_path, "landmarks", **expected)
+            if distances is not None:
+                return cls(meta["landmarks"], distances, level, labels, meta["component"])
+
+        graph, shape, component = _landmark_graph(sensor, level, labels, dem_path)
+        out = None if dem_path is None else dem_store.create_array(dem_path, "landmarks", shape + (count,), np.float32)
+        landmarks, distances = select_landmarks(graph, shape, count, out=out)
+        landmarks = [(row << level, col << level) for row, col in landmarks]
+        if dem_path is None:
+            return cls(landmarks, distances, level, labels, component)
+        dem_store.finish_array(dem_path, "landmarks", out, landmarks=landmarks, component=component, **expected)
+        distances, meta = dem_store.open_array(dem_path, "landmarks", **expected)
+        return cls(meta["landmarks"], distances, level, labels, meta["component"])
+
+    def _distances_to(self, target):
+        if target != self._target:
+            level = self.level
+            distances = np.asarray(self.distances[target[0] >> level, target[1] >> level], dtype=np.float64)
+            # landmarks that cannot reach the target say nothing about it
+            usable = np.isfinite(distances)
+            if self.component is not None and self.labels[target[0], target[1]] != self.component:
+                usable[:] = False  # block distances only bound paths inside the component
+            self._target_distances = (distances, usable)
+            self._target = target
+        return self._target_distances
+
+    def lower_bound(self, cell, target):
+        """Lower bound on the cost of any path between cell and target"""
+        target_distances, usable = self._distances_to(tuple(target))
+        if not usable.any():
+            return 0.0
+        distances = np.asarray(self.distances[cell[0] >> self.level, cell[1] >> self.level], dtype=np.float64)
+        bound = np.abs(target_distances[usable] - distances[usable]).max()
+        return max(0.0, bound - self.slack)
+
+    def heuristic(self, goal):
+        """heuristic(row, col) bounding the cost to goal, as used by ArrayEngine"""
+        goal = tuple(goal)
+        return lambda row, col: self.lower_bound((row, col), goal)
@@ -0,0 +1,149 @@
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+import dem_store
+from sensors import Sensor
+
+"""
+Passability-connected components of the elevation map.
+
+Two neighbouring cells are joined when the move between them is passable
+(Sensor.get_cost is finite). Cells in different components can never be
+connected by any path, so a query whose start and goal carry different
+labels is rejected in O(1) instead of exhausting everything reachable.
+
+The labels are computed strip by strip: each strip of rows is labelled
+with scipy's connected_components, and the strips are merged afterwards
+with a second connected_components pass over the label pairs joined by
+passable moves across strip borders.
+"""
+
+# Rows labelled per connected_components call
+STRIP_ROWS = 256
+# Label of cells that have no elevation (row 0)
+NO_LABEL = -1
+
+
+def _strip_edges(elevation, index):
+    """(from, to) cell ids of the passable moves inside one block of elevations"""
+    sources = []
+    targets = []
+    # every undirected edge once: right, down, down-right, down-left
+    for d_row, d_col in [(0, 1), (1, 0), (1, 1), (1, -1)]:
+        rows, cols = elevation.shape
+        r0, r1 = 0, rows - d_row
+        c0, c1 = max(0, -d_col), cols - max(0, d_col)
+        here = elevation[r0:r1, c0:c1]
+        there = elevation[r0 + d_row:r1 + d_row, c0 + d_col:c1 + d_col]
+        with np.errstate(invalid="ignore"):
+            passable = np.abs(there - here) <= Sensor.PASSABLE_ELEVATION
+        sources.append(index[r0:r1, c0:c1][passable])
+        targets.append(index[r0 + d_row:r1 + d_row, c0 + d_col:c1 + d_col][passable])
+    return np.concatenate(sources), np.concatenate(targets)
+
+
+def label_components(sensor, out=None, strip_rows=STRIP_ROWS):
+    """
+    Label the passability-connected components of the sensor's map.
+
+    Args:
+    sensor (Sensor): Sensor over the elevation map to label
+    out (ndarray, optional): int32 array of the map's shape to write the labels into
+    strip_rows (int): Rows labelled at a time, bounds the memory used
+
+    Returns:
+    ndarray: Component label per cell, NO_LABEL where a cell has no elevation
+    """
+    rows, cols = sensor.elevation_map.shape
+    labels = np.empty((rows, cols), dtype=np.int32) if out is None else out
+    count = 0
+    border_pairs = []
+
+    for row in range(0, rows, strip_rows):
+        stop = min(rows, row + strip_rows)
+        # one extra row so moves into the next strip are seen as well
+        elevation = sensor.elevation_window(row, min(rows, stop + 1), 0, cols)
+        strip = elevation[:stop - row]
+        index = np.arange(strip.size, dtype=np.int64).reshape(strip.shape)
+
+        sources, targets = _strip_edges(strip, index)
+        graph = coo_matrix(
+            (np.ones(sources.size, dtype=np.int8), (sources, targets)), shape=(strip.size, strip.size)
+        )
+        n_local, local = connected_components(graph, directed=False)
+        local = local.reshape(strip.shape).astype(np.int64) + count
+        local[np.isnan(strip)] = NO_LABEL
+        labels[row:stop] = local
+        count += n_local
+
+        if elevation.shape[0] > strip.shape[0]:
+            # moves from the last row of this strip to the first row of the next
+            below = elevation[-2:]
+            pair_index = np.arange(below.size, dtype=np.int64).reshape(below.shape)
+            sources, targets = _strip_edges(below, pair_index)
+            crossing = (sources < cols) & (targets >= cols)
+            border_pairs.append((sources[crossing], targets[crossing] - cols, row, stop))
+
+    if not border_pairs:
+        return labels
+
+    # merge components joined across strip borders
+    first, second = [], []
+    for sources, targets, row, stop in border_pairs:
+        first.append(labels[stop - 1, sources].astype(np.int64))
+        second.append(labels[stop, targets].astype(np.int64))
+    first = np.concatenate(first)
+    second = np.concatenate(second)
+    graph = coo_matrix((np.ones(first.size, dtype=np.int8), (first, second)), shape=(count, count))
+    _, merged = connected_components(graph, directed=False)
+    merged = merged.astype(np.int32)
+
+    for row in range(0, rows, strip_rows):
+        stop = min(rows, row + strip_rows)
+        strip = labels[row:stop]
+        valid = strip != NO_LABEL
+        strip[valid] = merged[strip[valid]]
+    return labels
+
+
+class ReachabilityIndex:
+    '''
+    O(1) test of whether a path can exist between two cells.
+
+    Fields:
+    - labels (ndarray): Component label per cell, see label_components
+    '''
+
+    def __init__(self, labels):
+        self.labels = labels
+
+    @classmethod
+    def build(cls, sensor, dem_path=None):
+        """
+        Label the sensor's map, or load the labels stored next to dem_path.
+
+        When dem_path is given the labels are written once as a memory-mapped
+        array alongside the DEM and reused by later calls.
+        """
+        if dem_path is None:
+            return cls(label_components(sensor))
+
+        expected = {"passable_elevation": Sensor.PASSABLE_ELEVATION}
+        labels, _ = dem_store.open_array(dem_path, "components", **expected)
+        if labels is None:
+            out = dem_store.create_array(dem_path, "components", sensor.elevation_map.shape, np.int32)
+            label_components(sensor, out=out)
+            dem_store.finish_array(dem_path, "components", out, **expected)
+            labels, _ = dem_store.open_array(dem_path, "components", **expected)
+        return cls(labels)
+
+    def reachable(self, start, goal):
+        """Whether any path can lead from start to goal"""
+        if tuple(start) == tuple(goal):
+            return True
+        rows, cols = self.labels.shape
+        for row, col in (start, goal):
+            if not (0 <= row < rows and 0 <= col < cols):
+                return False
+        label = self.labels[start[0], start[1]]
+        return label != NO_LABEL and label == self.labels[goal[0], goal[1]]
@@ -1,11 +1,16 @@
 import PathFinder
 import Exceptions
 import os
+import numpy as np
 import rasterio
 import transformations
 from AStar import AStar
+from ARAStar import ARAStar
 from BidirectionalAStar import BidirectionalAStar
+from DStarLite import DStarLite
+from HPAStar import HPAStar
 from MultiResolutionPathFinder import MultiResolutionPathFinder
+from compact_path import Path
 from motors import Motors
 from sensors import Sensor
 
@@ -22,7 +27,7 @@ class Robot:
     Fields:
     - Name (str): Name of the robot
     - Brain (PathFinder): Aggregation of a Pathfinding Algorithm
-    - Path (list): Computed path
+    - Path (Path): Computed path, None before the first one
     - Motor (Motot): Aggreagation of Motors
     - Sensor (sensors): Aggregation of sensors
     - initPosition (tuple): Initial spawn coordinates
@@ -48,9 +53,20 @@ class Robot:
             self.Brain = BidirectionalAStar(None)
         elif (brain == "Multiresolution Pathfinder"):
             self.Brain = MultiResolutionPathFinder(None)
+        elif (brain == "HPA*"):
+            self.Brain = HPAStar(None)
+        elif (brain == "ARA*"):
+            self.Brain = ARAStar(None)
+        elif (brain == "D* Lite"):
+            self.Brain = DStarLite(None)
+        if self.Brain is not None:
+            # unreachable goals are rejected at once instead of exhausting the map;
+            # the labels are stored next to the DEM on first use and memory-mapped after.
+            # Labelling a whole planet takes minutes, so it runs off the UI thread.
+            self.Brain.use_reachability(background=True)
 
         self.Sensor = None
-        self.Path = []
+        self.Path = None
         self.Motor = Motors(None, None)
         self.initPosition = (0,0)
         self.endPosition = (0,0)
@@ -63,6 +79,8 @@ class Robot:
         j = 1
         cost = 0
         path = self.Path
+        if path is None:
+            return cost
 
         while (j < len(path)):
             cost += self.Brain.get_cost(path[i][0], path[i][1], path[j][0], path[j][1])
@@ -75,6 +93,34 @@ class Robot:
     
 
     
+    def set_path(self, path):
+        """Store a computed path, as a compact Path whatever the planner returned"""
+        self.Path = Path.from_cells(path)
+
+    def should_replan(self, stalled=False):
+        """
+        Whether Path should be repaired from the current cell before moving on.
+
+        Only D* Lite replans during a mission: it keeps its search between
+        calls, so a replan costs work proportional to what changed. It does
+        so when costs changed since the last plan or when the rover stalled.
+        """
+        return isinstance(self.Brain, DStarLite) and (stalled or self.Brain.has_pending_changes())
+
+    def replan(self):
+        """
+        Plan again from the current cell of Path to endPosition, keeping the cells travelled so far.
+
+        Returns:
+        bool: Whether a path to endPosition was found; Path is unchanged otherwise
+        """
+        path = self.Brain.find_path(self.Path[self.curr_idx], self.endPosition)
+        if path is None:
+            return False
+        path = Path.from_cells(path)
+        self.Path = Path(self.Path.start, np.concatenate([self.Path.codes(0, self.curr_idx), path.codes()]))
+        return True
+
     def get_next_pos_in_path(self):
         if self.Path != None and self.curr_idx+1<len(self.Path):
             next_pos = self.Path[self.curr_idx+1]
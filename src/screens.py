@@ -360,7 +360,7 @@ class SelectionScreen(tk.Frame):
         scroller2 = Scroller(
             top_frame,
             "Select Your AI",
-            items=["A*", "Bidirectional A*", "Multiresolution Pathfinder"],
+            items=["A*", "Bidirectional A*", "Multiresolution Pathfinder", "HPA*", "ARA*", "D* Lite"],
             bg_color="#D99F6B",
         )
         scroller2.pack(pady=10)
@@ -377,9 +377,13 @@ class SelectionScreen(tk.Frame):
 
         def make_robot():
             controller.show_frame("SpawnScreen")
+            previous_robot = controller.robot
             controller.robot = Robot(
                 scroller1.items[scroller1.index], scroller2.items[scroller2.index]
             )
+            if previous_robot.Brain is not None:
+                # the new robot already holds the shared DEM, so this only drops a reference
+                previous_robot.Brain.close()
             controller.robot.Sensor = controller.robot.Brain.sensor
             controller.robot_ui.set_mesh(controller.robot.Mesh)
 
@@ -509,7 +513,7 @@ class DummyPage(tk.Frame):
         self.controller.robot.elapsedTime = elapsed_time
 
         if path is not None:
-            self.controller.robot.Path = path
+            self.controller.robot.set_path(path)
         else:
             raise Exceptions.NoPathFound("Failed to find a path")
 
@@ -541,9 +545,13 @@ class DummyPage(tk.Frame):
             # start engine
             if robot.Motor.start_motors():
                 # main loop
-                iter = 1  # iteration counter for A*
+                stalled = False
                 while robot.Path[robot.curr_idx] != robot.endPosition:
                     self.controller.robot_ui.update_frame()
+                    # D* Lite repairs its plan from the current cell after cost changes or a stall
+                    if robot.should_replan(stalled) and not robot.replan():
+                        raise Exceptions.NoPathFound("Failed to find a path")
+                    stalled = False
                     next = robot.get_next_pos_in_path()  # get next position
                     curr = robot.Path[robot.curr_idx]
 
@@ -564,23 +572,17 @@ class DummyPage(tk.Frame):
                         robot.Motor.stop()
                         robot.Motor.charge_battery()  # charge until full
                         robot.Motor.start_motors()  # restart motor
+                        stalled = True
 
                     if (robot.Path[-1] != robot.endPosition) and (
                         robot.curr_idx == len(robot.Path) - 1
                     ):
-                        # This part is only for A* since it is toooooo slow on a large map
-                        # the path is a partial path and robot has reach the end of the path
-
-                        if iter > 5:
-                            # early termination
-                            robot.Motor.stop()
-                            self.controller.robot_ui.terminate()
-                            self.controller.show_frame("FinishScreen")
-                            return False  # Failed to reach goal within 5 tries. 50 sec for each try
-
-                        self.robot_get_path(robot.Path[robot.curr_idx], end)
-                        iter += 1
-                        robot.curr_idx = 0
+                        # every planner returns a complete path or raises NoPathFound,
+                        # so a path ending elsewhere cannot lead to the end
+                        robot.Motor.stop()
+                        self.controller.robot_ui.terminate()
+                        self.controller.show_frame("FinishScreen")
+                        return False
 
                 robot.Motor.stop()  # turn off motor
                 self.controller.robot_ui.terminate()
@@ -0,0 +1,180 @@
+import sys
+import cv2
+import numpy as np
+from multiprocessing import shared_memory
+import dem_registry
+from ArrayEngine import ArrayEngine
+from cost_pyramid import CostLevel
+from sensors import Sensor
+
+"""
+Corridor refinement of coarse paths, in-process or in a worker pool.
+
+MultiResolutionPathFinder refines a path upsampled from a coarser level
+by searching a band (corridor) around it. search_corridor is that search.
+For long paths the band is cut into segments between waypoints on the
+guide path, which are independent of each other and can be searched by
+a ProcessPoolExecutor running refine_segments.
+
+A level grid is the full-resolution Sensor or a CostLevel of the cost
+pyramid; both provide the cost planes the searches run on. Workers never
+receive them through pickling. Each level is described by share_sensor:
+the levels of a dataset are memory-mapped again from its dem_store files
+in the worker, and levels that only exist in memory (test maps and their
+cost levels) are copied once into named shared memory blocks the workers
+attach to.
+"""
+
+# Sensors of the level grids, set up in each worker by init_worker
+_sensors = {}
+# Shared memory blocks the worker is attached to, kept open for its lifetime
+_attached = []
+
+
+def corridor_mask(guide_path, window, width):
+    """Rasterize guide_path into window and dilate it into a band of the given half-width."""
+    row_start, row_stop, col_start, col_stop = window
+    mask = np.zeros((row_stop - row_start, col_stop - col_start), dtype=np.uint8)
+    points = np.array([(c - col_start, r - row_start) for r, c in guide_path], dtype=np.int32)
+    cv2.polylines(mask, [points.reshape(-1, 1, 2)], False, 1)
+    kernel = np.ones((2 * width + 1, 2 * width + 1), dtype=np.uint8)
+    return cv2.dilate(mask, kernel).astype(bool)
+
+
+def corridor_window(shape, guide_path, width):
+    """Window (row_start, row_stop, col_start, col_stop) of the band of half-width width around guide_path"""
+    rows = [r for r, _ in guide_path]
+    cols = [c for _, c in guide_path]
+    return (
+        max(0, min(rows) - width), min(shape[0], max(rows) + width + 1),
+        max(0, min(cols) - width), min(shape[1], max(cols) + width + 1),
+    )
+
+
+def search_corridor(sensor, guide_path, start_point, end_point, width, growth=2, max_width=None, heuristic=None,
+                    max_cells=None):
+    """
+    Find a path on a sensor's grid, restricted to a band around guide_path.
+
+    The band is widened by growth every time the search inside it fails,
+    until it covers the whole grid, its half-width would exceed max_width
+    or its window would exceed max_cells cells (ArrayEngine holds about
+    75 bytes per cell of the window). heuristic(row, col) must not
+    overestimate the cost to end_point, it defaults to the straight-line distance.
+
+    Returns:
+    Path: Path from start_point to end_point, or None if there is none in the band
+    """
+    level_rows, level_cols = sensor.elevation_map.shape
+    guide_path = [start_point] + list(guide_path) + [end_point]
+
+    if heuristic is None:
+        def heuristic(r, c):
+            return ((r - end_point[0])**2 + (c - end_point[1])**2)**0.5
+
+    while True:
+        window = corridor_window((level_rows, level_cols), guide_path, width)
+        if max_cells is not None and (window[1] - window[0]) * (window[3] - window[2]) > max_cells:
+            return None
+        mask = corridor_mask(guide_path, window, width)
+
+        engine = ArrayEngine(sensor, window)
+        engine.restrict(mask)
+        path = engine.search(start_point, end_point, heuristic)
+        if path is not None:
+            return path
+
+        if window == (0, level_rows, 0, level_cols) and mask.all():
+            return None
+        width *= growth
+        if max_width is not None and width > max_width:
+            return None
+
+
+def _attach_block(name):
+    if sys.version_info >= (3, 13):
+        # the creating process owns the block and unlinks it
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+def share_sensor(sensor, dem_path=None):
+    """
+    Describe a level grid so that worker processes can rebuild its Sensor or CostLevel.
+
+    Args:
+    sensor (Sensor or CostLevel): Grid of the level
+    dem_path (str, optional): Dataset the level is memory-mapped from, if any
+
+    Returns:
+    (dict, list): Picklable description for attach_sensor, and the shared
+    memory blocks created for it, which the caller must close and unlink
+    """
+    if dem_path is not None and isinstance(sensor, CostLevel):
+        return {"dem_path": dem_path, "cost_level": sensor.level}, []
+    if dem_path is not None:
+        return {"dem_path": dem_path}, []
+
+    if isinstance(sensor, CostLevel):
+        arrays = sensor.layers()
+    else:
+        arrays = {"elevation": sensor.elevation_map, "filled": sensor.filled_map}
+
+    description, blocks = {}, []
+    for key, array in arrays.items():
+        array = np.asarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        description[key] = (block.name, array.shape, array.dtype.str)
+        blocks.append(block)
+    if isinstance(sensor, CostLevel):
+        description["cost_level"] = sensor.level
+        description["component"] = sensor.component
+    return description, blocks
+
+
+def attach_sensor(description):
+    """Sensor or CostLevel over a level grid described by share_sensor, without copying its cells"""
+    if "dem_path" in description and "cost_level" in description:
+        return CostLevel.open(description["dem_path"], description["cost_level"])
+    if "dem_path" in description:
+        dem = dem_registry.acquire(description["dem_path"])
+        return Sensor(dem.elevation_map, dem.affine_transform, filled_map=dem.filled_map)
+
+    keys = CostLevel.LAYERS if "cost_level" in description else ("elevation", "filled")
+    arrays = {}
+    for key in keys:
+        name, shape, dtype = description[key]
+        block = _attach_block(name)
+        _attached.append(block)
+        arrays[key] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    if "cost_level" in description:
+        return CostLevel(description["cost_level"], **arrays, component=description["component"])
+    return Sensor(arrays["elevation"], None, filled_map=arrays["filled"])
+
+
+def init_worker(descriptions):
+    """ProcessPoolExecutor initializer: attach to the level grids, a description per level"""
+    for level, description in enumerate(descriptions):
+        _sensors[level] = attach_sensor(description)
+
+
+def refine_segments(level, segments, width, growth, max_width, max_cells=None):
+    """
+    Refine a batch of segments at one level, run in a worker.
+
+    Args:
+    level (int): Pyramid level the segments lie on
+    segments (list): (guide_path, start_point, end_point) per segment
+    width, growth, max_width, max_cells: Corridor parameters, see search_corridor
+
+    Returns:
+    list: Direction codes (uint8 ndarray) of each segment's path, None for segments without one
+    """
+    sensor = _sensors[level]
+    results = []
+    for guide_path, start_point, end_point in segments:
+        path = search_corridor(sensor, guide_path, start_point, end_point, width, growth, max_width,
+                               max_cells=max_cells)
+        results.append(None if path is None else path.codes())
+    return results
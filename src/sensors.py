@@ -1,4 +1,5 @@
 import numpy as np 
+from scipy.sparse import csr_matrix
 import transformations
 
 class Sensor:
@@ -6,11 +7,27 @@ class Sensor:
     MIN_ELEVATION = -8200
     MAX_ELEVATION = 22000
     PASSABLE_ELEVATION = 100
+    DEFAULT_ELEVATION = 2100
+    # Bump whenever get_cost changes, so data precomputed from costs is rebuilt
+    COST_MODEL_VERSION = 2
+    # Cells filled per pass by fill_elevations (~16 MB per float32 temporary)
+    FILL_BLOCK_CELLS = 1 << 22
+
+    # (row, col) offsets of the 8 neighbours, in the order get_neighbors returns them.
+    # Cost planes are stacked in this order as well.
+    NEIGHBOR_OFFSETS = [(0, -1), (0, 1), (-1, 0), (1, 0), (1, 1), (1, -1), (-1, -1), (-1, 1)]
+    # (d_row, d_col, base cost) per direction, in NEIGHBOR_OFFSETS order
+    MOVES = [(d_row, d_col, 1.4142 if d_row and d_col else 1.0) for d_row, d_col in NEIGHBOR_OFFSETS]
     
 
-    def __init__(self, elevation_map, affine_transform):
+    def __init__(self, elevation_map, affine_transform, filled_map=None):
         self.elevation_map = elevation_map
         self.affine_transform = affine_transform
+        if filled_map is None and isinstance(elevation_map, np.ndarray):
+            filled_map = Sensor.fill_elevations(elevation_map)
+        # What get_elevation_at_position returns for every cell, see fill_elevations.
+        # None for tiled and windowed maps, whose cells are filled on every lookup.
+        self.filled_map = filled_map
 
 
     
@@ -23,6 +40,180 @@ class Sensor:
         return neighbors
     
 
+    def expand(self, row, col):
+        """
+        Passable moves out of one cell with their costs, in one pass over its 3x3 block.
+
+        Equivalent to calling get_cost for every cell of get_neighbors and
+        dropping the infinite ones, but the block is read once and bounds,
+        missing elevations and passability are settled for all 8 moves at once.
+
+        Args:
+        row (int): Row of the cell
+        col (int): Column of the cell
+
+        Returns:
+        list: ((row, col), cost) pairs in NEIGHBOR_OFFSETS order, passable moves only
+        """
+        rows, cols = self.elevation_map.shape
+        if not (1 <= row < rows and 0 <= col < cols):
+            return []
+
+        block = None
+        if self.filled_map is not None:
+            if row < rows - 1 and 1 <= col < cols - 1:
+                block = self.filled_map[row - 1:row + 2, col - 1:col + 2].tolist()  # row 0 is NaN
+        elif 2 <= row < rows - 1 and 1 <= col < cols - 1:
+            block = self.elevation_map[row - 1:row + 2, col - 1:col + 2].tolist()
+            top, middle, bottom = block
+            if 0.0 in top or 0.0 in middle or 0.0 in bottom:
+                block = None  # missing elevations, estimated below
+            elif min(min(top), min(middle), min(bottom)) < Sensor.MIN_ELEVATION \
+                    or max(max(top), max(middle), max(bottom)) > Sensor.MAX_ELEVATION:
+                block = None  # out of range, clamped below
+        if block is None:
+            # border or unusual cells: the vectorized path, NaN where there is no cell
+            block = self.elevation_window(row - 1, row + 2, col - 1, col + 2).tolist()
+
+        current = block[1][1]
+        moves = []
+        for d_row, d_col, base_cost in Sensor.MOVES:
+            elevation_diff = abs(block[1 + d_row][1 + d_col] - current)
+            if not elevation_diff <= Sensor.PASSABLE_ELEVATION:
+                continue  # too steep, or no cell (NaN)
+            if elevation_diff <= 10:
+                battery_cost = 1.0
+            elif elevation_diff <= 50:
+                battery_cost = 2.5
+            else:
+                battery_cost = 3.0
+            moves.append(((row + d_row, col + d_col), base_cost + elevation_diff + battery_cost))
+        return moves
+
+    def expand_cells(self, rows, cols, out=None):
+        """
+        Array form of expand for many cells at once.
+
+        Args:
+        rows (ndarray): Rows of the cells, shape (n,)
+        cols (ndarray): Columns of the cells, shape (n,)
+        out (tuple, optional): (neighbor_rows, neighbor_cols, costs) arrays of
+                               shape (n, 8) to fill instead of allocating new ones
+
+        Returns:
+        (ndarray, ndarray, ndarray): Neighbour rows and columns (int64) and move
+        costs (float64), shape (n, 8) in NEIGHBOR_OFFSETS order, inf where the
+        move is impassable or leaves the map
+        """
+        rows = np.asarray(rows, dtype=np.int64).reshape(-1)
+        cols = np.asarray(cols, dtype=np.int64).reshape(-1)
+        if out is None:
+            out = (np.empty((rows.size, 8), dtype=np.int64),
+                   np.empty((rows.size, 8), dtype=np.int64),
+                   np.empty((rows.size, 8), dtype=np.float64))
+        neighbor_rows, neighbor_cols, costs = out
+        offsets = np.array(Sensor.NEIGHBOR_OFFSETS, dtype=np.int64)
+        np.add(rows[:, None], offsets[:, 0], out=neighbor_rows)
+        np.add(cols[:, None], offsets[:, 1], out=neighbor_cols)
+
+        current = self._elevations_at(rows, cols)[:, None]
+        following = self._elevations_at(neighbor_rows.reshape(-1), neighbor_cols.reshape(-1)).reshape(-1, 8)
+        diagonal = (offsets[:, 0] != 0) & (offsets[:, 1] != 0)
+        with np.errstate(invalid='ignore'):
+            costs[:] = self._move_costs(np.abs(following - current), np.where(diagonal, 1.4142, 1.0))
+        return neighbor_rows, neighbor_cols, costs
+
+    def _elevations_at(self, rows, cols):
+        """Vectorized get_elevation_at_position for arrays of cells, NaN where it returns None"""
+        map_rows, map_cols = self.elevation_map.shape
+        elevations = np.full(rows.shape, np.nan)
+        inside = (1 <= rows) & (rows < map_rows) & (0 <= cols) & (cols < map_cols)
+        if self.filled_map is not None:
+            elevations[inside] = self.filled_map[rows[inside], cols[inside]]
+        else:
+            elevations[inside] = self._fill_cells(rows[inside], cols[inside])
+        return elevations
+
+    def _fill_cells(self, rows, cols):
+        """Clamped elevations of cells inside the map, missing ones estimated from their neighbours"""
+        raw = np.asarray(self.elevation_map[rows, cols], dtype=np.float64)
+        values = np.clip(raw, Sensor.MIN_ELEVATION, Sensor.MAX_ELEVATION)
+        missing = raw == 0.0
+        if missing.any():
+            values[missing] = self._estimate_missing_elevations(rows[missing], cols[missing])
+        return values
+
+    @staticmethod
+    def fill_elevations(elevation_map, out=None):
+        """
+        Precompute get_elevation_at_position for a whole map.
+
+        Elevations are clamped to [MIN_ELEVATION, MAX_ELEVATION] and every
+        missing value (0.0) is replaced by the mean of its valid neighbours,
+        or DEFAULT_ELEVATION when there is none. Row 0, which is never a
+        valid position, is NaN. The map is processed in blocks of whole rows
+        and about FILL_BLOCK_CELLS cells, with float32 temporaries, so out
+        may be a memmap larger than memory.
+
+        Args:
+        elevation_map (ndarray): Raw elevations
+        out (ndarray, optional): float32 array of the map's shape to fill
+
+        Returns:
+        ndarray: out, or a new float32 array
+        """
+        rows, cols = elevation_map.shape
+        if out is None:
+            out = np.empty((rows, cols), dtype=np.float32)
+        block_rows = max(1, Sensor.FILL_BLOCK_CELLS // cols)
+        for start in range(0, rows, block_rows):
+            stop = min(rows, start + block_rows)
+            # the block plus one cell all around, missing (0.0) outside the map and on row 0
+            padded = np.zeros((stop - start + 2, cols + 2), dtype=np.float32)
+            read_start, read_stop = max(start - 1, 1), min(stop + 1, rows)
+            if read_start < read_stop:
+                padded[read_start - start + 1:read_stop - start + 1, 1:-1] = elevation_map[read_start:read_stop]
+            valid = padded != 0.0
+            clamped = np.clip(padded, Sensor.MIN_ELEVATION, Sensor.MAX_ELEVATION, out=padded)
+
+            height = stop - start
+            total = np.zeros((height, cols), dtype=np.float32)
+            count = np.zeros((height, cols), dtype=np.uint8)
+            for d_row, d_col in Sensor.NEIGHBOR_OFFSETS:
+                shifted = (slice(1 + d_row, height + 1 + d_row), slice(1 + d_col, cols + 1 + d_col))
+                np.add(total, clamped[shifted], out=total, where=valid[shifted])
+                count += valid[shifted]
+            estimate = np.full((height, cols), Sensor.DEFAULT_ELEVATION, dtype=np.float32)
+            np.divide(total, count, out=estimate, where=count > 0)
+            del total, count
+
+            center = (slice(1, height + 1), slice(1, cols + 1))
+            out[start:stop] = np.where(~valid[center], estimate, clamped[center])
+            if start == 0:
+                out[0] = np.nan
+        return out
+
+    def refresh_elevations(self, cells):
+        """Update filled_map after the elevations of cells were changed in elevation_map"""
+        if self.filled_map is None:
+            return
+        cells = np.asarray(cells, dtype=np.int64).reshape(-1, 1, 2)
+        # a cell's change also moves the estimates of missing neighbours
+        offsets = np.array([(0, 0)] + Sensor.NEIGHBOR_OFFSETS, dtype=np.int64)
+        around = np.unique((cells + offsets).reshape(-1, 2), axis=0)
+        rows, cols = around[:, 0], around[:, 1]
+        map_rows, map_cols = self.elevation_map.shape
+        inside = (1 <= rows) & (rows < map_rows) & (0 <= cols) & (cols < map_cols)
+        self.filled_map[rows[inside], cols[inside]] = self._fill_cells(rows[inside], cols[inside])
+
+    @staticmethod
+    def _move_costs(elevation_diff, base_cost):
+        """get_cost for arrays of elevation differences, inf for impassable (and NaN) differences"""
+        passable = elevation_diff <= Sensor.PASSABLE_ELEVATION
+        battery_cost = np.where(elevation_diff <= 10, 1.0,
+                                np.where(elevation_diff <= 50, 2.5, 3.0))
+        return np.where(passable, base_cost + elevation_diff + battery_cost, np.inf)
+
     # Make sure that elevation is within bounds
     def validate_elevation(self, elevation):
         if elevation < Sensor.MIN_ELEVATION:
@@ -35,6 +226,9 @@ class Sensor:
     # Retrieves terrain height at the given coordinates
     def get_elevation_at_position(self, x, y):
         if 1 <= y < self.elevation_map.shape[0] and 0 <= x < self.elevation_map.shape[1]: # row ranges should start with 1
+            if self.filled_map is not None:
+                return float(self.filled_map[y, x])  # clamped and filled beforehand
+
             elevation = self.elevation_map[y, x]
 
             if elevation == 0.0: # if invalid, handle error
@@ -47,7 +241,7 @@ class Sensor:
 
     # Estimate invalid data (0.0) by taking mean of neighbors
     def estimate_missing_elevation(self, row, col):
-        neighbors = self.get_neighbors(row, col)
+        neighbors = self.get_neighbors(col, row)
         valid_elevations = [self.validate_elevation(self.elevation_map[nr, nc])
                             for nr, nc in neighbors
                             if self.elevation_map[nr, nc] != 0.0
@@ -55,7 +249,7 @@ class Sensor:
         if valid_elevations:
             return np.mean(valid_elevations)
     
-        return 2100 # default elevation
+        return Sensor.DEFAULT_ELEVATION # default elevation
 
 
     # check if movement between two neighbors is possible based on elevation
@@ -100,4 +294,127 @@ class Sensor:
             # If the elevation change is extreme, make the cost prohibitive.
             battery_cost= float('inf')
         
-        return base_cost + elevation_diff + battery_cost*battery_weight
\ No newline at end of file
+        return base_cost + elevation_diff + battery_cost*battery_weight
+
+
+    def elevation_window(self, row_start, row_stop, col_start, col_stop):
+        """
+        Vectorized get_elevation_at_position over a block of cells.
+
+        Returns a float64 array of shape (row_stop - row_start, col_stop - col_start)
+        holding exactly what get_elevation_at_position returns for every cell,
+        with NaN wherever it would return None. The block may extend past the map.
+        """
+        rows, cols = self.elevation_map.shape
+        window = np.full((row_stop - row_start, col_stop - col_start), np.nan)
+
+        # get_elevation_at_position only accepts rows from 1
+        r0, r1 = max(row_start, 1), min(row_stop, rows)
+        c0, c1 = max(col_start, 0), min(col_stop, cols)
+        if r0 >= r1 or c0 >= c1:
+            return window
+
+        if self.filled_map is not None:
+            window[r0 - row_start:r1 - row_start, c0 - col_start:c1 - col_start] = self.filled_map[r0:r1, c0:c1]
+            return window
+
+        raw = np.asarray(self.elevation_map[r0:r1, c0:c1], dtype=np.float64)
+        block = np.clip(raw, Sensor.MIN_ELEVATION, Sensor.MAX_ELEVATION)
+
+        missing_rows, missing_cols = np.nonzero(raw == 0.0)
+        if missing_rows.size:
+            block[missing_rows, missing_cols] = self._estimate_missing_elevations(
+                missing_rows + r0, missing_cols + c0
+            )
+
+        window[r0 - row_start:r1 - row_start, c0 - col_start:c1 - col_start] = block
+        return window
+
+    def _estimate_missing_elevations(self, rows, cols):
+        """Vectorized estimate_missing_elevation for arrays of cells"""
+        map_rows, map_cols = self.elevation_map.shape
+        total = np.zeros(rows.shape, dtype=np.float64)
+        count = np.zeros(rows.shape, dtype=np.int64)
+
+        for d_row, d_col in Sensor.NEIGHBOR_OFFSETS:
+            n_row = rows + d_row
+            n_col = cols + d_col
+            inside = (1 <= n_row) & (n_row < map_rows) & (0 <= n_col) & (n_col < map_cols)
+            values = np.zeros(rows.shape, dtype=np.float64)
+            values[inside] = self.elevation_map[n_row[inside], n_col[inside]]
+            valid = inside & (values != 0.0)
+            total += np.where(valid, np.clip(values, Sensor.MIN_ELEVATION, Sensor.MAX_ELEVATION), 0.0)
+            count += valid
+
+        estimate = np.full(rows.shape, float(Sensor.DEFAULT_ELEVATION))
+        np.divide(total, count, out=estimate, where=count > 0)
+        return estimate
+
+    def cost_planes(self, row_start, row_stop, col_start, col_stop, dtype=np.float32):
+        """
+        Movement costs for every cell of a window and each neighbour direction.
+
+        Computes, in one vectorized pass, what get_cost returns for the move from
+        each cell of the window to each of its 8 neighbours. Plane k holds the move
+        along NEIGHBOR_OFFSETS[k]; impassable and out-of-map moves are inf. Moves
+        leaving the window are included, so the caller can tell where a search
+        would leave it.
+
+        Returns:
+        ndarray: Array of shape (8, rows, cols)
+        """
+        height = row_stop - row_start
+        width = col_stop - col_start
+        elevation = self.elevation_window(row_start - 1, row_stop + 1, col_start - 1, col_stop + 1)
+        current = elevation[1:height + 1, 1:width + 1]
+
+        planes = np.empty((8, height, width), dtype=dtype)
+        with np.errstate(invalid='ignore'):
+            for k, (d_row, d_col) in enumerate(Sensor.NEIGHBOR_OFFSETS):
+                following = elevation[1 + d_row:height + 1 + d_row, 1 + d_col:width + 1 + d_col]
+                base_cost = 1.4142 if d_row != 0 and d_col != 0 else 1.0
+                planes[k] = self._move_costs(np.abs(following - current), base_cost)
+
+        return planes
+
+    def cost_graph(self, row_start, row_stop, col_start, col_stop, planes=None):
+        """
+        Sparse adjacency matrix of the moves inside a window, for scipy.sparse.csgraph.
+
+        Node ids are flat row-major indices into the window. Only passable
+        moves that stay inside the window become edges, weighted with the
+        same costs as cost_planes (at float64).
+
+        Args:
+        planes (ndarray, optional): cost_planes of the window, if the caller already has them
+
+        Returns:
+        csr_matrix: Matrix of shape (cells, cells) with cells = rows * cols of the window
+        """
+        if planes is None:
+            planes = self.cost_planes(row_start, row_stop, col_start, col_stop, dtype=np.float64)
+        return Sensor.moves_graph(planes)
+
+    @staticmethod
+    def moves_graph(planes):
+        """
+        Sparse adjacency matrix of the finite moves of any (8, rows, cols) planes, see cost_graph.
+
+        Returns:
+        csr_matrix: Matrix of shape (cells, cells), node ids are flat row-major indices
+        """
+        _, height, width = planes.shape
+        index = np.arange(height * width, dtype=np.int64).reshape(height, width)
+        sources, targets, weights = [], [], []
+        for k, (d_row, d_col) in enumerate(Sensor.NEIGHBOR_OFFSETS):
+            r0, r1 = max(0, -d_row), height - max(0, d_row)
+            c0, c1 = max(0, -d_col), width - max(0, d_col)
+            costs = planes[k, r0:r1, c0:c1]
+            finite = np.isfinite(costs)
+            sources.append(index[r0:r1, c0:c1][finite])
+            targets.append(index[r0 + d_row:r1 + d_row, c0 + d_col:c1 + d_col][finite])
+            weights.append(costs[finite].astype(np.float64))
+        return csr_matrix(
+            (np.concatenate(weights), (np.concatenate(sources), np.concatenate(targets))),
+            shape=(height * width, height * width),
+        )
@@ -1,8 +1,10 @@
 import AStar
 import BidirectionalAStar
 import MultiResolutionPathFinder
+from heuristics import Heuristic, TerrainHeuristic
 import numpy as np
 import time
+import tracemalloc
 import matplotlib.pyplot as plt
 
 
@@ -205,13 +207,17 @@ class PathFindingTester:
 
         plt.show()
 
-    def run_Astar_real_map(self):
+    def run_Astar_real_map(self, engine="dict"):
         start = (1281, 8960)
         goal = (1490, 8960)
-        astar = AStar.AStar(False)
+        astar = AStar.AStar(False, engine=engine)
+        tracemalloc.start()
         path = astar.find_path(start, goal)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
 
-        print("\n=========== A* Pathfinding Test ===========")
+        print(f"\n=========== A* Pathfinding Test ({engine} engine) ===========")
+        print(f"Peak search allocations: {peak / 2**20:.1f} MiB")
         if path is None:
             print("No path found")
         else:
@@ -221,6 +227,101 @@ class PathFindingTester:
             if self.visualization:
                 self.visualize_real_map(path, astar)
 
+    def run_landmark_comparison_real_map(self, count=8):
+        start = (1281, 8960)
+        goal = (1490, 8960)
+        astar = AStar.AStar(False, engine="array")
+        euclidean_path = astar.find_path(start, goal)
+        euclidean_expanded = astar.expanded
+
+        astar.use_landmarks(count)
+        alt_path = astar.find_path(start, goal)
+        alt_expanded = astar.expanded
+
+        print("\n=========== ALT Landmark Heuristic Test ===========")
+        print(f"Euclidean heuristic expanded {euclidean_expanded} nodes")
+        print(f"ALT heuristic ({count} landmarks) expanded {alt_expanded} nodes")
+        if euclidean_expanded:
+            print(f"Reduction: {100 * (1 - alt_expanded / euclidean_expanded):.1f}%")
+        if euclidean_path is None or alt_path is None:
+            print("No path found")
+        elif self.visualization:
+            self.visualize_real_map(alt_path, astar)
+
+    def run_heuristic_comparison_real_map(self, weight=1.5):
+        start = (1281, 8960)
+        goal = (1490, 8960)
+        astar = AStar.AStar(False, engine="array")
+
+        print("\n=========== Heuristic Comparison Test ===========")
+        for name, heuristic in [
+            ("Euclidean", Heuristic()),
+            ("Terrain", TerrainHeuristic()),
+            (f"Weighted terrain (w={weight})", TerrainHeuristic(weight)),
+        ]:
+            astar.set_heuristic(heuristic)
+            start_time = time.time()
+            path = astar.find_path(start, goal)
+            elapsed = time.time() - start_time
+            if path is None:
+                print(f"{name}: no path found")
+                continue
+            cost = sum(
+                astar.get_cost(c1, r1, c2, r2)
+                for (r1, c1), (r2, c2) in zip(path[:-1], path[1:])
+            )
+            print(f"{name}: {astar.expanded} nodes expanded, cost {cost:.1f}, {elapsed:.2f} s")
+
+    def run_queue_benchmark_real_map(self, resolution=1.0, repeats=3):
+        start = (1281, 8960)
+        goal = (1490, 8960)
+        astar = AStar.AStar(False, engine="array")
+
+        print("\n=========== Priority Queue Benchmark ===========")
+        for name, queue_resolution in [("heapq", None), (f"bucket queue ({resolution})", resolution)]:
+            astar.use_bucket_queue(queue_resolution)
+            times = []
+            for _ in range(repeats):
+                start_time = time.perf_counter()
+                path = astar.find_path(start, goal)
+                times.append(time.perf_counter() - start_time)
+            if path is None:
+                print(f"{name}: no path found")
+                continue
+            cost = sum(
+                astar.get_cost(c1, r1, c2, r2)
+                for (r1, c1), (r2, c2) in zip(path[:-1], path[1:])
+            )
+            print(f"{name}: best of {repeats} {min(times):.3f} s, cost {cost:.1f}")
+
+    def run_pyramid_depth_benchmark_real_map(self, spans=(32, 128, 512, 2048), repeats=3):
+        start = (1281, 8960)
+        m = MultiResolutionPathFinder.MultiResolutionPathFinder(False)
+        adaptive_target = m.target_coarse_nodes
+
+        print("\n=========== Pyramid Depth Benchmark ===========")
+        for span in spans:
+            goal = (start[0] + span // 2, start[1] + span)
+            for name, target in [("coarsest level", 0), ("adaptive", adaptive_target)]:
+                m.target_coarse_nodes = target
+                times = []
+                for _ in range(repeats):
+                    start_time = time.perf_counter()
+                    path = m.find_path(start, goal)
+                    times.append(time.perf_counter() - start_time)
+                if path is None:
+                    print(f"span {span}, {name}: no path found")
+                    continue
+                cost = sum(
+                    m.get_cost(c1, r1, c2, r2)
+                    for (r1, c1), (r2, c2) in zip(path[:-1], path[1:])
+                )
+                print(
+                    f"span {span}, {name} (level {m.start_level(start, goal)}): "
+                    f"best of {repeats} {min(times):.3f} s, cost {cost:.1f}"
+                )
+        m.close()
+
     def run_biAstar_real_map(self):
         start = (1281, 8960)
         goal = (1490, 8960)
@@ -0,0 +1,1025 @@
+import sys
+import os
+import heapq
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_dir = os.path.abspath(os.path.join(current_dir, "../../src"))
+sys.path.insert(0, src_dir)
+
+import dem_registry
+import dem_store
+from ArrayEngine import ArrayEngine
+from AStar import AStar
+from ARAStar import ARAStar
+from BidirectionalAStar import BidirectionalAStar
+from CsgraphPathFinder import CsgraphPathFinder
+from DStarLite import DStarLite
+from HPAStar import HPAStar
+from MultiResolutionPathFinder import MultiResolutionPathFinder
+from PathFinderBase import PathFinderBase
+from bucket_queue import BucketQueue
+from compact_path import Path
+import cost_pyramid
+from cost_pyramid import CostLevel
+from dem_tiles import TiledElevation
+from heuristics import Heuristic, TerrainHeuristic
+from landmarks import LandmarkIndex
+from reachability import ReachabilityIndex, label_components, NO_LABEL
+from robot import Robot
+import segment_refinement
+from sensors import Sensor
+
+MARS_EQC = "+proj=eqc +lat_ts=0 +lat_0=0 +lon_0=0 +x_0=0 +y_0=0 +R=3396190 +units=m +no_defs"
+
+
+def random_map(seed, shape=(40, 40), roughness=150):
+    """Random terrain where most, but not all, moves are passable"""
+    rng = np.random.default_rng(seed)
+    return rng.integers(1000, 1000 + roughness, size=shape).astype(np.float64)
+
+
+MOCK_ELEVATION_MAP = np.array(
+    [
+        [9999, 9999, 9999, 9999, 9999],
+        [10, 2, -3, 100, 1],
+        [-1, 22000, -1, 3, 20],
+        [400, -300, 0.0, -8001, 50],
+        [300, -200, 3, -1, 55],
+        [10, -10, 1, 1, 1],
+    ]
+)
+MOCK_START = (1, 0)
+MOCK_GOAL = (5, 2)
+MOCK_EXPECTED = [(1, 0), (1, 1), (2, 2), (2, 3), (3, 4), (4, 3), (5, 2)]
+
+
+@pytest.fixture
+def dem_file(tmp_path, monkeypatch):
+    """Small int16 GeoTIFF in the MOLA layout, used as PathFinderBase.DEM_PATH"""
+    rng = np.random.default_rng(0)
+    elevation = rng.integers(-40, 41, size=(300, 400)).cumsum(axis=1) % 300 + 1000
+    path = str(tmp_path / "dem.tif")
+    with rasterio.open(
+        path, "w", driver="GTiff", height=300, width=400, count=1,
+        dtype="int16", crs=MARS_EQC, transform=from_origin(-10000, 5000, 463, 463),
+    ) as data:
+        data.write(elevation.astype(np.int16), 1)
+    monkeypatch.setattr(PathFinderBase, "DEM_PATH", path)
+    return path
+
+
+def path_cost(finder, path):
+    return sum(
+        finder.get_cost(c1, r1, c2, r2)
+        for (r1, c1), (r2, c2) in zip(path[:-1], path[1:])
+    )
+
+
+def test_array_engine_mock_map():
+    astar = AStar(True, MOCK_ELEVATION_MAP, engine="array")
+    assert astar.find_path(MOCK_START, MOCK_GOAL) == MOCK_EXPECTED
+
+
+def test_array_engine_matches_dict_engine():
+    for seed in range(5):
+        elevation_map = random_map(seed)
+        start, goal = (2, 3), (37, 35)
+        dict_astar = AStar(True, elevation_map)
+        array_astar = AStar(True, elevation_map, engine="array")
+
+        expected = dict_astar.find_path(start, goal)
+        path = array_astar.find_path(start, goal)
+
+        if expected is None:
+            assert path is None
+            continue
+        assert path[0] == start and path[-1] == goal
+        assert abs(path_cost(array_astar, path) - path_cost(dict_astar, expected)) < 1e-6
+
+
+def test_array_engine_grows_window_around_wall():
+    # A cliff between start and goal forces a detour far outside the
+    # initial search window
+    elevation_map = np.full((200, 200), 1000.0)
+    elevation_map[100, 5:195] = 5000.0
+    start, goal = (95, 100), (105, 100)
+
+    astar = AStar(True, elevation_map, engine="array")
+    path = astar.find_path(start, goal)
+
+    assert path is not None
+    assert path[0] == start and path[-1] == goal
+    assert all(elevation_map[r, c] == 1000.0 for r, c in path)
+    expected = AStar(True, elevation_map).find_path(start, goal)
+    assert abs(path_cost(astar, path) - path_cost(astar, expected)) < 1e-6
+
+
+def test_array_engine_respects_max_iterations():
+    elevation_map = random_map(0)
+    astar = AStar(True, elevation_map, engine="array")
+    assert astar.find_path((2, 3), (37, 35), max_iterations=5) is None
+
+
+def test_cost_planes_match_get_cost():
+    elevation_map = random_map(7, shape=(12, 15))
+    # nodata cells, including ones on the border, and out-of-range values
+    elevation_map[[1, 4, 11, 6], [0, 7, 3, 14]] = 0.0
+    elevation_map[5, 5] = 30000
+    elevation_map[8, 2] = -9000
+    sensor = Sensor(elevation_map, None)
+
+    for window in [(0, 12, 0, 15), (3, 9, 4, 10), (-2, 14, -3, 17)]:
+        row_start, row_stop, col_start, col_stop = window
+        exact = sensor.cost_planes(*window, dtype=np.float64)
+        planes = sensor.cost_planes(*window)
+        assert planes.dtype == np.float32
+
+        for k, (d_row, d_col) in enumerate(Sensor.NEIGHBOR_OFFSETS):
+            for row in range(row_start, row_stop):
+                for col in range(col_start, col_stop):
+                    expected = sensor.get_cost(col, row, col + d_col, row + d_row)
+                    i, j = row - row_start, col - col_start
+                    assert exact[k, i, j] == expected
+                    assert planes[k, i, j] == np.float32(expected)
+
+
+def test_multiresolution_searches_each_level_on_its_own_grid():
+    elevation_map = random_map(1, shape=(256, 256), roughness=40)
+    finder = MultiResolutionPathFinder(True, elevation_map)
+    finder.ensure_level(finder.levels)
+
+    for level, cost_level in enumerate(finder.cost_pyramid[1:], start=1):
+        assert cost_level.level == level
+        assert cost_level.crossing.shape == (8, 256 // 2 ** level, 256 // 2 ** level)
+        assert cost_level.elevations.dtype == np.int16 and cost_level.crossing.dtype == np.uint16
+    assert finder.cost_pyramid[-1].elevation_map.shape == (8, 8)
+
+    start, goal = (5, 5), (250, 240)
+    path = finder.find_path(start, goal)
+    assert path[0] == start and path[-1] == goal
+    assert path_cost(finder, path) < float("inf")
+
+
+def test_multiresolution_finds_gap_in_thin_wall():
+    # Averaged elevations would smooth the wall away; the cost pyramid keeps
+    # it, so the coarse path already runs through the gap
+    elevation_map = np.full((256, 256), 1000.0)
+    elevation_map[128, :230] = 1400.0
+    start, goal = (100, 20), (160, 20)
+
+    for corridor_width in (1, 4):
+        finder = MultiResolutionPathFinder(True, elevation_map, corridor_width=corridor_width)
+        finder.target_coarse_nodes = 1  # start at the coarsest level even for this short query
+        path = finder.find_path(start, goal)
+        assert path[0] == start and path[-1] == goal
+        assert path_cost(finder, path) < float("inf")
+        assert any(c >= 230 for r, c in path if r == 128)
+
+    # level 5 cells are 32 x 32: the wall tops block row 4, the gap is in block column 7
+    coarse = finder.connect_points_at_level((3, 0), (5, 0), 5)
+    assert any(c == 7 for r, c in coarse if r == 4)
+
+
+def test_multiresolution_corridors_stay_within_the_cell_cap(monkeypatch):
+    elevation_map = random_map(6, shape=(256, 256), roughness=40)
+    start, goal = (10, 10), (240, 245)
+    windows = []
+    engine_init = ArrayEngine.__init__
+
+    def record(engine, sensor, window):
+        windows.append(window)
+        engine_init(engine, sensor, window)
+
+    monkeypatch.setattr(ArrayEngine, "__init__", record)
+    finder = MultiResolutionPathFinder(True, elevation_map)
+    finder.max_corridor_cells = 6000
+    finder.segment_length = 16
+    path = finder.find_path(start, goal)
+    assert path[0] == start and path[-1] == goal  # refined in segments, each within the cap
+    assert max((r1 - r0) * (c1 - c0) for r0, r1, c0, c1 in windows) <= 6000
+
+    guide = [(10, 10), (120, 120), (240, 245)]
+    assert segment_refinement.search_corridor(finder.sensor, guide, start, goal, 4, max_cells=6000) is None
+
+
+def test_multiresolution_answers_queries_outside_the_largest_component():
+    elevation_map = random_map(5, shape=(256, 256), roughness=20)
+    # a walled-in area, smaller than the land around it
+    elevation_map[[20, 140], 20:141] += 500.0
+    elevation_map[20:141, [20, 140]] += 500.0
+    finder = MultiResolutionPathFinder(True, elevation_map)
+    start, goal = (25, 25), (135, 135)
+    assert finder.start_level(start, goal) > 0 and not finder.covers(start)
+
+    path = finder.find_path(start, goal)
+    astar = AStar(True, elevation_map, engine="array")
+    assert path[0] == start and path[-1] == goal
+    assert path_cost(finder, path) == pytest.approx(path_cost(astar, astar.find_path(start, goal)))
+
+
+def test_cost_pyramid_crossings_match_full_resolution_moves():
+    elevation_map = random_map(3, shape=(37, 29), roughness=150)
+    sensor = Sensor(elevation_map, None)
+    levels = [CostLevel.from_sensor(sensor)]
+    levels.append(levels[0].coarsen())
+
+    planes = sensor.cost_planes(0, 37, 0, 29)
+    filled = sensor.elevation_window(0, 37, 0, 29)
+    for cost_level in levels:
+        size = 2 ** cost_level.level
+        expected = np.full(cost_level.crossing.shape, np.inf)
+        for k, (d_row, d_col) in enumerate(Sensor.NEIGHBOR_OFFSETS):
+            for row in range(37):
+                for col in range(29):
+                    block = (row // size, col // size)
+                    move = ((row + d_row) // size - block[0], (col + d_col) // size - block[1])
+                    if move != (0, 0):
+                        direction = Sensor.NEIGHBOR_OFFSETS.index(move)
+                        expected[direction][block] = min(expected[direction][block], planes[k, row, col])
+        rows, cols = cost_level.elevation_map.shape
+        crossing = cost_level.crossing_costs(0, rows, 0, cols)
+        # stored in steps of 1 / COST_SCALE, never above the real cost
+        np.testing.assert_array_equal(
+            crossing, np.floor(expected * cost_pyramid.COST_SCALE) / cost_pyramid.COST_SCALE
+        )
+        assert (crossing <= expected).all()
+
+        for block_row in range(cost_level.crossing.shape[1]):
+            for block_col in range(cost_level.crossing.shape[2]):
+                cells = filled[block_row * size:(block_row + 1) * size, block_col * size:(block_col + 1) * size]
+                assert cost_level.min_elevation[block_row, block_col] == np.float32(np.nanmin(cells))
+                assert cost_level.max_elevation[block_row, block_col] == np.float32(np.nanmax(cells))
+
+
+def test_cost_pyramid_keeps_cliffs():
+    elevation_map = np.full((256, 256), 1000.0)
+    elevation_map[128, :230] = 1400.0
+    finder = MultiResolutionPathFinder(True, elevation_map)
+    cost_level = finder.ensure_level(2)
+
+    # blocks of rows 124..127 can only move down into rows 128.. through the gap
+    down = Sensor.NEIGHBOR_OFFSETS.index((1, 0))
+    crossing = cost_level.crossing_costs(0, 64, 0, 64)
+    assert np.isinf(crossing[down, 31, :57]).all()
+    assert np.isfinite(crossing[down, 31, 58:]).all()
+    assert (cost_level.max_slope[32, :57] == 400).all()
+    assert (cost_level.max_elevation[32, :57] == 1400).all()
+    planes = cost_level.cost_planes(30, 34, 0, 64)
+    assert np.isinf(planes[down, 1, :57]).all()
+
+
+def test_cost_pyramid_ignores_unreachable_crests():
+    # the top of a wall filling block row 32 of level 2 is flat, but the rover cannot get onto it
+    elevation_map = np.full((256, 256), 1000.0)
+    elevation_map[128:132, :230] = 1400.0
+    sensor = Sensor(elevation_map, None)
+    right = Sensor.NEIGHBOR_OFFSETS.index((0, 1))
+
+    along_crest = CostLevel.from_sensor(sensor).coarsen()
+    assert np.isfinite(along_crest.crossing_costs(32, 33, 0, 56)[right]).all()
+
+    cost_level = CostLevel.from_sensor(sensor, labels=label_components(sensor)).coarsen()
+    assert np.isinf(cost_level.crossing_costs(32, 33, 0, 56)[right]).all()
+    assert np.isfinite(cost_level.crossing_costs(31, 32, 0, 63)[right]).all()
+
+
+def test_cost_pyramid_stored_next_to_dem(dem_file, monkeypatch):
+    finder = MultiResolutionPathFinder(False)
+    levels = finder.build_pyramid(3)[1:]
+    for cost_level in levels:
+        kind = f"pyramid{cost_level.level}.crossing"
+        assert isinstance(cost_level.crossing, np.memmap)
+        assert os.path.exists(dem_store.store_path(dem_file, kind))
+    start, goal = (5, 5), (290, 390)
+    path = finder.find_path(start, goal)
+    finder.close()
+
+    def rebuild(*args, **kwargs):
+        raise AssertionError("stored pyramid levels are rebuilt")
+    monkeypatch.setattr(CostLevel, "from_sensor", rebuild)
+    monkeypatch.setattr(CostLevel, "coarsen", rebuild)
+    finder = MultiResolutionPathFinder(False)
+    for stored, cost_level in zip(finder.build_pyramid(3)[1:], levels):
+        assert np.array_equal(stored.elevations, cost_level.elevations)
+        assert np.array_equal(stored.crossing, cost_level.crossing)
+    assert finder.find_path(start, goal) == path
+    finder.close()
+
+
+def test_multiresolution_start_level_follows_query_length():
+    elevation_map = random_map(2, shape=(512, 512), roughness=40)
+    finder = MultiResolutionPathFinder(True, elevation_map)
+    assert len(finder.cost_pyramid) == 1  # nothing built before a query needs it
+
+    assert finder.start_level((10, 10), (40, 50)) == 0
+    path = finder.find_path((10, 10), (40, 50))
+    assert path[0] == (10, 10) and path[-1] == (40, 50)
+    assert len(finder.cost_pyramid) == 1
+
+    level = finder.start_level((5, 5), (500, 480))
+    assert 0 < level < finder.levels
+    path = finder.find_path((5, 5), (500, 480))
+    assert path[0] == (5, 5) and path[-1] == (500, 480)
+    assert len(finder.cost_pyramid) == level + 1
+
+    finder.target_coarse_nodes = 1
+    assert finder.start_level((5, 5), (500, 480)) == finder.levels
+
+
+def test_multiresolution_refines_segments_in_process_pool():
+    elevation_map = random_map(1, shape=(512, 512), roughness=40)
+    start, goal = (5, 5), (500, 480)
+    finder = MultiResolutionPathFinder(True, elevation_map)
+    serial = finder.find_path(start, goal)
+
+    finder.use_process_pool(workers=2, segment_length=32)
+    blocks = list(finder._shared_blocks)
+    path = finder.find_path(start, goal)
+    assert path[0] == start and path[-1] == goal
+    assert path_cost(finder, path) <= 1.1 * path_cost(finder, serial)
+
+    finder.close()
+    assert finder._pool is None
+    for block in blocks:
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=block.name)
+
+
+def test_dem_is_shared_between_pathfinders(dem_file):
+    astar = AStar(False)
+    bi_astar = BidirectionalAStar(False)
+
+    assert astar.elevation_map.base is bi_astar.elevation_map.base
+    assert not astar.elevation_map.flags.writeable
+    assert astar.transform is bi_astar.transform
+    assert astar.dem.refcount == 2
+
+    astar.close()
+    assert dem_registry.loaded() == [os.path.abspath(dem_file)]
+    bi_astar.close()
+    assert dem_registry.loaded() == []
+
+
+def test_multiresolution_loads_dem_once(dem_file):
+    finder = MultiResolutionPathFinder(False)
+    assert finder.dem is finder.bidirectional_astar.dem
+    assert finder.dem.refcount == 2
+    finder.close()
+    assert dem_registry.loaded() == []
+
+
+def test_dem_is_memory_mapped_from_converted_store(dem_file):
+    astar = AStar(False)
+    assert os.path.exists(dem_store.store_path(dem_file, "elevation"))
+    assert isinstance(astar.elevation_map, np.memmap)
+
+    with rasterio.open(dem_file) as data:
+        assert np.array_equal(astar.elevation_map, data.read(1))
+        assert astar.affine_transform == data.transform
+        assert astar.elevation_map.dtype == np.int16
+    astar.close()
+
+    # a second start reuses the store instead of converting again
+    mtime = os.path.getmtime(dem_store.store_path(dem_file, "elevation"))
+    astar = AStar(False)
+    assert os.path.getmtime(dem_store.store_path(dem_file, "elevation")) == mtime
+    astar.close()
+
+
+def test_tiled_elevation_indexing_and_cache(dem_file):
+    with rasterio.open(dem_file) as data:
+        expected = data.read(1)
+    tiles = TiledElevation(dem_file, tile_size=64, budget=4 * 64 * 64 * 2)
+
+    assert tiles.shape == expected.shape
+    assert tiles[5, 7] == expected[5, 7]
+    assert tiles[-1, -1] == expected[-1, -1]
+    assert np.array_equal(tiles[60:130, 10:200], expected[60:130, 10:200])
+    rows, cols = np.array([0, 299, 150, 64]), np.array([399, 0, 200, 63])
+    assert np.array_equal(tiles[rows, cols], expected[rows, cols])
+
+    stats = tiles.stats()
+    assert stats["misses"] > 0 and stats["evictions"] > 0
+    assert stats["cached_bytes"] <= tiles.budget
+    misses = stats["misses"]
+    tiles[65, 62], tiles[127, 0]  # same tile as the last cell read
+    assert tiles.stats()["misses"] == misses
+    tiles.close()
+
+
+def test_tiled_storage_finds_same_path(dem_file):
+    start, goal = (20, 30), (120, 90)
+    memmap_astar = AStar(False, engine="array")
+    tiled_astar = AStar(False, engine="array", storage="tiled")
+
+    assert isinstance(tiled_astar.elevation_map, TiledElevation)
+    assert tiled_astar.find_path(start, goal) == memmap_astar.find_path(start, goal)
+    assert tiled_astar.elevation_map.stats()["misses"] > 0
+
+    memmap_astar.close()
+    tiled_astar.close()
+    assert dem_registry.loaded() == []
+
+
+def test_window_storage_reads_only_query_area(dem_file):
+    start, goal = (150, 200), (160, 230)
+    memmap_astar = AStar(False, engine="array")
+    expected = memmap_astar.find_path(start, goal)
+
+    for engine in ("array", "dict"):
+        windowed_astar = AStar(False, engine=engine, storage="window")
+        windowed_astar.query_margin = 2
+        path = windowed_astar.find_path(start, goal)
+        elevation_map = windowed_astar.elevation_map
+
+        assert path_cost(windowed_astar, path) == pytest.approx(path_cost(memmap_astar, expected), abs=1e-6)
+        assert elevation_map.reads > 1  # the search had to grow the window
+        row_start, row_stop, col_start, col_stop = elevation_map.window
+        assert (row_stop - row_start) * (col_stop - col_start) < elevation_map.shape[0] * elevation_map.shape[1]
+        assert elevation_map.to_global(*elevation_map.to_window(*goal)) == goal
+        windowed_astar.close()
+
+    memmap_astar.close()
+
+
+def test_window_storage_keeps_a_window_per_pathfinder(dem_file):
+    queries = [((150, 200), (160, 230)), ((20, 20), (40, 35)), ((250, 330), (280, 380))]
+    memmap_astar = AStar(False, engine="array")
+    expected = [path_cost(memmap_astar, memmap_astar.find_path(*query)) for query in queries]
+
+    finders = [AStar(False, engine="array", storage="window") for _ in queries]
+    assert len({id(finder.elevation_map) for finder in finders}) == len(finders)
+    finders[0].find_path(*queries[0])
+    window = finders[0].elevation_map.window
+    finders[1].find_path(*queries[1])
+    assert finders[0].elevation_map.window == window  # not replaced by the other query
+
+    costs = [None] * len(finders)
+
+    def run(index):
+        for _ in range(3):
+            costs[index] = path_cost(finders[index], finders[index].find_path(*queries[index]))
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(len(finders))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert costs == pytest.approx(expected, abs=1e-6)
+
+    for finder in finders:
+        finder.close()
+    memmap_astar.close()
+    assert dem_registry.loaded() == []
+
+
+def flood_costs(finder, source):
+    """Exact cost from every cell to source, by Dijkstra over get_cost"""
+    costs = {source: 0.0}
+    open_set = [(0.0, source)]
+    while open_set:
+        cost, (row, col) = heapq.heappop(open_set)
+        if cost > costs[(row, col)]:
+            continue
+        for neighbor in finder.get_neighbors(col, row):
+            new_cost = cost + finder.get_cost(neighbor[1], neighbor[0], col, row)
+            if new_cost < costs.get(neighbor, float("inf")):
+                costs[neighbor] = new_cost
+                heapq.heappush(open_set, (new_cost, neighbor))
+    return costs
+
+
+def flood_labels(sensor):
+    """Reference component labels by breadth-first search over get_cost"""
+    rows, cols = sensor.elevation_map.shape
+    labels = np.full((rows, cols), NO_LABEL)
+    count = 0
+    for row in range(1, rows):
+        for col in range(cols):
+            if labels[row, col] != NO_LABEL:
+                continue
+            labels[row, col] = count
+            stack = [(row, col)]
+            while stack:
+                r, c = stack.pop()
+                for n_r, n_c in sensor.get_neighbors(c, r):
+                    if labels[n_r, n_c] == NO_LABEL and sensor.get_cost(c, r, n_c, n_r) < float("inf"):
+                        labels[n_r, n_c] = count
+                        stack.append((n_r, n_c))
+            count += 1
+    return labels
+
+
+def test_component_labels_match_flood_fill():
+    elevation_map = random_map(3, shape=(30, 25), roughness=220)
+    elevation_map[[4, 17], [9, 3]] = 0.0
+    sensor = Sensor(elevation_map, None)
+    expected = flood_labels(sensor)
+
+    for strip_rows in (4, 7, 256):
+        labels = label_components(sensor, strip_rows=strip_rows)
+        assert np.all(labels[0] == NO_LABEL)
+        # same partition, whatever the numbering
+        pairs = set(zip(labels[1:].ravel(), expected[1:].ravel()))
+        assert len(pairs) == len(set(labels[1:].ravel())) == len(set(expected[1:].ravel()))
+
+
+def test_unreachable_goal_rejected_without_search():
+    elevation_map = np.full((60, 60), 1000.0)
+    elevation_map[30, :] = 5000.0
+    astar = AStar(True, elevation_map, engine="array")
+    astar.use_reachability()
+
+    assert astar.find_path((10, 10), (50, 50)) is None
+    assert astar.find_path((10, 10), (20, 50)) is not None
+    assert astar.find_path((35, 10), (50, 50)) is not None
+
+    bi_astar = BidirectionalAStar(True, elevation_map)
+    bi_astar.use_reachability()
+    assert bi_astar.find_path((10, 10), (50, 50)) is None
+
+
+def test_component_labels_stored_next_to_dem(dem_file):
+    astar = AStar(False)
+    index = astar.use_reachability()
+    assert os.path.exists(dem_store.store_path(dem_file, "components"))
+    assert isinstance(index.labels, np.memmap)
+    assert np.array_equal(index.labels, label_components(astar.sensor))
+    astar.close()
+
+
+def test_hpa_star_path_is_valid():
+    elevation_map = random_map(4, shape=(100, 90), roughness=40)
+    hpa = HPAStar(True, elevation_map, cluster_size=16)
+    assert hpa.abstract_graph
+    for start, goal in [((3, 3), (95, 85)), ((5, 5), (12, 9)), ((90, 2), (4, 80))]:
+        path = hpa.find_path(start, goal)
+        assert path[0] == start and path[-1] == goal
+        assert all(max(abs(r1 - r2), abs(c1 - c2)) == 1 for (r1, c1), (r2, c2) in zip(path[:-1], path[1:]))
+        assert np.isfinite(path_cost(hpa, path))
+
+
+def test_hpa_star_crosses_borders_diagonally():
+    # the only way from the left part to the right part is the diagonal move (9, 7) -> (10, 8)
+    elevation_map = np.full((24, 24), 1000.0)
+    elevation_map[:, 8] = 5000.0
+    elevation_map[10, 8] = 1000.0
+    elevation_map[10:12, 7] = 5000.0
+    hpa = HPAStar(True, elevation_map, cluster_size=8)
+    path = hpa.find_path((5, 2), (20, 20))
+    assert path is not None and (9, 7) in list(path) and (10, 8) in list(path)
+    assert np.isfinite(path_cost(hpa, path))
+
+    # a pocket no move leads into
+    elevation_map[14:19, 14:19] = 5000.0
+    elevation_map[16, 16] = 1000.0
+    hpa = HPAStar(True, elevation_map, cluster_size=8)
+    assert hpa.find_path((5, 2), (16, 16)) is None
+
+
+def test_hpa_star_graph_stored_next_to_dem(dem_file, monkeypatch):
+    hpa = HPAStar(False)
+    graph = hpa.abstract_graph
+    assert os.path.exists(dem_store.store_path(dem_file, "hpa32", "pickle"))
+    hpa.close()
+
+    monkeypatch.setattr(HPAStar, "build_abstract_graph", lambda self: pytest.fail("graph rebuilt"))
+    hpa = HPAStar(False)
+    assert hpa.abstract_graph == graph
+    assert hpa.find_path((20, 20), (250, 350)) is not None
+    hpa.close()
+
+
+def test_hpa_star_close_does_not_wait_for_the_build(dem_file, monkeypatch):
+    started, proceed = threading.Event(), threading.Event()
+
+    def slow_build(self):
+        started.set()
+        proceed.wait(10)
+        return None if self._cancelled.is_set() else ({}, {})
+
+    monkeypatch.setattr(HPAStar, "build_abstract_graph", slow_build)
+    hpa = HPAStar(False)
+    assert started.wait(10)
+    hpa.close()  # returns while the build is still running
+    assert dem_registry.loaded() != []
+    proceed.set()
+    hpa._graph_thread.join(10)
+    assert dem_registry.loaded() == []  # released by the build thread
+    with pytest.raises(RuntimeError):
+        hpa.abstract_graph
+
+    monkeypatch.undo()
+    hpa = HPAStar(True, random_map(0, shape=(64, 64)), cluster_size=16)
+    assert hpa.abstract_graph
+    hpa._cancelled.set()
+    assert hpa.build_abstract_graph() is None
+
+
+def test_landmark_heuristic_keeps_cost_and_expands_fewer_nodes():
+    elevation_map = random_map(2, shape=(80, 80), roughness=100)
+    start, goal = (5, 5), (75, 70)
+    astar = AStar(True, elevation_map, engine="array")
+    path = astar.find_path(start, goal)
+    euclidean_expanded = astar.expanded
+
+    astar.use_landmarks(count=4)
+    alt_path = astar.find_path(start, goal)
+    assert path_cost(astar, alt_path) == pytest.approx(path_cost(astar, path))
+    assert astar.expanded < euclidean_expanded
+
+    # admissible everywhere: never above the true cost to the goal
+    truth = flood_costs(astar, goal)
+    for cell in [(1, 0), (40, 40), (79, 79), (20, 60)]:
+        assert astar.lower_bound(cell, goal) <= truth[cell] + 1e-9
+
+
+def test_cost_to_go_bound_is_admissible_and_expands_fewer_nodes():
+    elevation_map = random_map(3, shape=(96, 96), roughness=20)
+    # walls the straight-line bound does not see, the path winds around them
+    elevation_map[30, 8:90] += 500.0
+    elevation_map[60, 4:88] += 500.0
+    start, goal = (90, 50), (10, 50)
+    astar = AStar(True, elevation_map, engine="array")
+    path = astar.find_path(start, goal)
+    plain_expanded = astar.expanded
+
+    astar.use_cost_to_go()
+    guided = astar.find_path(start, goal)
+    assert path_cost(astar, guided) == pytest.approx(path_cost(astar, path))
+    assert astar.expanded < plain_expanded
+
+    # admissible everywhere, also outside the window of a field that does not cover the map
+    truth = flood_costs(astar, goal)
+    partial = cost_pyramid.CostToGo(astar.ensure_level(1), goal, (0, 40, 30, 70))
+    assert partial.border < float("inf")
+    capped = cost_pyramid.CostToGo(astar.ensure_level(1), goal, (0, 96, 0, 96), max_blocks=64)
+    assert capped.distances.size <= 64 and capped.border < float("inf")
+    for field in (astar.cost_to_go, partial, capped):
+        for cell, cost in truth.items():
+            assert field.lower_bound(cell) <= cost + 1e-6
+
+    # long queries run their field on coarser levels instead of on more blocks
+    assert cost_pyramid.cost_to_go_level((0, 500, 0, 500)) == 1
+    assert cost_pyramid.cost_to_go_level((0, 20000, 0, 20000)) == 7
+
+
+def test_landmarks_on_a_pyramid_level_stay_admissible(monkeypatch):
+    elevation_map = random_map(2, shape=(80, 80), roughness=100)
+    astar = AStar(True, elevation_map, engine="array")
+    labels = astar.use_reachability().labels
+    # large maps never get a full-resolution graph
+    monkeypatch.setattr(Sensor, "cost_graph", lambda *args, **kwargs: pytest.fail("full-map graph built"))
+    index = LandmarkIndex.build(astar.sensor, 4, labels=labels, max_cells=400)
+    assert index.level == 2 and index.distances.shape == (20, 20, 4)
+    monkeypatch.undo()
+
+    for goal in [(75, 70), (40, 5)]:
+        truth = flood_costs(astar, goal)
+        bounds = [index.lower_bound(cell, goal) for cell in truth]
+        assert all(bound <= cost + 1e-6 for bound, cost in zip(bounds, truth.values()))
+        assert max(bounds) > 0
+
+
+def test_landmarks_stored_next_to_dem(dem_file):
+    astar = AStar(False)
+    index = astar.use_landmarks(count=3)
+    assert isinstance(index.distances, np.memmap)
+    reloaded = LandmarkIndex.build(astar.sensor, 3, dem_path=dem_file)
+    assert reloaded.landmarks == index.landmarks
+    astar.close()
+
+
+def test_filled_elevations_match_lookup_on_the_fly(monkeypatch):
+    elevation_map = random_map(7, shape=(45, 35))
+    elevation_map[np.random.default_rng(7).random((45, 35)) < 0.1] = 0.0
+    elevation_map[5, 5], elevation_map[8, 2] = 30000.0, -9000.0
+    filled = Sensor(elevation_map, None)
+    on_the_fly = Sensor(elevation_map, None)
+    on_the_fly.filled_map = None
+    for row in range(-1, 46):
+        for col in range(-1, 36):
+            expected = on_the_fly.get_elevation_at_position(col, row)
+            elevation = filled.get_elevation_at_position(col, row)
+            assert elevation == (None if expected is None else pytest.approx(expected, abs=1e-3))
+
+    elevation_map[20, 20], elevation_map[21, 21] = 0.0, 1200.0
+    filled.refresh_elevations([(20, 20), (21, 21)])
+    assert np.array_equal(filled.filled_map[1:], Sensor(elevation_map, None).filled_map[1:])
+
+    # blocks of a few rows give the same elevations as one block
+    monkeypatch.setattr(Sensor, "FILL_BLOCK_CELLS", 100)
+    assert np.array_equal(Sensor.fill_elevations(elevation_map)[1:], filled.filled_map[1:])
+
+
+def test_filled_elevations_stored_next_to_dem(dem_file):
+    astar = AStar(False)
+    assert isinstance(astar.sensor.filled_map, np.memmap)
+    assert os.path.exists(dem_store.store_path(dem_file, "filled"))
+    assert np.array_equal(astar.sensor.filled_map[1:], Sensor.fill_elevations(astar.elevation_map)[1:])
+    astar.close()
+
+
+def sloped_map(seed, size):
+    rng = np.random.default_rng(seed)
+    rows, cols = np.mgrid[0:size, 0:size]
+    return (1000 + 3 * rows + 2 * cols + rng.integers(0, 40, (size, size))).astype(float)
+
+
+def test_terrain_heuristic_is_admissible_and_weighted_mode_is_bounded():
+    elevation_map = sloped_map(5, 70)
+    elevation_map[30, 10] = 0.0
+    start, goal = (3, 4), (66, 60)
+    astar = AStar(True, elevation_map, engine="array")
+    optimal = path_cost(astar, astar.find_path(start, goal))
+    euclidean_expanded = astar.expanded
+
+    astar.set_heuristic(TerrainHeuristic())
+    truth = flood_costs(astar, goal)
+    assert all(astar.lower_bound(cell, goal) <= cost + 1e-9 for cell, cost in truth.items())
+    assert path_cost(astar, astar.find_path(start, goal)) == pytest.approx(optimal)
+    assert astar.expanded < euclidean_expanded
+
+    astar.set_heuristic(TerrainHeuristic(weight=1.5))
+    assert path_cost(astar, astar.find_path(start, goal)) <= 1.5 * optimal
+    with pytest.raises(ValueError):
+        Heuristic(weight=0.5)
+
+
+def test_ara_star_converges_to_optimal_and_respects_budget():
+    elevation_map = sloped_map(0, 120)
+    start, goal = (3, 4), (115, 110)
+    astar = AStar(True, elevation_map, engine="array")
+    optimal = path_cost(astar, astar.find_path(start, goal))
+
+    ara = ARAStar(True, elevation_map, time_budget=None)
+    path = ara.find_path(start, goal)
+    assert path[0] == start and path[-1] == goal
+    assert path_cost(ara, path) == pytest.approx(optimal)
+    assert ara.solution() == (path, 1.0)
+
+    # a zero budget stops right after the first, inflated pass
+    ara = ARAStar(True, elevation_map, time_budget=0.0)
+    path, bound = ara.find_path(start, goal), ara.bound
+    assert ara.epsilon == ARAStar.EPSILON
+    assert optimal <= path_cost(ara, path) <= bound * optimal + 1e-6
+    assert 1.0 <= bound <= ARAStar.EPSILON
+
+
+def test_d_star_lite_reuses_search_state():
+    elevation_map = random_map(1, shape=(50, 50), roughness=60)
+    start, goal = (3, 4), (45, 40)
+    astar = AStar(True, elevation_map, engine="array")
+    dstar = DStarLite(True, elevation_map)
+
+    path = dstar.find_path(start, goal)
+    assert path_cost(dstar, path) == pytest.approx(path_cost(astar, astar.find_path(start, goal)))
+    first_expanded = dstar.expanded
+
+    # moving along the path needs no repair at all
+    assert dstar.find_path(path[10], goal) == path[10:]
+    assert dstar.expanded == 0
+
+    # an obstacle on the path is repaired locally
+    blocked = path[20:23]
+    dstar.block_cells(blocked)
+    detour = dstar.find_path(path[10], goal)
+    assert not set(blocked) & set(detour)
+    assert dstar.expanded < first_expanded / 4
+
+    changed_map = elevation_map.copy()
+    changed_map[tuple(np.array(blocked).T)] = 5000.0
+    astar = AStar(True, changed_map, engine="array")
+    assert path_cost(dstar, detour) == pytest.approx(path_cost(astar, astar.find_path(path[10], goal)))
+
+
+def test_robot_planners_reject_unreachable_goals(dem_file):
+    robot = Robot("Spirit", "A*")
+    robot.Brain._reachability_thread.join(60)
+    assert isinstance(robot.Brain.reachability.labels, np.memmap)
+    labels = robot.Brain.reachability.labels
+    start = (150, 200)
+    unreachable = next(
+        (row, col) for row in range(1, 300) for col in range(400)
+        if labels[row, col] != labels[start] or labels[row, col] == NO_LABEL
+    )
+    assert robot.Brain.find_path(start, unreachable) is None
+    assert robot.Brain.expanded == 0
+    robot.Brain.close()
+
+
+def test_reachability_built_in_background_accepts_queries_until_ready(monkeypatch):
+    elevation_map = random_map(3, shape=(40, 40))
+    elevation_map[20:26, 20:26] += 500.0
+    proceed = threading.Event()
+    build = ReachabilityIndex.build.__func__
+
+    def slow_build(cls, sensor, dem_path=None):
+        proceed.wait(10)
+        return build(cls, sensor, dem_path=dem_path)
+
+    monkeypatch.setattr(ReachabilityIndex, "build", classmethod(slow_build))
+    finder = MultiResolutionPathFinder(True, elevation_map)
+    assert finder.use_reachability(background=True) is None
+    assert finder.is_reachable((5, 5), (22, 22))  # not known yet
+    proceed.set()
+    index = finder.use_reachability()  # waits for the thread instead of labelling again
+    assert finder.bidirectional_astar.reachability is index
+    assert not finder.is_reachable((5, 5), (22, 22))
+
+
+def test_robot_repairs_d_star_lite_plan_from_its_current_cell():
+    elevation_map = random_map(1, shape=(50, 50), roughness=60)
+    robot = Robot("Spirit", "")
+    robot.Brain = DStarLite(True, elevation_map)
+    robot.initPosition, robot.endPosition = (3, 4), (45, 40)
+    robot.set_path(robot.Brain.find_path(robot.initPosition, robot.endPosition))
+    first_expanded = robot.Brain.expanded
+
+    # a stall replans from the current cell without repairing anything
+    robot.curr_idx = 10
+    travelled = robot.Path[:11]
+    assert not robot.should_replan() and robot.should_replan(stalled=True)
+    assert robot.replan() and robot.Path[:11] == travelled
+    assert robot.Brain.expanded == 0
+
+    # costs changing ahead of the rover are repaired locally
+    blocked = robot.Path[20:23]
+    robot.Brain.block_cells(blocked)
+    assert robot.should_replan()
+    assert robot.replan() and not robot.should_replan()
+    assert robot.Path[:11] == travelled and robot.Path[-1] == robot.endPosition
+    assert not set(blocked) & set(robot.Path)
+    assert robot.Brain.expanded < first_expanded / 4
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_bidirectional_cost_matches_astar_on_random_maps(seed):
+    rng = np.random.default_rng(seed)
+    elevation_map = random_map(seed, shape=(30, 35), roughness=int(rng.integers(40, 220)))
+    astar = AStar(True, elevation_map, engine="array")
+    bi_astar = BidirectionalAStar(True, elevation_map)
+    for _ in range(3):
+        start = (int(rng.integers(1, 30)), int(rng.integers(0, 35)))
+        goal = (int(rng.integers(1, 30)), int(rng.integers(0, 35)))
+        path = astar.find_path(start, goal)
+        bi_path = bi_astar.find_path(start, goal)
+        if path is None:
+            assert bi_path is None
+            continue
+        assert bi_path[0] == start and bi_path[-1] == goal
+        assert path_cost(bi_astar, bi_path) == pytest.approx(path_cost(astar, path))
+
+
+def test_csgraph_finder_matches_astar_for_many_targets():
+    elevation_map = random_map(2, shape=(160, 160), roughness=100)
+    astar = AStar(True, elevation_map, engine="array")
+    finder = CsgraphPathFinder(True, elevation_map)
+
+    start = (60, 70)
+    goals = [(65, 80), (150, 10), (2, 150)]
+    paths = finder.find_paths(start, goals)
+    for goal in goals:
+        assert paths[goal][0] == start and paths[goal][-1] == goal
+        assert path_cost(finder, paths[goal]) == pytest.approx(path_cost(astar, astar.find_path(start, goal)))
+
+    distances, predecessors, _ = finder.shortest_path_tree(start, finder.last_window)
+    assert distances.shape == predecessors.shape
+    row_start, _, col_start, _ = finder.last_window
+    assert distances[start[0] - row_start, start[1] - col_start] == 0.0
+
+    # the window never grows past the cell cap
+    small = CsgraphPathFinder(True, elevation_map, max_cells=5000)
+    path = small.find_path((10, 10), (60, 60))
+    assert path[0] == (10, 10) and path[-1] == (60, 60)
+    row_start, row_stop, col_start, col_stop = small.last_window
+    assert (row_stop - row_start) * (col_stop - col_start) <= 5000
+
+    # so does the ArrayEngine fallback of queries too large for a graph
+    small = CsgraphPathFinder(True, elevation_map, max_cells=500, max_array_cells=5000)
+    path = small.find_path((10, 10), (60, 60))
+    assert path[0] == (10, 10) and path[-1] == (60, 60)
+    assert small._window_cells(small.last_engine.window) <= 5000
+    assert small.find_path((10, 10), (150, 150)) is None  # past both caps
+
+    # goals too spread out for one graph are searched one at a time
+    small = CsgraphPathFinder(True, elevation_map, max_cells=5000)
+    goals = [(20, 20), (70, 70), (70, 20)]
+    paths = small.find_paths((45, 45), goals)
+    for goal in goals:
+        assert path_cost(small, paths[goal]) == pytest.approx(path_cost(astar, astar.find_path((45, 45), goal)))
+    assert finder.find_paths(start, []) == {}
+
+
+def test_csgraph_finder_skips_unreachable_goals():
+    elevation_map = random_map(2, shape=(200, 200), roughness=20)
+    elevation_map[180:186, 180:186] += 500.0  # a plateau no move leads onto
+    finder = CsgraphPathFinder(True, elevation_map)
+    finder.use_reachability()
+    paths = finder.find_paths((5, 5), [(182, 182), (20, 30)])
+    assert paths[(182, 182)] is None and paths[(20, 30)] is not None
+    row_start, row_stop, col_start, col_stop = finder.last_window
+    assert row_stop <= 182 and col_stop <= 182  # the window only had to hold the reachable goal
+
+
+def test_bucket_queue_orders_by_quantized_priority():
+    queue = BucketQueue(resolution=0.5, buckets=4)
+    for priority, item in [(0.1, "a"), (3.2, "c"), (40.0, "d"), (1.0, "b"), (float("inf"), "never")]:
+        queue.push(priority, item)
+    assert len(queue) == 4
+    assert [queue.pop() for _ in range(4)] == ["a", "b", "c", "d"]
+    assert len(queue.buckets) >= 128  # grew to hold key 80 next to key 0
+
+    buckets = queue.buckets
+    queue.clear()
+    assert queue.buckets is buckets and len(queue) == 0
+
+
+@pytest.mark.parametrize("resolution", [0.5, 2.0, 10.0])
+def test_bucket_queue_loses_at_most_one_resolution_step(resolution):
+    for seed in range(4):
+        rng = np.random.default_rng(seed)
+        elevation_map = random_map(seed, shape=(50, 50), roughness=120)
+        astar = AStar(True, elevation_map, engine="array")
+        bucketed = AStar(True, elevation_map, engine="array")
+        bucketed.use_bucket_queue(resolution)
+        for _ in range(3):
+            start = (int(rng.integers(1, 50)), int(rng.integers(0, 50)))
+            goal = (int(rng.integers(1, 50)), int(rng.integers(0, 50)))
+            path = astar.find_path(start, goal)
+            if path is None:
+                continue
+            optimal = path_cost(astar, path)
+            assert optimal - 1e-6 <= path_cost(bucketed, bucketed.find_path(start, goal)) <= optimal + resolution
+
+
+def test_bucket_queue_with_landmarks_handles_unreachable_start():
+    elevation_map = random_map(1, shape=(60, 60), roughness=20)
+    elevation_map[20:26, 20:26] += 500.0  # a plateau no move leads off
+    astar = AStar(True, elevation_map, engine="array")
+    astar.use_landmarks(count=4)
+    astar.use_bucket_queue()
+    start, goal = (22, 22), (5, 5)
+    assert astar.landmarks.lower_bound(start, goal) == float("inf")
+    assert astar.find_path(start, goal) is None
+
+
+def test_compact_path_behaves_like_cell_list():
+    rng = np.random.default_rng(0)
+    cells = [(500, 500)]
+    for code in rng.integers(0, 8, size=1000):
+        d_row, d_col = Sensor.NEIGHBOR_OFFSETS[code]
+        cells.append((cells[-1][0] + d_row, cells[-1][1] + d_col))
+    path = Path.from_cells(cells)
+
+    assert len(path) == len(cells) and path == cells and list(path) == cells
+    assert path.nbytes < 1000  # 3 bits per step plus a checkpoint every 64 steps
+    for index in [0, 1, 63, 64, 65, 640, 999, 1000, -1, -64, -1001]:
+        assert path[index] == cells[index]
+    assert path[100:300] == cells[100:300] and isinstance(path[100:300], Path)
+    assert path[::7] == cells[::7]
+    assert list(path.reverse()) == cells[::-1]
+    with pytest.raises(ValueError):
+        Path.from_cells([(0, 0), (0, 2)])
+
+
+def test_sensor_expand_matches_get_cost():
+    elevation_map = random_map(5, shape=(30, 30))
+    elevation_map[np.random.default_rng(5).random((30, 30)) < 0.05] = 0.0  # missing values
+    elevation_map[10, 10] = 30000.0  # clamped to MAX_ELEVATION
+    sensor = Sensor(elevation_map, None)
+    rows, cols = np.meshgrid(np.arange(-1, 31), np.arange(-1, 31), indexing="ij")
+    neighbor_rows, neighbor_cols, costs = sensor.expand_cells(rows.ravel(), cols.ravel())
+
+    for i, (row, col) in enumerate(zip(rows.ravel().tolist(), cols.ravel().tolist())):
+        expected = {
+            neighbor: sensor.get_cost(col, row, neighbor[1], neighbor[0])
+            for neighbor in sensor.get_neighbors(col, row)
+        }
+        expected = {neighbor: cost for neighbor, cost in expected.items() if cost < float("inf")}
+        moves = dict(sensor.expand(row, col))
+        assert moves.keys() == expected.keys()
+        for neighbor, cost in expected.items():
+            assert moves[neighbor] == pytest.approx(cost)
+        batched = {
+            (r, c): cost
+            for r, c, cost in zip(neighbor_rows[i].tolist(), neighbor_cols[i].tolist(), costs[i].tolist())
+            if cost < float("inf")
+        }
+        assert batched == pytest.approx(moves)
+
+
+@pytest.mark.parametrize("engine", ["dict", "array"])
+def test_pathfinders_return_compact_paths(engine):
+    elevation_map = random_map(3)
+    path = AStar(True, elevation_map, engine=engine).find_path((1, 1), (38, 38))
+    assert isinstance(path, Path)
+    assert path[0] == (1, 1) and path[-1] == (38, 38)
+    assert BidirectionalAStar(True, elevation_map).find_path((1, 1), (38, 38)) == path